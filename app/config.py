@@ -16,6 +16,15 @@ class Settings:
     SQL_PASSWORD: str = os.getenv("SQL_PASSWORD", "")
     SQL_HOST: str = os.getenv("SQL_HOST", "localhost")
     ALLOW_ORIGINS: list[str] = os.getenv("ALLOW_ORIGINS", "").split(',')
+    # 在数据库里拼好歌曲详情 JSON 的接口，逗号分隔，可选 songs,artist_songs,song_by_artist,song,search。见 app/crud/song_json.py
+    SONG_JSON_ENDPOINTS: list[str] = os.getenv("SONG_JSON_ENDPOINTS", "").split(',')
+    # 直接用 asyncpg 查询、orjson 编码的接口，逗号分隔，可选 ranking,song,video,snapshot。见 app/crud/fast.py
+    FAST_PATH_ENDPOINTS: list[str] = os.getenv("FAST_PATH_ENDPOINTS", "").split(',')
+    # 请求用的连接池，见 app/session.py
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    # execute_concurrently 额外占用的连接数上限（整个进程），0 表示全部按顺序执行
+    CONCURRENT_QUERY_CONNECTIONS: int = int(os.getenv("CONCURRENT_QUERY_CONNECTIONS", "4"))
 
 settings = Settings()
 
@@ -0,0 +1,601 @@
+"""
+基于 COPY 的批量导入。
+
+整个文件先通过 asyncpg 的二进制 COPY 写入临时暂存表，再用集合式 SQL 一次性合并到正式表。
+暂存表都是 ON COMMIT DROP 的临时表，事务结束后自动删除。
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, delete
+
+from app.models import Snapshot, Video, BOARD_CODES, PART_CODES
+from app.session import get_driver_connection
+from app.utils.misc import make_duration_int
+from app.crud.update import update_video_streaks, update_video_aggregates, update_ranking_links
+from app.crud.partition import ensure_snapshot_partitions
+from app.crud.display import refresh_ranking_display, issue_songs_filter
+
+from ..utils import validate_excel, iter_excel, ensure_columns, normalize_nullable_int_columns, dataframe_to_records
+from ..utils.filename import generate_board_file_path
+from ..utils.cache import Cache, REL_TABLES
+from ..utils.bilibili_id import bvid_series_to_aid
+from ..stores.ranking_cache import ranking_cache
+
+import pandas as pd
+from datetime import datetime
+import time
+
+COPY_BATCH_SIZE = 5000
+
+async def copy_to_staging(
+    session: AsyncSession,
+    table_name: str,
+    df: pd.DataFrame,
+    columns: list[str]
+) -> int:
+    """
+    把 DataFrame 的指定列 COPY 到暂存表，返回写入的行数。
+    """
+    records = dataframe_to_records(df, columns)
+    if records:
+        driver_conn = await get_driver_connection(session)
+        await driver_conn.copy_records_to_table(table_name, records=records, columns=columns)
+    return len(records)
+
+
+def prepare_video_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    把视频相关字段整理成可以直接 COPY 的形式。
+    """
+    normalize_nullable_int_columns(df, ['page', 'copyright'])
+    df['aid'] = bvid_series_to_aid(df['bvid'])
+    df['duration'] = df['duration'].map(lambda x: None if pd.isna(x) else make_duration_int(x)).astype("Int32")
+    if 'image_url' in df.columns:
+        df['thumbnail'] = df['image_url']
+    else:
+        df['thumbnail'] = None
+    return df
+
+
+SNAPSHOT_STAGING_COLUMNS = [
+    'bvid', 'aid', 'title', 'pubdate', 'name', 'uploader', 'duration', 'page', 'copyright', 'thumbnail',
+    'view', 'favorite', 'coin', 'like'
+]
+
+CREATE_SNAPSHOT_STAGING = text("""
+    CREATE TEMP TABLE snapshot_staging (
+        bvid varchar(12),
+        aid bigint,
+        title text,
+        pubdate timestamp,
+        name text,
+        uploader text,
+        duration integer,
+        page smallint,
+        copyright smallint,
+        thumbnail text,
+        view integer,
+        favorite integer,
+        coin integer,
+        "like" integer
+    ) ON COMMIT DROP
+""")
+
+# 和 insert_videos(update=False) 一致：歌曲不存在就不插入，已有视频不更新
+MERGE_SNAPSHOT_VIDEOS = text("""
+    INSERT INTO video (bvid, aid, title, pubdate, duration, page, song_id, uploader_id, copyright, thumbnail)
+    SELECT DISTINCT ON (s.bvid)
+        s.bvid, s.aid, s.title, s.pubdate, s.duration, s.page, song.id, uploader.id, s.copyright, s.thumbnail
+    FROM snapshot_staging s
+    JOIN song ON song.name = s.name
+    LEFT JOIN uploader ON uploader.name = s.uploader
+    ORDER BY s.bvid
+    ON CONFLICT (bvid) DO NOTHING
+""")
+
+MERGE_SNAPSHOTS = text("""
+    INSERT INTO snapshot (aid, date, view, favorite, coin, "like")
+    SELECT DISTINCT ON (s.aid)
+        s.aid, :date, s.view, s.favorite, s.coin, s."like"
+    FROM snapshot_staging s
+    JOIN video ON video.aid = s.aid
+    ORDER BY s.aid
+    ON CONFLICT (aid, date) DO UPDATE SET
+        view = EXCLUDED.view,
+        favorite = EXCLUDED.favorite,
+        coin = EXCLUDED.coin,
+        "like" = EXCLUDED."like"
+""")
+
+
+async def execute_bulk_import_snapshots(
+    session: AsyncSession,
+    date: str,
+    strict: bool
+):
+    """
+    批量模式导入数据记录。
+
+    和 execute_import_snapshots 的结果一致，但文件边解析边 COPY 进暂存表，再用两条合并语句写入，整个过程在一个事务中完成。
+    """
+    started = time.perf_counter()
+    date_ = datetime.strptime(date, "%Y-%m-%d")
+    filepath = f'./data/数据/{date_.strftime("%Y%m%d")}.xlsx'
+
+    try:
+        await ensure_snapshot_partitions(session, date_)
+        await session.execute(delete(Snapshot).where(Snapshot.date == date_))
+        await session.execute(CREATE_SNAPSHOT_STAGING)
+
+        total = 0
+        warnings = 0
+        for df in iter_excel(filepath, COPY_BATCH_SIZE):
+            if strict:
+                # 和 execute_import_snapshots 一样，数据文件的校验结果不拦截导入（校验会把空标题填成空字符串）
+                warnings += len(validate_excel(df))
+            df = prepare_video_columns(df)
+            total += await copy_to_staging(session, 'snapshot_staging', df, SNAPSHOT_STAGING_COLUMNS)
+        if warnings:
+            print(f"{date} 数据文件有 {warnings} 处空白字段，已照常导入")
+
+        await session.execute(MERGE_SNAPSHOT_VIDEOS)
+        result = await session.execute(MERGE_SNAPSHOTS, {'date': date_.date()})
+        inserted = result.rowcount
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        print("插入数据出错:", e)
+        raise e
+
+    elapsed = time.perf_counter() - started
+    print(f"{date} 批量导入 {total} 行，用时 {elapsed:.2f} 秒，{total / elapsed:.0f} 行/秒")
+
+    # ------------ 更新视频汇总字段和 streak ------------
+    await update_video_aggregates(session, date_)
+    await update_video_streaks(session, date_)
+
+    return {
+        'rows': total,
+        'snapshots': inserted,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(total / elapsed),
+    }
+
+
+# =================  排名文件  ====================
+
+RANKING_STAGING_COLUMNS = [
+    'row_no', 'rank', 'bvid', 'aid', 'name', 'type', 'author', 'synthesizer', 'vocal', 'uploader',
+    'title', 'pubdate', 'duration', 'page', 'copyright', 'thumbnail',
+    'count', 'point', 'view', 'favorite', 'coin', 'like',
+    'view_rank', 'favorite_rank', 'coin_rank', 'like_rank'
+]
+
+CREATE_RANKING_STAGING = text("""
+    CREATE TEMP TABLE ranking_staging (
+        row_no integer,
+        rank integer,
+        bvid varchar(12),
+        aid bigint,
+        name text,
+        type text,
+        author text,
+        synthesizer text,
+        vocal text,
+        uploader text,
+        title text,
+        pubdate timestamp,
+        duration integer,
+        page smallint,
+        copyright smallint,
+        thumbnail text,
+        count smallint,
+        point integer,
+        view integer,
+        favorite integer,
+        coin integer,
+        "like" integer,
+        view_rank integer,
+        favorite_rank integer,
+        coin_rank integer,
+        like_rank integer
+    ) ON COMMIT DROP
+""")
+
+# 同名歌曲以文件中最后一行为准。只有真正变化的行才会被写入，RETURNING 用来区分新增和修改
+MERGE_RANKING_SONGS = text("""
+    INSERT INTO song (name, type)
+    SELECT DISTINCT ON (name) name, type
+    FROM ranking_staging
+    WHERE name IS NOT NULL
+    ORDER BY name, row_no DESC
+    ON CONFLICT (name) DO UPDATE SET type = EXCLUDED.type
+    WHERE song.type IS DISTINCT FROM EXCLUDED.type
+    RETURNING (xmax = 0) AS inserted
+""")
+
+# (artist 表, 关系表, 暂存表字段)
+RANKING_ARTIST_FIELDS = (
+    ('producer', 'song_producer', 'author'),
+    ('synthesizer', 'song_synthesizer', 'synthesizer'),
+    ('vocalist', 'song_vocalist', 'vocal'),
+)
+
+
+def merge_ranking_artists_sql(table: str, field: str):
+    return text(f"""
+        INSERT INTO {table} (name)
+        SELECT DISTINCT a.name
+        FROM ranking_staging s
+        CROSS JOIN LATERAL unnest(string_to_array(s.{field}, '、')) AS a(name)
+        WHERE s.{field} IS NOT NULL
+        ON CONFLICT (name) DO NOTHING
+    """)
+
+
+MERGE_RANKING_UPLOADERS = text("""
+    INSERT INTO uploader (name)
+    SELECT DISTINCT uploader
+    FROM ranking_staging
+    WHERE uploader IS NOT NULL
+    ON CONFLICT (name) DO NOTHING
+""")
+
+
+def ranking_relations_sql(table: str, field: str) -> str:
+    """
+    文件中每首歌应有的 (song_id, artist_id)
+    """
+    return f"""
+        SELECT DISTINCT song.id AS song_id, artist.id AS artist_id
+        FROM ranking_staging s
+        JOIN song ON song.name = s.name
+        CROSS JOIN LATERAL unnest(string_to_array(s.{field}, '、')) AS a(name)
+        JOIN {table} artist ON artist.name = a.name
+        WHERE s.{field} IS NOT NULL
+    """
+
+
+def replace_ranking_relations_sql(table: str, rel_table: str, field: str):
+    """
+    和 update_relations 一致：文件中出现的歌曲，关系整体替换为文件中的关系
+    """
+    relations = ranking_relations_sql(table, field)
+    return (
+        text(f"""
+            DELETE FROM {rel_table} r
+            USING (SELECT DISTINCT song_id FROM ({relations}) x) rel
+            WHERE r.song_id = rel.song_id
+        """),
+        text(f"""
+            INSERT INTO {rel_table} (song_id, artist_id)
+            {relations}
+            ON CONFLICT DO NOTHING
+        """),
+    )
+
+
+def merge_ranking_videos_sql(update: bool, has_thumbnail: bool):
+    """
+    和 insert_videos 一致：歌曲不存在就不插入。
+    update 时已有视频的信息和所属歌曲都以文件为准（相当于 resolve_changed_names + insert_videos）。
+    文件中没有 image_url 时不更新缩略图。
+    """
+    update_cols = ['title', 'pubdate', 'uploader_id', 'duration', 'page', 'copyright', 'song_id']
+    if has_thumbnail:
+        update_cols.append('thumbnail')
+    if update:
+        on_conflict = (
+            "DO UPDATE SET " + ", ".join(f"{col} = EXCLUDED.{col}" for col in update_cols)
+            + f" WHERE ({', '.join(f'video.{col}' for col in update_cols)})"
+            + f" IS DISTINCT FROM ({', '.join(f'EXCLUDED.{col}' for col in update_cols)})"
+        )
+    else:
+        on_conflict = "DO NOTHING"
+    return text(f"""
+        INSERT INTO video (bvid, aid, title, pubdate, duration, page, song_id, uploader_id, copyright, thumbnail)
+        SELECT DISTINCT ON (s.bvid)
+            s.bvid, s.aid, s.title, s.pubdate, s.duration, s.page, song.id, uploader.id, s.copyright, s.thumbnail
+        FROM ranking_staging s
+        JOIN song ON song.name = s.name
+        LEFT JOIN uploader ON uploader.name = s.uploader
+        ORDER BY s.bvid, s.row_no DESC
+        ON CONFLICT (bvid) {on_conflict}
+        RETURNING (xmax = 0) AS inserted
+    """)
+
+
+def ranking_issue_params(board: str, part: str, issue: int) -> dict:
+    """
+    文本 SQL 不经过 CodeEnum 转换，board 和 part 直接传编号
+    """
+    if board not in BOARD_CODES or part not in PART_CODES:
+        raise ValueError(f'无效的榜单：{board} {part}')
+    return {'board': BOARD_CODES[board], 'part': PART_CODES[part], 'issue': issue}
+
+
+DELETE_RANKINGS = text("""
+    DELETE FROM ranking
+    WHERE board = :board AND part = :part AND issue = :issue
+""")
+
+
+# 这一期的歌曲。更新过歌曲信息时，其他期里包含这些歌曲的排名缓存也要失效
+RANKING_SONG_IDS = text("""
+    SELECT DISTINCT song_id FROM ranking
+    WHERE board = :board AND part = :part AND issue = :issue
+""")
+
+
+def insert_rankings_sql(with_count: bool):
+    """
+    新曲榜等不更新歌曲信息的榜单不写入 count。
+    ranking 没有唯一约束，重复的视频按 desired_rankings_sql 去重，和差异模式的结果相同
+    """
+    return text(f"""
+        INSERT INTO ranking (
+            board, part, issue, rank, aid, count, point, view, favorite, coin, "like",
+            view_rank, favorite_rank, coin_rank, like_rank, song_id
+        )
+        SELECT
+            :board, :part, :issue, d.rank, d.aid, d.count, d.point, d.view, d.favorite, d.coin, d."like",
+            d.view_rank, d.favorite_rank, d.coin_rank, d.like_rank, d.song_id
+        FROM ({desired_rankings_sql(with_count)}) d
+    """)
+
+
+# =================  差异导入  ====================
+
+def diff_ranking_relations_sql(table: str, rel_table: str, field: str):
+    """
+    只删除文件中已经没有的关系，只插入原来没有的关系
+    """
+    relations = ranking_relations_sql(table, field)
+    return (
+        text(f"""
+            WITH desired AS ({relations})
+            DELETE FROM {rel_table} r
+            WHERE r.song_id IN (SELECT song_id FROM desired)
+              AND NOT EXISTS (
+                SELECT 1 FROM desired d
+                WHERE d.song_id = r.song_id AND d.artist_id = r.artist_id
+              )
+        """),
+        text(f"""
+            WITH desired AS ({relations})
+            INSERT INTO {rel_table} (song_id, artist_id)
+            SELECT d.song_id, d.artist_id
+            FROM desired d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {rel_table} r
+                WHERE r.song_id = d.song_id AND r.artist_id = d.artist_id
+            )
+        """),
+    )
+
+
+RANKING_VALUE_COLUMNS = [
+    'rank', 'count', 'point', 'view', 'favorite', 'coin', 'like',
+    'view_rank', 'favorite_rank', 'coin_rank', 'like_rank', 'song_id'
+]
+
+
+def desired_rankings_sql(with_count: bool) -> str:
+    """
+    这一期应有的排名，以 aid 为键（同一期里重复的视频以最后一行为准）
+    """
+    return f"""
+        SELECT DISTINCT ON (s.aid)
+            s.aid, s.rank, {'s.count' if with_count else 'NULL::smallint'} AS count, s.point, s.view, s.favorite, s.coin, s."like",
+            s.view_rank, s.favorite_rank, s.coin_rank, s.like_rank, video.song_id
+        FROM ranking_staging s
+        JOIN video ON video.aid = s.aid
+        ORDER BY s.aid, s.row_no DESC
+    """
+
+
+def diff_rankings_sql(with_count: bool):
+    """
+    返回 (删除, 修改, 新增) 三条语句，参数为 board, part, issue
+    """
+    desired = desired_rankings_sql(with_count)
+    issue_filter = "r.board = :board AND r.part = :part AND r.issue = :issue"
+    quoted = [f'"{col}"' for col in RANKING_VALUE_COLUMNS]
+    return (
+        text(f"""
+            WITH desired AS ({desired})
+            DELETE FROM ranking r
+            WHERE {issue_filter}
+              AND NOT EXISTS (SELECT 1 FROM desired d WHERE d.aid = r.aid)
+        """),
+        text(f"""
+            WITH desired AS ({desired})
+            UPDATE ranking r
+            SET {', '.join(f'{col} = d.{col}' for col in quoted)}
+            FROM desired d
+            WHERE {issue_filter}
+              AND r.aid = d.aid
+              AND ({', '.join(f'r.{col}' for col in quoted)}) IS DISTINCT FROM ({', '.join(f'd.{col}' for col in quoted)})
+        """),
+        text(f"""
+            WITH desired AS ({desired})
+            INSERT INTO ranking (board, part, issue, aid, {', '.join(quoted)})
+            SELECT CAST(:board AS smallint), CAST(:part AS smallint), CAST(:issue AS smallint), d.aid, {', '.join(f'd.{col}' for col in quoted)}
+            FROM desired d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM ranking r
+                WHERE {issue_filter} AND r.aid = d.aid
+            )
+        """),
+    )
+
+
+def count_upserted(rows) -> tuple[int, int]:
+    """
+    统计 RETURNING (xmax = 0) 的结果，返回 (新增, 修改)
+    """
+    inserted = updated = 0
+    for (is_insert,) in rows:
+        if is_insert:
+            inserted += 1
+        else:
+            updated += 1
+    return inserted, updated
+
+
+async def stage_ranking_file(
+    session: AsyncSession,
+    filepath: str,
+    strict: bool
+) -> tuple[int, bool]:
+    """
+    创建暂存表并把排名文件 COPY 进去。返回行数和文件中是否有 image_url。
+    严格模式下验证不通过会抛出异常。
+    """
+    await session.execute(CREATE_RANKING_STAGING)
+
+    total = 0
+    has_thumbnail = False
+    errors: list[str] = []
+    for df in iter_excel(filepath, COPY_BATCH_SIZE):
+        if strict:
+            errors.extend(validate_excel(df))
+        if errors:
+            continue
+        has_thumbnail = has_thumbnail or 'image_url' in df.columns
+        df = prepare_video_columns(df)
+        ensure_columns(df, RANKING_STAGING_COLUMNS)
+        normalize_nullable_int_columns(df, ['count'])
+        df['row_no'] = df.index
+        total += await copy_to_staging(session, 'ranking_staging', df, RANKING_STAGING_COLUMNS)
+    if errors:
+        raise Exception("\n".join(errors))
+    return total, has_thumbnail
+
+
+async def execute_staged_import_rankings(
+    session: AsyncSession,
+    board: str,
+    part: str,
+    issue: int,
+    strict: bool,
+    cache: Cache | None = None
+):
+    """
+    暂存表模式导入排名。
+
+    和 execute_import_rankings 的结果一致，但整个文件先 COPY 进暂存表，
+    歌曲、artist、关系、视频、排名各用固定的几条集合式语句合并，全部在一个事务中完成，要么全部生效要么全部回滚。
+    不读取 cache。新增的歌曲、artist 由下次导入开始时的 sync 按行数发现；
+    视频改挂歌曲、关系整体重写行数不一定变化，提交后用 mark_changed 让 cache 里对应的部分作废。
+    """
+    started = time.perf_counter()
+    update_songs = part != 'new' and board in ['vocaloid-daily', 'vocaloid-weekly']
+    params = ranking_issue_params(board, part, issue)
+
+    try:
+        total, has_thumbnail = await stage_ranking_file(session, generate_board_file_path(board, part, issue), strict)
+        yield f"event: progress\ndata: 数据已载入暂存表，共 {total} 行\n\n"
+
+        if update_songs:
+            await session.execute(MERGE_RANKING_SONGS)
+            for table, _, field in RANKING_ARTIST_FIELDS:
+                await session.execute(merge_ranking_artists_sql(table, field))
+            await session.execute(MERGE_RANKING_UPLOADERS)
+            yield "event: progress\ndata: 歌曲与artist已合并\n\n"
+
+            for table, rel_table, field in RANKING_ARTIST_FIELDS:
+                for stmt in replace_ranking_relations_sql(table, rel_table, field):
+                    await session.execute(stmt)
+            yield "event: progress\ndata: 关系已更新\n\n"
+
+        await session.execute(merge_ranking_videos_sql(update_songs, has_thumbnail))
+        yield "event: progress\ndata: 视频已合并\n\n"
+
+        await session.execute(DELETE_RANKINGS, params)
+        await session.execute(insert_rankings_sql(update_songs), params)
+        await update_ranking_links(session, board, part, issue)
+        song_ids = set()
+        if update_songs:
+            await refresh_ranking_display(session, issue_songs_filter(board, part, issue))
+            song_ids = set((await session.execute(RANKING_SONG_IDS, params)).scalars())
+        await session.commit()
+        if update_songs and cache:
+            cache.mark_changed(Video, *REL_TABLES.values())
+        ranking_cache.invalidate_issue(board, part, issue, song_ids)
+    except Exception as e:
+        await session.rollback()
+        print("插入数据出错:", e)
+        raise e
+
+    elapsed = time.perf_counter() - started
+    print(f"{board} {part} {issue} 暂存表导入 {total} 行，用时 {elapsed:.2f} 秒")
+    yield "event: complete\ndata: 完成\n\n"
+
+
+async def execute_delta_import_rankings(
+    session: AsyncSession,
+    board: str,
+    part: str,
+    issue: int,
+    strict: bool,
+    cache: Cache | None = None
+):
+    """
+    差异模式导入排名。
+
+    和暂存表模式一样先把文件 COPY 进暂存表，但不整体删除重插，
+    而是和已有的排名、视频、歌曲、关系逐项比较，只执行需要的新增、修改和删除。
+    修正文件后重新导入时，只有改动的那几行会被写入。每一步的差异通过 SSE 推送。
+    和暂存表模式一样不读取 cache，提交后用 mark_changed 让改写过的部分作废。
+    """
+    started = time.perf_counter()
+    update_songs = part != 'new' and board in ['vocaloid-daily', 'vocaloid-weekly']
+    params = ranking_issue_params(board, part, issue)
+
+    try:
+        total, has_thumbnail = await stage_ranking_file(session, generate_board_file_path(board, part, issue), strict)
+        yield f"event: progress\ndata: 数据已载入暂存表，共 {total} 行\n\n"
+
+        if update_songs:
+            inserted, updated = count_upserted(await session.execute(MERGE_RANKING_SONGS))
+            yield f"event: progress\ndata: 歌曲：新增 {inserted}，修改 {updated}\n\n"
+
+            for table, _, field in RANKING_ARTIST_FIELDS:
+                result = await session.execute(merge_ranking_artists_sql(table, field))
+                yield f"event: progress\ndata: {table}：新增 {result.rowcount}\n\n"
+            result = await session.execute(MERGE_RANKING_UPLOADERS)
+            yield f"event: progress\ndata: uploader：新增 {result.rowcount}\n\n"
+
+            for table, rel_table, field in RANKING_ARTIST_FIELDS:
+                delete_stmt, insert_stmt = diff_ranking_relations_sql(table, rel_table, field)
+                deleted = (await session.execute(delete_stmt)).rowcount
+                inserted = (await session.execute(insert_stmt)).rowcount
+                yield f"event: progress\ndata: {rel_table}：新增 {inserted}，删除 {deleted}\n\n"
+
+        inserted, updated = count_upserted(await session.execute(merge_ranking_videos_sql(update_songs, has_thumbnail)))
+        yield f"event: progress\ndata: 视频：新增 {inserted}，修改 {updated}\n\n"
+
+        delete_stmt, update_stmt, insert_stmt = diff_rankings_sql(update_songs)
+        deleted = (await session.execute(delete_stmt, params)).rowcount
+        updated = (await session.execute(update_stmt, params)).rowcount
+        inserted = (await session.execute(insert_stmt, params)).rowcount
+        yield f"event: progress\ndata: 排名：新增 {inserted}，修改 {updated}，删除 {deleted}\n\n"
+
+        await update_ranking_links(session, board, part, issue)
+        song_ids = set()
+        if update_songs:
+            await refresh_ranking_display(session, issue_songs_filter(board, part, issue))
+            song_ids = set((await session.execute(RANKING_SONG_IDS, params)).scalars())
+        await session.commit()
+        if update_songs and cache:
+            cache.mark_changed(Video, *REL_TABLES.values())
+        ranking_cache.invalidate_issue(board, part, issue, song_ids)
+    except Exception as e:
+        await session.rollback()
+        print("插入数据出错:", e)
+        raise e
+
+    elapsed = time.perf_counter() - started
+    print(f"{board} {part} {issue} 差异导入 {total} 行，用时 {elapsed:.2f} 秒")
+    yield "event: complete\ndata: 完成\n\n"
@@ -0,0 +1,150 @@
+"""
+ranking_display 读模型的维护。
+
+ranking_display 每行对应一条 ranking，把歌曲、artist、视频信息和上一期排名展开存好，
+排名页面只需要一条查询。数据来源变化时都要刷新对应的行：
+- 导入某一期排名：这一期和 update_ranking_links 刷新过的各期（见 app/crud/update.py）
+- 导入时更新了歌曲、视频信息：所有期里这些歌曲、视频的行
+- 编辑歌曲、视频、artist：涉及的行
+写入时只更新内容有变化的行。
+"""
+
+from sqlalchemy import select, delete, func, exists, tuple_, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by
+import time
+
+from app.models import (
+    Ranking, RankingDisplay, Song, Video, Uploader, Producer, Synthesizer, Vocalist,
+    song_producer, song_synthesizer, song_vocalist, REL_MAP
+)
+
+RANKING_COLUMNS = [
+    'id', 'board', 'part', 'issue', 'rank', 'song_id', 'aid', 'count', 'point', 'view', 'favorite', 'coin', 'like',
+    'view_rank', 'favorite_rank', 'coin_rank', 'like_rank', 'seperates'
+]
+
+
+def artist_names(table, rel):
+    """
+    歌曲的某类 artist 名称，按名称排序
+    """
+    return (
+        select(func.array_agg(aggregate_order_by(table.name, table.name)))
+        .select_from(rel.join(table, table.id == rel.c.artist_id))
+        .where(rel.c.song_id == Ranking.song_id)
+        .scalar_subquery()
+    )
+
+
+def display_select(*where):
+    """
+    由 ranking 和关联表算出 ranking_display 的行，列的顺序和 display_columns() 一致
+    """
+    last = aliased(Ranking)
+    return (
+        select(
+            *[getattr(Ranking, col) for col in RANKING_COLUMNS],
+            last.rank,
+            Song.name,
+            Song.display_name,
+            Song.type,
+            artist_names(Vocalist, song_vocalist),
+            artist_names(Producer, song_producer),
+            artist_names(Synthesizer, song_synthesizer),
+            Video.bvid,
+            Video.title,
+            Video.thumbnail,
+            Video.pubdate,
+            Uploader.name,
+        )
+        .join(Song, Song.id == Ranking.song_id)
+        .join(Video, Video.aid == Ranking.aid)
+        .outerjoin(Uploader, Uploader.id == Video.uploader_id)
+        .outerjoin(last, last.id == Ranking.last_id)
+        .where(*where)
+    )
+
+
+def display_columns() -> list[str]:
+    return RANKING_COLUMNS + [
+        'last_rank', 'name', 'display_name', 'type', 'vocalists', 'producers', 'synthesizers',
+        'bvid', 'title', 'thumbnail', 'pubdate', 'uploader'
+    ]
+
+
+async def refresh_ranking_display(session: AsyncSession, *where) -> int:
+    """
+    重新计算满足条件（Ranking 上的条件）的排名的 ranking_display，返回写入的行数。
+    不提交，也不删除 ranking 中已经不存在的行（见 refresh_ranking_display_issue）
+    """
+    columns = display_columns()
+    stmt = insert(RankingDisplay).from_select(columns, display_select(*where))
+    values = [col for col in columns if col != 'id']
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={col: stmt.excluded[col] for col in values},
+        where=tuple_(*[RankingDisplay.__table__.c[col] for col in values])
+            .is_distinct_from(tuple_(*[stmt.excluded[col] for col in values]))
+    )
+    result = await session.execute(stmt)
+    return result.rowcount
+
+
+async def refresh_ranking_display_issue(session: AsyncSession, board: str, part: str, issue: int):
+    """
+    重新计算某一期的 ranking_display，并删除这一期已经不存在的排名。不提交
+    """
+    await session.execute(
+        delete(RankingDisplay)
+        .where(
+            RankingDisplay.board == board,
+            RankingDisplay.part == part,
+            RankingDisplay.issue == issue,
+            ~exists().where(Ranking.id == RankingDisplay.id)
+        )
+    )
+    await refresh_ranking_display(session, Ranking.board == board, Ranking.part == part, Ranking.issue == issue)
+
+
+def issue_songs_filter(board: str, part: str, issue: int):
+    """
+    和某一期排名有相同歌曲或相同视频的所有排名。导入时更新了歌曲和视频信息，这些行都要刷新
+    """
+    this = aliased(Ranking)
+    in_issue = (this.board == board, this.part == part, this.issue == issue)
+    return or_(
+        Ranking.song_id.in_(select(this.song_id).where(*in_issue)),
+        Ranking.aid.in_(select(this.aid).where(*in_issue)),
+    )
+
+
+def artist_filter(type: str, artist_id: int):
+    """
+    某个 artist 的歌曲（UP主则是视频）的所有排名。编辑 artist 之后刷新这些行
+    """
+    if type == 'uploader':
+        return Ranking.aid.in_(select(Video.aid).where(Video.uploader_id == artist_id))
+    rel = REL_MAP[type]
+    return Ranking.song_id.in_(select(rel.c.song_id).where(rel.c.artist_id == artist_id))
+
+
+async def rebuild_ranking_display(session: AsyncSession):
+    """
+    重算整个 ranking_display。第一次建表之后执行，平时导入和编辑时会增量维护。
+    """
+    started = time.perf_counter()
+    deleted = (await session.execute(
+        delete(RankingDisplay).where(~exists().where(Ranking.id == RankingDisplay.id))
+    )).rowcount
+    updated = await refresh_ranking_display(session)
+    await session.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"重算 ranking_display：写入 {updated} 行，删除 {deleted} 行，用时 {elapsed:.2f} 秒")
+    return {
+        'updated': updated,
+        'deleted': deleted,
+        'seconds': round(elapsed, 3),
+    }
@@ -5,6 +5,9 @@ from sqlalchemy import select, update, delete
 
 from app.models import TABLE_MAP, REL_MAP, Video
 from app.utils.task import task_manager
+from app.utils.cache import import_cache, import_lock
+from app.stores.ranking_cache import ranking_cache
+from app.crud.display import refresh_ranking_display, artist_filter
 from app.session import get_async_session
 
 from app.session import engine
@@ -51,7 +54,8 @@ async def merge_artist(
     name: str
 ):
     table = TABLE_MAP[type]
-    async with SessionLocal() as session:
+    # 持有导入锁，避免在导入过程中改动 import_cache 依赖的数据
+    async with import_lock, SessionLocal() as session:
         
         result = await session.execute(select(table).where(table.id == id))
         artist = result.scalars().first()
@@ -82,14 +86,17 @@ async def merge_artist(
                 delete(table)
                 .where(table.id == artist.id)
             )
+        await refresh_ranking_display(session, artist_filter(type, existing_artist.id))
         await session.commit()
+        import_cache.merge_artist(table, artist.id, existing_artist.id)
+        ranking_cache.clear()
             
 async def edit_artist(
     type: str,
     id: int,
     name: str,
 ):
-    async with SessionLocal() as session:
+    async with import_lock, SessionLocal() as session:
         table = TABLE_MAP[type]
         result = await session.execute(select(table).where(table.id == id))
         artist = result.scalars().first()
@@ -101,5 +108,8 @@ async def edit_artist(
             .where(table.id == artist.id)
             .values(name=name)
         )
+        await refresh_ranking_display(session, artist_filter(type, artist.id))
         
-        await session.commit()
\ No newline at end of file
+        await session.commit()
+        import_cache.rename_artist(table, artist.name, name)
+        ranking_cache.clear()
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+热点查询接口的快速路径。
+
+/select/ranking、/select/song、/select/video、/select/video/snapshot 原来要经过 SQLAlchemy 编译语句、
+ORM 装载对象，再由 FastAPI 的 jsonable_encoder 遍历对象。这里直接在 session 的 asyncpg 连接上执行固定的 SQL
+（asyncpg 会按连接缓存预备语句，之后只发送参数），把记录映射成字典后用 orjson 编码，响应结构和原来相同。
+
+是否启用按接口配置，见 app/config.py 的 FAST_PATH_ENDPOINTS。
+"""
+
+from functools import cache
+from datetime import date
+from typing import Literal
+
+import orjson
+from fastapi import HTTPException
+from abv_py import av2bv
+from sqlalchemy import bindparam
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Ranking, Song, Video, Snapshot, Producer, BOARD_CODES, PART_CODES
+from app.session import engine, get_driver_connection
+from app.crud.song_json import select_songs
+from app.utils.cursor import decode_cursor, next_cursor
+from app.utils.bilibili_id import bvid_to_aid
+
+BOARD_NAMES = {code: name for name, code in BOARD_CODES.items()}
+PART_NAMES = {code: name for name, code in PART_CODES.items()}
+
+# seperates 是延迟加载的列，只在分期排名时返回
+RANKING_COLUMNS = [c.name for c in Ranking.__table__.c if c.name != 'seperates']
+SONG_COLUMNS = [c.name for c in Song.__table__.c]
+VIDEO_COLUMNS = [c.name for c in Video.__table__.c]
+ARTIST_COLUMNS = [c.name for c in Producer.__table__.c]
+SNAPSHOT_COLUMNS = [c.name for c in Snapshot.__table__.c]
+
+ORDER_COLUMNS = {
+    'score': 'rank',
+    'view': 'view_rank',
+    'favorite': 'favorite_rank',
+    'coin': 'coin_rank',
+    'like': 'like_rank'
+}
+
+
+def enabled(endpoint: str) -> bool:
+    return endpoint in settings.FAST_PATH_ENDPOINTS
+
+
+def columns_sql(alias: str, columns: list[str]) -> str:
+    return ', '.join(f'{alias}."{col}"' for col in columns)
+
+
+def row_dict(record, columns: list[str], start: int) -> dict:
+    return {col: record[start + i] for i, col in enumerate(columns)}
+
+
+def artists_sql(table: str) -> str:
+    """
+    歌曲 s 的某类 artist 列表，json 文本
+    """
+    fields = ', '.join(f"'{col}', a.\"{col}\"" for col in ARTIST_COLUMNS)
+    return f"""(
+        SELECT coalesce(json_agg(json_build_object({fields}) ORDER BY a.id), '[]')::text
+        FROM song_{table} sa
+        JOIN {table} a ON a.id = sa.artist_id
+        WHERE sa.song_id = s.id
+    )"""
+
+
+# ==================  ranking  ==================
+
+LATEST_ISSUE = """
+    SELECT max(issue) FROM ranking WHERE board = $1 AND part = $2
+"""
+
+RANKING_TOTAL = """
+    SELECT count(*) FROM ranking WHERE board = $1 AND part = $2 AND issue = $3
+"""
+
+
+@cache
+def ranking_page_sql(order_type: str, seperate: bool, cursor: Literal['value', 'null'] | None) -> str:
+    """
+    一页排名，连同上一期排名、歌曲及其 artist、视频及其UP主。
+    列的顺序：ranking、（seperates）、上一期 ranking、song、三类 artist、video、uploader
+
+    cursor 是游标里排序键的情况，和 app/utils/cursor.py 的 keyset_after 一样处理排序列为空的行
+    """
+    order_col = ORDER_COLUMNS[order_type]
+    if cursor == 'value':
+        page_filter = f'AND ((r.{order_col}, r.id) > ($4, $5) OR r.{order_col} IS NULL)'
+        offset, limit = '$6', '$7'
+    elif cursor == 'null':
+        page_filter = f'AND r.{order_col} IS NULL AND r.id > $4'
+        offset, limit = '$5', '$6'
+    else:
+        page_filter = ''
+        offset, limit = '$4', '$5'
+    return f"""
+        SELECT
+            {columns_sql('r', RANKING_COLUMNS)},
+            {'r.seperates,' if seperate else ''}
+            {columns_sql('l', RANKING_COLUMNS)},
+            {columns_sql('s', SONG_COLUMNS)},
+            {artists_sql('vocalist')},
+            {artists_sql('producer')},
+            {artists_sql('synthesizer')},
+            {columns_sql('v', VIDEO_COLUMNS)},
+            {columns_sql('u', ARTIST_COLUMNS)}
+        FROM ranking r
+        JOIN song s ON s.id = r.song_id
+        LEFT JOIN ranking l ON l.id = r.last_id
+        LEFT JOIN video v ON v.aid = r.aid
+        LEFT JOIN uploader u ON u.id = v.uploader_id
+        WHERE r.board = $1 AND r.part = $2 AND r.issue = $3 {page_filter}
+        ORDER BY r.{order_col}, r.id
+        OFFSET {offset} LIMIT {limit}
+    """
+
+
+def ranking_dict(record, start: int) -> dict:
+    ranking = row_dict(record, RANKING_COLUMNS, start)
+    ranking['board'] = BOARD_NAMES[ranking['board']]
+    ranking['part'] = PART_NAMES[ranking['part']]
+    ranking['bvid'] = av2bv(ranking['aid'])
+    return ranking
+
+
+def ranking_row(record, seperate: bool) -> dict:
+    i = 0
+    ranking = ranking_dict(record, i)
+    i += len(RANKING_COLUMNS)
+    if seperate:
+        ranking['seperates'] = record[i]
+        i += 1
+
+    ranking['last'] = ranking_dict(record, i) if record[i] is not None else None
+    i += len(RANKING_COLUMNS)
+
+    song = row_dict(record, SONG_COLUMNS, i)
+    i += len(SONG_COLUMNS)
+    for key in ('vocalists', 'producers', 'synthesizers'):
+        song[key] = orjson.Fragment(record[i])
+        i += 1
+    ranking['song'] = song
+
+    video = row_dict(record, VIDEO_COLUMNS, i)
+    i += len(VIDEO_COLUMNS)
+    if video['bvid'] is not None:
+        video['uploader'] = row_dict(record, ARTIST_COLUMNS, i) if record[i] is not None else None
+        ranking['video'] = video
+    else:
+        ranking['video'] = None
+    return ranking
+
+
+async def get_ranking(
+    board: str,
+    part: str,
+    issue: int | None,
+    page: int,
+    page_size: int,
+    order_type: Literal['score','view','favorite','coin','like'],
+    seperate: bool,
+    session: AsyncSession,
+    cursor: str | None = None
+) -> tuple[bytes, set[int]]:
+    """
+    和 app/crud/select.py 的 get_ranking 相同的响应，返回编码后的字节和其中出现的歌曲（写入 ranking_cache 用）
+    """
+    conn = await get_driver_connection(session)
+    board_code, part_code = BOARD_CODES[board], PART_CODES[part]
+    if issue is None:
+        issue = int(await conn.fetchval(LATEST_ISSUE, board_code, part_code))
+
+    cursor_kind = f'ranking:{board}:{part}:{issue}:{order_type}'
+    if not cursor:
+        page_cursor, params = None, ((page - 1) * page_size, page_size)
+    else:
+        last_value, last_id = decode_cursor(cursor_kind, cursor, int | None, int)
+        if last_value is None:
+            page_cursor, params = 'null', (last_id, 0, page_size)
+        else:
+            page_cursor, params = 'value', (last_value, last_id, 0, page_size)
+    records = await conn.fetch(ranking_page_sql(order_type, seperate, page_cursor), board_code, part_code, issue, *params)
+    data = [ranking_row(record, seperate) for record in records]
+    total = await conn.fetchval(RANKING_TOTAL, board_code, part_code, issue)
+
+    order_col = ORDER_COLUMNS[order_type]
+    body = orjson.dumps({
+        'status': 'ok',
+        'data': data,
+        'total': total,
+        'next_cursor': next_cursor(cursor_kind, data, page_size, lambda r: (r[order_col], r['id']))
+    })
+    return body, {r['song_id'] for r in data}
+
+
+# ==================  song  ==================
+
+@cache
+def song_sql() -> str:
+    """
+    歌曲详情直接复用 app/crud/song_json.py 的 JSON 查询，编译一次后缓存
+    """
+    stmt = select_songs('json').where(Song.id == bindparam('id'))
+    return str(stmt.compile(dialect=engine.dialect))
+
+
+async def get_song(id: int, session: AsyncSession) -> bytes:
+    conn = await get_driver_connection(session)
+    record = await conn.fetchrow(song_sql(), id)
+    if record is None:
+        raise NoResultFound()
+    return orjson.dumps({'data': orjson.Fragment(record['json'])})
+
+
+# ==================  video  ==================
+
+VIDEO_BY_BVID = f"""
+    SELECT {columns_sql('v', VIDEO_COLUMNS)} FROM video v WHERE v.bvid = $1
+"""
+
+
+async def get_video(bvid: str, session: AsyncSession) -> bytes:
+    conn = await get_driver_connection(session)
+    record = await conn.fetchrow(VIDEO_BY_BVID, bvid)
+    if record is None:
+        raise HTTPException(status_code=404, detail="视频不存在")
+    return orjson.dumps({'data': dict(record)})
+
+
+# ==================  snapshot  ==================
+
+SNAPSHOT_PAGE = f"""
+    SELECT {columns_sql('s', SNAPSHOT_COLUMNS)} FROM snapshot s
+    WHERE s.aid = $1
+    ORDER BY s.date DESC
+    OFFSET $2 LIMIT $3
+"""
+
+SNAPSHOT_PAGE_AFTER = f"""
+    SELECT {columns_sql('s', SNAPSHOT_COLUMNS)} FROM snapshot s
+    WHERE s.aid = $1 AND s.date < $2
+    ORDER BY s.date DESC
+    LIMIT $3
+"""
+
+SNAPSHOT_TOTAL = """
+    SELECT count(*) FROM snapshot WHERE aid = $1
+"""
+
+
+async def get_song_snapshot(
+    bvid: str,
+    page: int,
+    page_size: int,
+    session: AsyncSession,
+    cursor: str | None = None
+) -> bytes:
+    conn = await get_driver_connection(session)
+    aid = bvid_to_aid(bvid)
+    if cursor:
+        last_date, = decode_cursor('snapshot', cursor, date)
+        records = await conn.fetch(SNAPSHOT_PAGE_AFTER, aid, last_date, page_size)
+    else:
+        records = await conn.fetch(SNAPSHOT_PAGE, aid, (page - 1) * page_size, page_size)
+
+    data = []
+    for record in records:
+        snapshot = dict(record)
+        snapshot['bvid'] = av2bv(snapshot['aid'])
+        data.append(snapshot)
+    total = await conn.fetchval(SNAPSHOT_TOTAL, aid)
+
+    return orjson.dumps({
+        'data': data,
+        'total': total,
+        'next_cursor': next_cursor('snapshot', data, page_size, lambda snapshot: (snapshot['date'],))
+    })
@@ -1,22 +1,28 @@
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, and_, update, delete, insert, values, column, Integer, String
-from sqlalchemy.dialects.postgresql import insert as insert
+from sqlalchemy import select, delete, and_, update, delete, insert, values, column, func, bindparam, Integer, String, Text
+from sqlalchemy.dialects.postgresql import insert as insert, ARRAY
 from sqlalchemy.exc import IntegrityError
 
 from app.models import Song, Producer, Synthesizer, Vocalist, Uploader, Video, song_producer, song_synthesizer, song_vocalist, Snapshot, Ranking
 from app.utils.misc import make_duration_int
-from app.crud.update import update_video_streaks
+from app.crud.update import update_video_streaks, update_video_aggregates, update_ranking_links
+from app.crud.partition import ensure_snapshot_partitions
+from app.crud.display import refresh_ranking_display, issue_songs_filter
 
-from ..utils import validate_excel, read_excel, ensure_columns, normalize_nullable_int_columns, normalize_nullable_str_columns
+from ..utils import validate_excel, validate_excel_file, iter_excel, count_excel_rows, ensure_columns, normalize_nullable_int_columns, normalize_nullable_str_columns
 from ..utils.filename import generate_board_file_path
-from ..utils.cache import Cache
+from ..utils.cache import Cache, extract_artist_names
+from ..utils.bilibili_id import bvid_series_to_aid
+from ..stores.ranking_cache import ranking_cache
 
 import pandas as pd
 from datetime import datetime, timedelta, date
 import math
 from collections import namedtuple
+from typing import Iterable
 import asyncio
+import time
 
 BATCH_SIZE = 100
 
@@ -29,76 +35,65 @@ async def resolve_changed_names(
 ):
     if not cache:
         cache = Cache()
-    await cache.ensure_loaded(session, ['song_map', 'video_map'])
+    await cache.ensure_loaded(session, ['song_map', 'video_map'], df)
     
 
     song_map = cache.song_map        # {name -> song_id}
     video_map = cache.video_map      # {bvid -> song_id}
 
-    new_song_names = []             # 需要新建的Song名称
-    video_updates = []              # (bvid, new_song_id)
-
-    # === 第一步：收集所有需要创建的新 name ===
-    for _, row in df.iterrows():
-        bvid = row["bvid"]
-        new_name = row["name"]
-
-        if bvid not in video_map:
-            continue
-
-        old_song_id = video_map[bvid]
-
-        # 如果新名字已经有关联，则看看是否等于 old_song_id
-        if new_name in song_map:
-            if song_map[new_name] != old_song_id:
-                # Video 的 song_id 要改到新的 song_id
-                video_updates.append((bvid, song_map[new_name]))
-            continue
-
-        # 新名字不存在 → 后续要创建一个新的 Song
-        new_song_names.append(new_name)
+    # === 第一步：找出已有视频，对照新旧 song_id ===
+    changed_df = (
+        df[['bvid', 'name', 'type']]
+        .dropna(subset=['name'])
+        .drop_duplicates(subset=['bvid'], keep='last')
+        .assign(old_song_id=lambda d: d['bvid'].map(video_map))
+    )
+    changed_df = changed_df[changed_df['old_song_id'].notna()]
+    changed_df = changed_df.assign(new_song_id=changed_df['name'].map(song_map))
 
-    # 去重
-    new_song_names = list(set(new_song_names))
+    # 新名字不存在 → 需要创建新的 Song
+    new_song_df = (
+        changed_df[changed_df['new_song_id'].isna()]
+        .drop_duplicates(subset=['name'], keep='last')
+    )
+    new_song_names = new_song_df['name'].tolist()
 
     try:
         # === 第二步：批量插入新的 Song ===
-        created_name_to_id = {}
         if new_song_names:
-            insert_data = [{"name": name} for name in new_song_names]
+            insert_data = [
+                {"name": name, "type": None if pd.isna(song_type) else song_type}
+                for name, song_type in new_song_df[['name', 'type']].itertuples(index=False)
+            ]
             stmt = insert(Song).returning(Song.id, Song.name)
             rows = (await session.execute(stmt, insert_data)).fetchall()
-
-            for sid, name in rows:
-                created_name_to_id[name] = sid
-                cache.song_map[name] = sid  # 更新缓存
-
-        # === 第三步：对所有 Video 更新 song_id ===
-        # 再执行 df 遍历一次，找出因新 Song 创建而需要更新的项
-        for _, row in df.iterrows():
-            bvid = row["bvid"]
-            new_name = row["name"]
-
-            if bvid not in video_map:
-                continue
-
-            # 如果 name 属于新创建的 Song，则更新到新 id
-            if new_name in created_name_to_id:
-                new_id = created_name_to_id[new_name]
-                video_updates.append((bvid, new_id))
-                continue
-
-        # 执行 update
-        for bvid, new_song_id in video_updates:
-            stmt = (
+            song_map.update({name: sid for sid, name in rows})  # 更新缓存
+            changed_df = changed_df.assign(new_song_id=changed_df['name'].map(song_map))
+
+        # === 第三步：所有 song_id 变化的 Video 一次性更新 ===
+        changed_df = changed_df[changed_df['new_song_id'] != changed_df['old_song_id']]
+        video_updates = [
+            (bvid, int(song_id))
+            for bvid, song_id in changed_df[['bvid', 'new_song_id']].itertuples(index=False)
+        ]
+
+        if video_updates:
+            v = (
+                values(
+                    column("bvid", String),
+                    column("song_id", Integer)
+                )
+                .data(video_updates)
+                .alias("v")
+            )
+            await session.execute(
                 update(Video)
-                .where(Video.bvid == bvid)
-                .values(song_id=new_song_id)
+                .where(Video.bvid == v.c.bvid)
+                .values(song_id=v.c.song_id)
             )
-            await session.execute(stmt)
 
             # 缓存同步更新
-            video_map[bvid] = new_song_id
+            video_map.update(video_updates)
 
         await session.commit()
 
@@ -112,6 +107,26 @@ async def resolve_changed_names(
         raise e
 
 
+async def insert_artist_names(
+    session: AsyncSession,
+    table,
+    names: Iterable[str]
+) -> dict[str, int]:
+    """
+    把名字整体作为一个数组参数插入，返回新建的 name -> id。
+    """
+    stmt = (
+        insert(table)
+        .from_select(
+            [table.name],
+            select(func.unnest(bindparam('names', list(names), type_=ARRAY(Text))))
+        )
+        .on_conflict_do_nothing()
+        .returning(table.name, table.id)
+    )
+    result = await session.execute(stmt)
+    return {name: id for name, id in result.all()}
+
 async def insert_artists(
     session: AsyncSession, 
     df,
@@ -119,43 +134,13 @@ async def insert_artists(
     ):
     if not cache:
         cache = Cache()
-    await cache.ensure_loaded(session, ['artist_maps'])
-
-    artist_map = {
-        Producer: set(),
-        Synthesizer: set(),
-        Vocalist: set(),
-        Uploader: set(),
-    }
+    await cache.ensure_loaded(session, ['artist_maps'], df)
 
-    for _, row in df.iterrows():
-        for table, col in (
-            (Producer, 'author'),
-            (Synthesizer, 'synthesizer'),
-            (Vocalist, 'vocal'),
-        ):
-            if not pd.isna(row[col]):
-                for name in row[col].split('、'):
-                    artist_map[table].add(name)
-                    
-        if not pd.isna(row['uploader']):  # 上传者
-            artist_map[Uploader].add(row['uploader'])
-
-    for table, names in artist_map.items():
-        if not names:
-            continue
+    for table, names in extract_artist_names(df).items():
         new_names = names - cache.artist_maps[table].keys()
-        if (len(new_names) > 0):
-            print(f"{table.__tablename__} 创建artist：{new_names}")
-
         if new_names:
-            # 构造要插入的数据
-            values = [{"name": name} for name in new_names]
-            stmt = insert(table).values(values).on_conflict_do_nothing().returning(table.name, table.id)
-            result = await session.execute(stmt)
-            records = result.all()
-            cache.artist_maps[table].update({r[0]: r[1] for r in records})
-
+            print(f"{table.__tablename__} 创建artist：{new_names}")
+            cache.artist_maps[table].update(await insert_artist_names(session, table, new_names))
 
     await session.flush()
 
@@ -164,7 +149,7 @@ async def insert_songs(session: AsyncSession, df, cache: Cache | None = None):
         cache = Cache()
 
     ensure_columns(df, ['image_url'])
-    await cache.ensure_loaded(session, ['song_map'])
+    await cache.ensure_loaded(session, ['song_map'], df)
 
     SongRecord = namedtuple('SongRecord', ['name', 'type'])
     UpdateSongRecord = namedtuple('UpdateSongRecord', ['id', 'type'])
@@ -249,7 +234,7 @@ async def insert_relations(
     ):
     if not cache:
         cache = Cache()
-    await cache.ensure_loaded(session, ['song_map', 'artist_maps', 'song_artist_maps'])
+    await cache.ensure_loaded(session, ['song_map', 'artist_maps', 'song_artist_maps'], df)
        
     new_song_names = list(map(lambda x: x[0], new_songs))
     new_song_df = df.loc[df['name'].isin(new_song_names)][['name', 'synthesizer', 'author', 'vocal']].copy()
@@ -299,7 +284,7 @@ async def update_relations(
     """
     if not cache:
         cache = Cache()
-    await cache.ensure_loaded(session, ['song_map', 'artist_maps'])
+    await cache.ensure_loaded(session, ['song_map', 'artist_maps'], df)
        
     song_df = df[['name', 'synthesizer', 'author', 'vocal']].copy()
     
@@ -335,6 +320,9 @@ async def update_relations(
             stmt = insert(table).values(new_rel_dicts).on_conflict_do_nothing()
             await session.execute(stmt)
 
+        # 关系整体重写过，已加载的关系缓存作废
+        cache.drop_song_artist_relations(cls)
+
 
 async def insert_videos(
     session: AsyncSession, 
@@ -355,13 +343,14 @@ async def insert_videos(
         cache = Cache()
     
     has_thumbnail = 'image_url' in df.columns
-    use_cols = ['bvid', 'title', 'pubdate', 'duration', 'page', 'song_id', 'uploader_id', 'copyright']
+    use_cols = ['bvid', 'aid', 'title', 'pubdate', 'duration', 'page', 'song_id', 'uploader_id', 'copyright']
     update_cols = ['title', 'pubdate', 'uploader_id', 'duration', 'page', 'copyright', 'thumbnail']
     
     normalize_nullable_int_columns(df, ['page', 'copyright'])
     normalize_nullable_str_columns(df, ['duration', 'title'])
-    await cache.ensure_loaded(session, ['video_map', 'song_map', 'artist_maps'])
+    await cache.ensure_loaded(session, ['video_map', 'song_map', 'artist_maps'], df)
     df = df.assign(
+        aid = lambda d: bvid_series_to_aid(d['bvid']),
         song_id = lambda d: d['name'].map(cache.song_map),
         uploader_id = lambda d: d['uploader'].map(cache.artist_maps[Uploader]),
         duration = lambda d: d['duration'].map(make_duration_int)
@@ -418,43 +407,57 @@ async def execute_import_snapshots(
     ):
     if not cache:
         cache = Cache()
+    await cache.sync(session)
+    started = time.perf_counter()
     date_ = datetime.strptime(date, "%Y-%m-%d")
-    df = read_excel(f'./data/数据/{date_.strftime("%Y%m%d")}.xlsx').assign(date=date_)
-    
-    if strict:
-        validate_excel(df)
+    filepath = f'./data/数据/{date_.strftime("%Y%m%d")}.xlsx'
         
-    # ---------- 原有记录清空 -------------
+    # ---------- 原有记录清空（只涉及当月分区） -------------
+    await ensure_snapshot_partitions(session, date_)
     delete_stmt = delete(Snapshot).where(
         Snapshot.date == date_
     )    
     await session.execute(delete_stmt)
 
     try:
-        total = len(df)
-        for start in range(0, total, BATCH_SIZE):
-            end = start + BATCH_SIZE
-            batched_df = df.iloc[start:end].copy()
+        total = 0
+        for batched_df in iter_excel(filepath, BATCH_SIZE):
+            total += len(batched_df)
+            batched_df = batched_df.assign(date=date_)
+            if strict:
+                validate_excel(batched_df)
             await insert_videos(session, batched_df, False, cache)
 
             batched_df = batched_df[batched_df['bvid'].isin(cache.video_map.keys())]
             if not batched_df.empty:
             # -------- 插入数据记录 ---------
-                snapshots = batched_df[["bvid", "date", "view", "favorite", "coin", "like"]].to_dict(orient="records")
+                batched_df = batched_df.assign(aid=bvid_series_to_aid(batched_df['bvid']))
+                snapshots = batched_df[["aid", "date", "view", "favorite", "coin", "like"]].to_dict(orient="records")
                 stmt = insert(Snapshot).values(snapshots).on_conflict_do_update(
-                    index_elements=['bvid', 'date'],
+                    index_elements=['aid', 'date'],
                     set_={field: insert(Snapshot).excluded[field] for field in ['view', 'favorite', 'coin', 'like']}
                 )
                 await session.execute(stmt)
                 await session.flush()
                 await session.commit()
         
-        # ------------ 更新 streak ------------
+        elapsed = time.perf_counter() - started
+        print(f"{date} 导入 {total} 行，用时 {elapsed:.2f} 秒，{total / elapsed:.0f} 行/秒")
+
+        # ------------ 更新视频汇总字段和 streak ------------
+        await update_video_aggregates(session, date_)
         await update_video_streaks(session, date_)
     except IntegrityError as e:
         await session.rollback()
+        cache.invalidate()
         print("插入数据出错:", e)
         raise e
+
+    return {
+        'rows': total,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(total / elapsed),
+    }
     
     
     
@@ -468,6 +471,7 @@ async def execute_import_rankings(
     ):
     if not cache:
         cache = Cache()
+    await cache.sync(session)
 
     delete_stmt = delete(Ranking).where(
         (Ranking.board == board) &
@@ -478,28 +482,26 @@ async def execute_import_rankings(
     await session.execute(delete_stmt)
 
     
-    df: pd.DataFrame = read_excel(
-        generate_board_file_path(board, part, issue),
-    ).assign( board = board, part = part, issue = issue)
+    filepath = generate_board_file_path(board, part, issue)
     
     if strict:
         # 严格模式的意义就在于这里有验证
         # 验证过后，还是按照一般那样，很多字段允许null
-        errors = validate_excel(df)
+        errors = validate_excel_file(filepath)
         if len(errors) >= 1:
             raise Exception("\n".join(errors))
         yield "event: progress\ndata: 数据验证通过\n\n"
 
+    # 歌曲和视频信息被修改过的歌曲，其他期里包含它们的排名缓存也要失效
+    updated_song_ids: set[int] = set()
     try:
         
-        total = len(df)
-        total_batches = math.ceil(total / BATCH_SIZE)
-        for i in range(total_batches):
+        total = count_excel_rows(filepath)
+        total_batches = math.ceil(total / BATCH_SIZE) if total else '?'
+        for i, batch_df in enumerate(iter_excel(filepath, BATCH_SIZE)):
             yield f"event: progress\ndata: 正在执行第 {i+1}/{total_batches} 批次...\n\n"
-            start = i * BATCH_SIZE
-            end = start + BATCH_SIZE
-            batch_df = df.iloc[start: end].copy()
-            print(f"{start} ~ {end}")
+            batch_df = batch_df.assign(board=board, part=part, issue=issue, aid=bvid_series_to_aid(batch_df['bvid']))
+            print(f"{batch_df.index[0]} ~ {batch_df.index[-1] + 1}")
             if (part != 'new' and board in ['vocaloid-daily', 'vocaloid-weekly']):
                 await resolve_changed_names(session, batch_df, cache)
                 await insert_artists(session, batch_df, cache)
@@ -511,9 +513,10 @@ async def execute_import_rankings(
                     board=board,
                     issue=issue,
                     part=part
-                )[['board', 'part', 'issue', 'rank','bvid','count','point','view','favorite','coin','like','view_rank','favorite_rank','coin_rank','like_rank']]
+                )[['board', 'part', 'issue', 'rank','aid','count','point','view','favorite','coin','like','view_rank','favorite_rank','coin_rank','like_rank']]
                 insert_df['count'] = insert_df['count'].astype("Int64")
-                insert_df['song_id'] = insert_df['bvid'].map(cache.video_map)
+                insert_df['song_id'] = batch_df['bvid'].map(cache.video_map)
+                updated_song_ids.update(int(x) for x in insert_df['song_id'].dropna())
             
             else: 
                 await insert_videos(session, batch_df, False, cache)
@@ -521,8 +524,8 @@ async def execute_import_rankings(
                     board=board,
                     issue=issue,
                     part=part
-                )[['board', 'part', 'issue', 'rank','bvid','point','view','favorite','coin','like','view_rank','favorite_rank','coin_rank','like_rank']]
-                insert_df['song_id'] = insert_df['bvid'].map(cache.video_map)
+                )[['board', 'part', 'issue', 'rank','aid','point','view','favorite','coin','like','view_rank','favorite_rank','coin_rank','like_rank']]
+                insert_df['song_id'] = batch_df['bvid'].map(cache.video_map)
 
             insert_df = insert_df.dropna(subset=['song_id'])
             insert_df = insert_df.replace({pd.NA: None})
@@ -532,10 +535,36 @@ async def execute_import_rankings(
             await session.execute(insert_stmt)
             await session.commit()
             
+        await finish_ranking_import(session, board, part, issue, updated_song_ids)
         yield "event: complete\ndata: 完成\n\n"
     
     except IntegrityError as e:
         await session.rollback()
+        cache.invalidate()
         print("插入数据出错:", e)
-    
-
+        # 之前的批次已经提交了，上一期链接和展示表仍然要和已写入的排名一致。
+        # 这一步单独处理，失败时不覆盖原来的错误
+        try:
+            await finish_ranking_import(session, board, part, issue, updated_song_ids)
+        except Exception as rebuild_error:
+            await session.rollback()
+            print("更新排名链接出错:", rebuild_error)
+        yield f"event: error\ndata: 插入数据出错：{str(e).splitlines()[0]}\n\n"
+        raise
+
+
+async def finish_ranking_import(
+    session: AsyncSession,
+    board: str,
+    part: str,
+    issue: int,
+    updated_song_ids: set[int]
+):
+    """
+    导入一期排名之后：计算上一期链接和分期排名，刷新展示表，并让相关的排名缓存失效
+    """
+    await update_ranking_links(session, board, part, issue)
+    if updated_song_ids:
+        await refresh_ranking_display(session, issue_songs_filter(board, part, issue))
+    await session.commit()
+    ranking_cache.invalidate_issue(board, part, issue, updated_song_ids)
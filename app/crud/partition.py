@@ -0,0 +1,55 @@
+"""
+snapshot 表按月分区。
+
+snapshot 按 date 做 RANGE 分区，每个月一个分区，命名为 snapshot_YYYYMM。
+分区不会自动创建，导入数据之前调用 ensure_snapshot_partitions。
+"""
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+from datetime import date, datetime
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def next_month(d: date) -> date:
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def snapshot_partition_name(d: date) -> str:
+    return f"snapshot_{d.year:04d}{d.month:02d}"
+
+
+async def ensure_snapshot_partitions(
+    session: AsyncSession | AsyncConnection,
+    start: date,
+    end: date | None = None
+) -> list[str]:
+    """
+    确保 start 到 end（默认等于 start）所在的每个月都有分区，返回新建的分区名。
+    已经存在的分区不会再执行 DDL，不会锁住父表。
+    """
+    if isinstance(start, datetime):
+        start = start.date()
+    if isinstance(end, datetime):
+        end = end.date()
+    month = month_start(start)
+    last = month_start(end or start)
+
+    created = []
+    while month <= last:
+        name = snapshot_partition_name(month)
+        exists = (await session.execute(text("SELECT to_regclass(:name)"), {'name': f'public.{name}'})).scalar()
+        if exists is None:
+            await session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS public.{name} PARTITION OF public.snapshot "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            ))
+            created.append(name)
+        month = next_month(month)
+
+    if created:
+        print(f"创建 snapshot 分区：{created}")
+    return created
@@ -1,8 +1,10 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, exists, text
+from sqlalchemy import select, exists, text, func, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import selectinload
 
 from app.models import Song, Video, Uploader, TABLE_MAP, REL_MAP, song_load_full
+from app.crud.song_json import SongLoader, select_songs, song_rows
 from app.stores.async_store import AsyncStore, SessionLocal
 from app.utils.search import accurate_search
 from app.utils import modify_text
@@ -44,7 +46,8 @@ async def normal_search(
     includeEmpty: bool,
     page: int,
     page_size: int,
-    session: AsyncSession
+    session: AsyncSession,
+    loader: SongLoader = 'orm'
 ):
     table = TABLE_MAP[table_name]
     id_attr = 'bvid' if table_name == 'video' else 'id'
@@ -71,6 +74,8 @@ async def normal_search(
                 exists().where(Song.id == Video.song_id)
             )
             
+        if loader == 'json':
+            return await search_songs_json(id_accuracy_map, includeEmpty, page, page_size, session)
         stmt = (
             select(Song)
             .where(*where_conditions)
@@ -128,3 +133,44 @@ async def normal_search(
         'data': data,
         'total': len(total_data)
     }
+
+
+async def search_songs_json(
+    id_accuracy_map: dict[int, int],
+    includeEmpty: bool,
+    page: int,
+    page_size: int,
+    session: AsyncSession
+):
+    """
+    歌曲搜索的 JSON 模式：匹配度和 id 一起传给数据库，排序分页都在 SQL 里完成，
+    只为这一页的歌曲拼 JSON，其余匹配的歌曲不会被装载
+    """
+    matches = func.unnest(
+        bindparam('ids', list(id_accuracy_map), type_=ARRAY(Integer)),
+        bindparam('accuracies', list(id_accuracy_map.values()), type_=ARRAY(Integer))
+    ).table_valued('id', 'accuracy').render_derived()
+    matched = select(matches.c.id).join(Song, Song.id == matches.c.id)
+    if not includeEmpty:
+        matched = matched.where(exists().where(Song.id == Video.song_id))
+
+    stmt = (
+        matched.add_columns(func.count().over().label('total'))
+        .order_by(matches.c.accuracy.desc(), matches.c.id)
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    rows = (await session.execute(stmt)).all()
+    page_ids = [row.id for row in rows]
+    if rows:
+        total = rows[0].total
+    else:
+        # 翻过了最后一页，单独查一次总数
+        total = (await session.execute(select(func.count()).select_from(matched.subquery()))).scalar_one()
+
+    result = await session.execute(select_songs('json').where(Song.id.in_(page_ids)))
+    songs = {song.id: song for song in song_rows(result, 'json')}
+    return {
+        'data': [songs[id] for id in page_ids],
+        'total': total
+    }
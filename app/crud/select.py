@@ -1,18 +1,20 @@
+from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, text, distinct, and_
-from sqlalchemy.orm import selectinload, aliased
-from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg
+from sqlalchemy import select, func, text, distinct, and_, or_, case, true
+from sqlalchemy.orm import selectinload, aliased, undefer
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 
-from app.session import get_async_session, engine
-from app.models import Song, song_producer, song_synthesizer, song_vocalist, Producer, Synthesizer, Vocalist, Uploader, Video, Ranking, Snapshot, TABLE_MAP, REL_MAP, song_load_full
+from app.session import get_async_session, engine, execute_concurrently
+from app.models import Song, song_producer, song_synthesizer, song_vocalist, Producer, Synthesizer, Vocalist, Uploader, Video, Ranking, RankingDisplay, Snapshot, TABLE_MAP, REL_MAP
 
 from app.utils.misc import make_artist_str
-from app.utils.bilibili_id import bv2av
-from app.utils.date import get_last_census_date, get_seperate_start_end_issues
-from datetime import datetime
+from app.utils.date import get_last_census_date
+from app.utils.cursor import decode_cursor, next_cursor, keyset_after
+from app.utils.bilibili_id import bvid_to_aid
+from app.crud.song_json import SongLoader, SongJSON, select_songs, song_rows
+from datetime import datetime, date
 
 from typing import Literal
-from abv_py import bv2av
 
 
 async def get_names(
@@ -34,37 +36,55 @@ async def get_names(
 async def get_songs_detail(
     page: int,
     page_size: int,
-    session: AsyncSession
+    session: AsyncSession,
+    cursor: str | None = None,
+    loader: SongLoader = 'orm'
 ):
-    total_result = await session.execute(select(func.count()).select_from(Song))
-    total = total_result.scalar_one()  # 获取总数
-
     stmt = (
-        select(Song)
-        .options(*song_load_full)
-        .offset((page - 1) * page_size)
+        select_songs(loader)
+        .order_by(Song.id)
         .limit(page_size)
     )
-    result = await session.execute(stmt)
-    data = result.scalars().all()
+    # 有游标时从上一页最后一首歌之后继续，没有时按页码
+    if cursor:
+        last_id, = decode_cursor('songs', cursor, int)
+        stmt = stmt.where(Song.id > last_id)
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+    # 这一页和总数互不依赖，并发执行
+    result, total_result = await execute_concurrently(session, stmt, select(func.count()).select_from(Song))
+    data = song_rows(result, loader)
+    total = total_result.scalar_one()  # 获取总数
     
     return {
         'data': data,
-        'total': total
+        'total': total,
+        'next_cursor': next_cursor('songs', data, page_size, lambda song: (song.id,))
     }
 
 async def get_all_included_songs(session: AsyncSession):
 
-    # 最新日期
-    latest_date_stmt = select(func.max(Snapshot.date))
+    # 最新日期。每个视频的最新数据已经维护在 video 上，不需要再扫描 snapshot
+    latest_date_stmt = select(func.max(Video.latest_date))
     latest_date = (await session.execute(latest_date_stmt)).scalar_one()
     last_census_date = get_last_census_date(latest_date)
 
-    # 聚合查询
+    census = aliased(Snapshot)
+
+    def artist_names(table, rel):
+        return (
+            select(func.array_agg(aggregate_order_by(table.name, table.name)))
+            .select_from(rel)
+            .join(table, rel.c.artist_id == table.id)
+            .where(rel.c.song_id == Song.id)
+            .scalar_subquery()
+        )
+
     stmt = (
         select(
             Video.title,
             Video.bvid,
+            Video.aid,
             Video.pubdate,
             Video.copyright,
             Video.thumbnail,
@@ -75,58 +95,36 @@ async def get_all_included_songs(session: AsyncSession):
 
             Uploader.name.label("uploader_name"),
 
-            # —— ⭐ 分别聚合两个日期的视图 —— #
-            func.max(Snapshot.view)
-                .filter(Snapshot.date == latest_date)
-                .label("latest_view"),
+            # 最新一天的数据直接取 video 上的字段，普查日的数据按主键取
+            case((Video.latest_date == latest_date, Video.latest_view)).label("latest_view"),
+            census.view.label("census_view"),
 
-            func.max(Snapshot.view)
-                .filter(Snapshot.date == last_census_date)
-                .label("census_view"),
-
-            # 多对多聚合
-            array_agg(distinct(Producer.name)).filter(Producer.name.isnot(None)).label("producers"),
-            array_agg(distinct(Synthesizer.name)).filter(Synthesizer.name.isnot(None)).label("synthesizers"),
-            array_agg(distinct(Vocalist.name)).filter(Vocalist.name.isnot(None)).label("vocalists"),
+            # 多对多用子查询，不再需要 GROUP BY
+            artist_names(Producer, song_producer).label("producers"),
+            artist_names(Synthesizer, song_synthesizer).label("synthesizers"),
+            artist_names(Vocalist, song_vocalist).label("vocalists"),
             
             Video.streak,
         )
-        .select_from(Snapshot)
-        .join(Video, Snapshot.bvid == Video.bvid)
+        .select_from(Video)
         .join(Song, Video.song_id == Song.id)
         .join(Uploader, Video.uploader_id == Uploader.id)
-
-        # 多对多 LEFT JOIN
-        .join(song_producer, song_producer.c.song_id == Song.id, isouter=True)
-        .join(Producer, song_producer.c.artist_id == Producer.id, isouter=True)
-
-        .join(song_synthesizer, song_synthesizer.c.song_id == Song.id, isouter=True)
-        .join(Synthesizer, song_synthesizer.c.artist_id == Synthesizer.id, isouter=True)
-
-        .join(song_vocalist, song_vocalist.c.song_id == Song.id, isouter=True)
-        .join(Vocalist, song_vocalist.c.artist_id == Vocalist.id, isouter=True)
-
-        .where(Snapshot.date.in_([latest_date, last_census_date]))
-        .group_by(
-            Video.title,
-            Video.bvid,
-            Video.pubdate,
-            Video.thumbnail,
-            Video.copyright,
-            Song.name,
-            Song.type,
-            Song.display_name,
-            Uploader.name,
-            Video.streak
-        )
-        .order_by(text("census_view DESC"))
+        .join(census, and_(
+            census.aid == Video.aid,
+            census.date == last_census_date
+        ), isouter=True)
+        .where(or_(
+            Video.latest_date == latest_date,
+            census.aid.isnot(None)
+        ))
+        .order_by(census.view.desc())
     )
 
     rows = (await session.execute(stmt)).all()
 
     records = []
     for (
-        title, bvid, pubdate, copyright,
+        title, bvid, aid, pubdate, copyright,
         thumbnail, song_name, song_type, song_display_name,
         uploader_name, latest_view, census_view,
         producers, synthesizers, vocalists, streak,
@@ -135,7 +133,7 @@ async def get_all_included_songs(session: AsyncSession):
         records.append({
             "title": title,
             "bvid": bvid,
-            "aid": str(bv2av(bvid)),
+            "aid": str(aid),
             "name": song_name,
             "display_name": song_display_name,
             "view": latest_view or census_view,
@@ -157,50 +155,58 @@ async def get_artist_songs(
     artist_id: int,
     page: int,
     page_size: int,
-    session: AsyncSession
+    session: AsyncSession,
+    cursor: str | None = None,
+    loader: SongLoader = 'orm'
 ):
     table = TABLE_MAP[artist_type]
+    if cursor:
+        last_id, = decode_cursor('artist_songs', cursor, int)
+        page_filter, offset = Song.id > last_id, 0
+    else:
+        page_filter, offset = true(), (page - 1) * page_size
+
     if table in [Producer, Synthesizer, Vocalist]:
         rel = REL_MAP[artist_type]
         stmt = (
-            select(Song)
-            .options(*song_load_full)
+            select_songs(loader)
             .join(rel, Song.id == rel.c.song_id)
-            .where(rel.c.artist_id == artist_id)
-            .offset((page - 1) * page_size)
+            .where(rel.c.artist_id == artist_id, page_filter)
+            .order_by(Song.id)
+            .offset(offset)
             .limit(page_size)
         )
-        total_result = await session.execute(
+        total_stmt = (
             select(func.count())
             .select_from(Song)
             .join(rel, Song.id == rel.c.song_id)
             .where(rel.c.artist_id == artist_id)
         )
-        total = total_result.scalar_one()
     elif table == Uploader:
         stmt = (
-            select(Song)
+            select_songs(loader)
             .join(Song.videos)                    # 先 join video
-            .where(Video.uploader_id == artist_id)  # 筛选条件
-            .options(*song_load_full)
-            .offset((page - 1) * page_size)
+            .where(Video.uploader_id == artist_id, page_filter)  # 筛选条件
+            .order_by(Song.id)
+            .offset(offset)
             .limit(page_size)
         )
-        total_result = await session.execute(
+        total_stmt = (
             select(func.count())
             .select_from(Song)
             .join(Song.videos)
             .where(Video.uploader_id == artist_id)
         )
-        total = total_result.scalar_one()
     else:
         raise Exception('artist类型不符合条件')
         
-    result = await session.execute(stmt)
-    data = result.scalars().all()
+    result, total_result = await execute_concurrently(session, stmt, total_stmt)
+    data = song_rows(result, loader)
+    total = total_result.scalar_one()
     return {
         'data': data,
-        'total': total
+        'total': total,
+        'next_cursor': next_cursor('artist_songs', data, page_size, lambda song: (song.id,))
     }
     
 async def get_ranking(
@@ -211,7 +217,8 @@ async def get_ranking(
     page_size: int ,
     order_type: Literal['score','view','favorite','coin','like'] ,
     seperate: bool,
-    session: AsyncSession 
+    session: AsyncSession,
+    cursor: str | None = None
 ):
     
 
@@ -230,112 +237,50 @@ async def get_ranking(
         'coin': Ranking.coin_rank,
         'like': Ranking.like_rank
     }
-    
-    seperate_board_map = {
-        'vocaloid-weekly': 'vocaloid-daily',
-        'vocaloid-monthly': 'vocaloid-weekly',
-    }
+    order_col = order_map[order_type]
 
-    prev_issue = issue - 1
-    PrevRanking = aliased(Ranking)
-    
-    if seperate:
-        SeperateRanking = aliased(Ranking)
-        seperate_start_issue, seperate_end_issue = get_seperate_start_end_issues(board, issue)
-        
-        stmt = (
-            select(
-                Ranking, 
-                PrevRanking,
-                array_agg(aggregate_order_by(SeperateRanking.rank, SeperateRanking.issue))
-            )
-            .join(Song, Ranking.song_id == Song.id)
-            .join(Video, Ranking.bvid == Video.bvid)
-            .outerjoin(PrevRanking, and_(
-                PrevRanking.song_id == Ranking.song_id,
-                PrevRanking.board == board,
-                PrevRanking.part == part,
-                PrevRanking.issue == prev_issue
-            ))
-            .outerjoin(SeperateRanking, and_(
-                SeperateRanking.song_id == Ranking.song_id,
-                SeperateRanking.board == seperate_board_map[board],
-                SeperateRanking.part == part,
-                SeperateRanking.issue >= seperate_start_issue,
-                SeperateRanking.issue <= seperate_end_issue,
-            ))
-            .options(
-                selectinload(Ranking.song).selectinload(Song.vocalists),
-                selectinload(Ranking.song).selectinload(Song.producers),
-                selectinload(Ranking.song).selectinload(Song.synthesizers),
-                selectinload(Ranking.video).selectinload(Video.uploader)
-            )
-            .where(Ranking.board == board, Ranking.part == part, Ranking.issue == issue)
-            .group_by(Ranking.id, PrevRanking.id)
-            .order_by(order_map[order_type])
-            .offset((page-1) * page_size)
-            .limit(page_size)
-        )
-        result = await session.execute(stmt)
-        rows = result.all()  # 每行是 (cur_ranking, prev_ranking_or_None)
-
-        # 4) 把 prev_ranking 作为 runtime attribute 绑定到 cur_ranking.last 上
-        data = []
-        for cur, prev, seperates in rows:
-            # 动态添加属性（只在内存中），不会影响 DB/ORM 配置
-            setattr(cur, "last", prev)
-            setattr(cur, "seperates", seperates)
-            data.append(cur)
+    # 游标记录上一页最后一行的 (排名, id)，同时绑定这一期和排序方式
+    cursor_kind = f'ranking:{board}:{part}:{issue}:{order_type}'
+    if cursor:
+        last_value, last_id = decode_cursor(cursor_kind, cursor, int | None, int)
+        page_filter, offset = keyset_after(order_col, Ranking.id, last_value, last_id), 0
     else:
-         
-        stmt = (
-            select(
-                Ranking, 
-                PrevRanking
-            )
-            .join(Song, Ranking.song_id == Song.id)
-            .join(Video, Ranking.bvid == Video.bvid)
-            .outerjoin(PrevRanking, and_(
-                PrevRanking.song_id == Ranking.song_id,
-                PrevRanking.board == board,
-                PrevRanking.part == part,
-                PrevRanking.issue == prev_issue
-            ))
-            .options(
-                selectinload(Ranking.song).selectinload(Song.vocalists),
-                selectinload(Ranking.song).selectinload(Song.producers),
-                selectinload(Ranking.song).selectinload(Song.synthesizers),
-                selectinload(Ranking.video).selectinload(Video.uploader)
-            )
-            .where(Ranking.board == board, Ranking.part == part, Ranking.issue == issue)
-            .group_by(Ranking.id, PrevRanking.id)
-            .order_by(order_map[order_type])
-            .offset((page-1) * page_size)
-            .limit(page_size)
-        )
-        result = await session.execute(stmt)
-        rows = result.all()  # 每行是 (cur_ranking, prev_ranking_or_None)
-
-        # 4) 把 prev_ranking 作为 runtime attribute 绑定到 cur_ranking.last 上
-        data = []
-        for cur, prev in rows:
-            # 动态添加属性（只在内存中），不会影响 DB/ORM 配置
-            setattr(cur, "last", prev)
-            data.append(cur)
-        
-    # 5) 查询本期排行的总量
+        page_filter, offset = true(), (page - 1) * page_size
     
-    total_result = await session.execute(
+    # last（上一期排名）和 seperates（分期排名）在导入时已经算好，见 update_ranking_links
+    options = [
+        selectinload(Ranking.last),
+        selectinload(Ranking.song).selectinload(Song.vocalists),
+        selectinload(Ranking.song).selectinload(Song.producers),
+        selectinload(Ranking.song).selectinload(Song.synthesizers),
+        selectinload(Ranking.video).selectinload(Video.uploader)
+    ]
+    if seperate:
+        options.append(undefer(Ranking.seperates))
+
+    stmt = (
+        select(Ranking)
+        .options(*options)
+        .where(Ranking.board == board, Ranking.part == part, Ranking.issue == issue, page_filter)
+        .order_by(order_col, Ranking.id)
+        .offset(offset)
+        .limit(page_size)
+    )
+    # 本期排行的总量和这一页并发查询
+    total_stmt = (
         select(func.count())
         .select_from(Ranking)
         .where(Ranking.board == board, Ranking.part == part, Ranking.issue == issue)
     )
+    result, total_result = await execute_concurrently(session, stmt, total_stmt)
+    data = result.scalars().all()
     total = total_result.scalar_one()
 
     return {
         'status': 'ok',
         'data': data,
-        'total': total
+        'total': total,
+        'next_cursor': next_cursor(cursor_kind, data, page_size, lambda r: (getattr(r, order_col.key), r.id))
     }
  
 async def get_latest_ranking(
@@ -353,6 +298,67 @@ async def get_latest_ranking(
     issue = int(result.scalars().one())
     return issue
     
+async def get_ranking_display(
+    board: str,
+    part: str,
+    issue: int | None,
+    page: int,
+    page_size: int,
+    order_type: Literal['score','view','favorite','coin','like'],
+    session: AsyncSession,
+    cursor: str | None = None
+):
+    """
+    从 ranking_display 读取一页排名。歌曲、artist、视频信息都已经展开，
+    一条查询就能得到整页数据和总数，结果是普通的字典，不经过 ORM。
+    """
+    in_issue = [RankingDisplay.board == board, RankingDisplay.part == part]
+    if issue is None:
+        issue = (await session.execute(select(func.max(RankingDisplay.issue)).where(*in_issue))).scalar_one()
+    in_issue.append(RankingDisplay.issue == issue)
+
+    order_map = {
+        'score': RankingDisplay.rank,
+        'view': RankingDisplay.view_rank,
+        'favorite': RankingDisplay.favorite_rank,
+        'coin': RankingDisplay.coin_rank,
+        'like': RankingDisplay.like_rank
+    }
+    order_col = order_map[order_type]
+
+    cursor_kind = f'ranking_display:{board}:{part}:{issue}:{order_type}'
+    if cursor:
+        last_value, last_id = decode_cursor(cursor_kind, cursor, int | None, int)
+        page_filter, offset = keyset_after(order_col, RankingDisplay.id, last_value, last_id), 0
+    else:
+        page_filter, offset = true(), (page - 1) * page_size
+
+    # 总数作为不相关子查询放在同一条语句里，只计算一次
+    total = select(func.count()).select_from(RankingDisplay).where(*in_issue).scalar_subquery()
+    stmt = (
+        select(*RankingDisplay.__table__.c, total.label('total'))
+        .where(*in_issue, page_filter)
+        .order_by(order_col, RankingDisplay.id)
+        .offset(offset)
+        .limit(page_size)
+    )
+    rows = (await session.execute(stmt)).mappings().all()
+    data = [{k: v for k, v in row.items() if k != 'total'} for row in rows]
+
+    if rows:
+        total_count = rows[0]['total']
+    else:
+        # 翻过了最后一页，单独查一次总数
+        total_count = (await session.execute(select(func.count()).select_from(RankingDisplay).where(*in_issue))).scalar_one()
+
+    return {
+        'status': 'ok',
+        'data': data,
+        'total': total_count,
+        'next_cursor': next_cursor(cursor_kind, data, page_size, lambda row: (row[order_col.key], row['id']))
+    }
+
+
 async def get_ranking_top5(
     board: str,
     part: str,
@@ -409,15 +415,15 @@ async def get_ranking_top5(
 
 async def get_song(
     id: int,
-    session: AsyncSession
+    session: AsyncSession,
+    loader: SongLoader = 'orm'
 ):    
     stmt = (
-        select(Song)
-        .options(*song_load_full)
+        select_songs(loader)
         .where(Song.id == id)
     )
     result = await session.execute(stmt)
-    data = result.scalars().one()
+    data = SongJSON(*result.one()) if loader == 'json' else result.scalars().one()
     return {
         'data': data
     }
@@ -428,7 +434,8 @@ async def get_song_ranking(
     board: str,
     page: int,
     page_size: int,
-    session: AsyncSession
+    session: AsyncSession,
+    cursor: str | None = None
 ):
     stmt = (
         select(Ranking)
@@ -442,14 +449,16 @@ async def get_song_ranking(
             Ranking.issue.desc(),
             Ranking.rank.asc()
         )
-        .offset((page-1) * page_size)
         .limit(page_size)
     )
+    # 每期只有一行，按期数倒序，游标记录上一页最后一期
+    if cursor:
+        last_issue, = decode_cursor('song_ranking', cursor, int)
+        stmt = stmt.where(Ranking.issue < last_issue)
+    else:
+        stmt = stmt.offset((page-1) * page_size)
     
-    result = await session.execute(stmt)
-    data = result.scalars().all()
-    
-    totalResult = await session.execute(
+    total_stmt = (
         select(func.count())
         .where(and_(
             Ranking.board == board,
@@ -457,10 +466,13 @@ async def get_song_ranking(
             Ranking.song_id == id
         ))
     )
+    result, totalResult = await execute_concurrently(session, stmt, total_stmt)
+    data = result.scalars().all()
     total = totalResult.scalar_one()
     return {
         'data': data,
-        'total': total
+        'total': total,
+        'next_cursor': next_cursor('song_ranking', data, page_size, lambda r: (r.issue,))
     }
 
 async def get_song_by_achievement(
@@ -473,29 +485,20 @@ async def get_song_by_achievement(
     bottom = 10 ** (level + 3)
     top = 10 ** (level + 4)
     
-    item_attr = getattr(Snapshot, item)
-    
-    subq = (
-        select(
-            Snapshot.bvid.label("bvid"),
-            func.max(Snapshot.date).label("latest")
-        )
-        .group_by(Snapshot.bvid)
-        .cte()
-    )
+    # 最新数据维护在 video 上，直接按带索引的 latest_* 筛选，再用主键取出对应的 Snapshot
+    item_attr = getattr(Video, f'latest_{item}')
     
     stmt = (
         select(Song, Video, Snapshot)
-            .select_from(subq)
-            .join(Video, Video.bvid == subq.c.bvid)
+            .select_from(Video)
             .join(Song, Song.id == Video.song_id)
             .join(Snapshot, and_(
-                subq.c.bvid == Snapshot.bvid,
-                subq.c.latest == Snapshot.date,
+                Snapshot.aid == Video.aid,
+                Snapshot.date == Video.latest_date,
             ))
             .where(
-                getattr(Snapshot, item) >= bottom,
-                getattr(Snapshot, item) < top,
+                item_attr >= bottom,
+                item_attr < top,
             )
             .options(
                 selectinload(Song.vocalists),
@@ -503,7 +506,7 @@ async def get_song_by_achievement(
                 selectinload(Song.synthesizers),
                 selectinload(Video.uploader)
             )
-            .order_by(getattr(Snapshot, item).desc())
+            .order_by(item_attr.desc())
             .offset((page - 1) * page_size)
             .limit(page_size)
     )
@@ -522,9 +525,10 @@ async def get_song_by_achievement(
         
     totalResult = await session.execute(
         select(func.count())
+        .select_from(Video)
         .where(
-            getattr(Snapshot, item) >= bottom,
-            getattr(Snapshot, item) < top,
+            item_attr >= bottom,
+            item_attr < top,
         )
     )
     
@@ -540,21 +544,21 @@ async def get_song_by_artist(
     id: int,
     page: int,
     page_size: int,
-    session: AsyncSession
+    session: AsyncSession,
+    loader: SongLoader = 'orm'
 ):
     if type == 'uploader':
         rel = Uploader
         stmt = (
-            select(Song)
+            select_songs(loader)
             .select_from(Video)
             .join(Song, Song.id == Video.song_id)
             .where(Video.uploader_id == id)
-            .options(*song_load_full)
             .offset((page-1) * page_size)
             .limit(page_size)
         )
         result = await session.execute(stmt)
-        data = result.scalars().all()
+        data = song_rows(result, loader)
         
         stmt = (
             select(func.count())
@@ -590,13 +594,12 @@ async def get_song_by_artist(
         total = result.scalar_one()
         
         stmt = (
-            select(Song)
+            select_songs(loader)
             .where(Song.id.in_(song_ids))
-            .options(*song_load_full)
         )
         songs = await session.execute(stmt)
         return {
-            'data': songs.scalars().all(),
+            'data': song_rows(songs, loader),
             'total': total
         }
     
@@ -621,27 +624,34 @@ async def get_song_snapshot(
     bvid: str,
     page: int,
     page_size: int,
-    session: AsyncSession
+    session: AsyncSession,
+    cursor: str | None = None
 ):
+    aid = bvid_to_aid(bvid)
     stmt = (
         select(Snapshot)
-        .where(Snapshot.bvid == bvid)
+        .where(Snapshot.aid == aid)
         .order_by(Snapshot.date.desc())
-        .offset((page-1) * page_size)
         .limit(page_size)
     )
-    result = await session.execute(stmt)
-    data = result.scalars().all()
-    
-    totalResult = await session.execute(
+    # 同一个视频每天一条，按日期倒序，游标记录上一页最后一天，直接走 (aid, date) 主键
+    if cursor:
+        last_date, = decode_cursor('snapshot', cursor, date)
+        stmt = stmt.where(Snapshot.date < last_date)
+    else:
+        stmt = stmt.offset((page-1) * page_size)
+    total_stmt = (
         select(func.count())
-        .where(Snapshot.bvid == bvid)
+        .where(Snapshot.aid == aid)
     )
+    result, totalResult = await execute_concurrently(session, stmt, total_stmt)
+    data = result.scalars().all()
     total = totalResult.scalar_one()
     
     return {
         'data': data,
-        'total': total
+        'total': total,
+        'next_cursor': next_cursor('snapshot', data, page_size, lambda snapshot: (snapshot.date,))
     }
 
 async def get_video(
@@ -653,7 +663,9 @@ async def get_video(
         .where(Video.bvid == bvid)
     )
     result = await session.execute(stmt)
-    data = result.scalars().one()
+    data = result.scalars().one_or_none()
+    if data is None:
+        raise HTTPException(status_code=404, detail="视频不存在")
     return {
         'data': data
     }
@@ -664,13 +676,14 @@ async def get_video_snapshot_by_date(
     end_date: str,
     session: AsyncSession
 ):
+    aid = bvid_to_aid(bvid)
     start_date_ = datetime.strptime(start_date, "%Y-%m-%d")
     end_date_ = datetime.strptime(end_date, "%Y-%m-%d")
     
     stmt = (
         select(Snapshot)
         .where(and_(
-            Snapshot.bvid == bvid,
+            Snapshot.aid == aid,
             Snapshot.date >= start_date_,
             Snapshot.date <= end_date_
         ))
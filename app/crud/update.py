@@ -1,120 +1,468 @@
-from sqlalchemy import select, func, and_, update, exists
+from sqlalchemy import select, func, and_, or_, update, exists, case, true, text, cast, null, Integer
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.dialects.postgresql import insert
-from datetime import date, timedelta
+from sqlalchemy.dialects.postgresql import insert, array, aggregate_order_by, ARRAY
+from datetime import date, datetime, timedelta
+import io
+import time
 
-from app.models import Video, Snapshot, Producer, Song
+import numpy as np
+import pandas as pd
+
+from app.models import Video, Snapshot, Producer, Song, Ranking
+from app.session import get_driver_connection
+from app.crud.partition import next_month
+from app.crud.display import refresh_ranking_display, refresh_ranking_display_issue
+from app.utils.date import SEPERATE_BOARDS, get_seperate_start_end_issues, get_seperate_parent_issues
+from app.stores.ranking_cache import ranking_cache
 
 MIN_TOTAL_VIEW = 10000
 BASE_THRESHOLD = 100
 
+def as_date(value: date) -> date:
+    # 导入数据时传进来的是 datetime，这里统一成 date，日期相减才是天数
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+RECOMPUTE_VIDEO_AGGREGATES = text("""
+    UPDATE video v
+    SET latest_date = l.date,
+        latest_view = l.view,
+        latest_favorite = l.favorite,
+        latest_coin = l.coin,
+        latest_like = l."like",
+        max_view = m.max_view
+    FROM video t
+    LEFT JOIN LATERAL (
+        SELECT date, view, favorite, coin, "like"
+        FROM snapshot s
+        WHERE s.aid = t.aid
+        ORDER BY s.date DESC
+        LIMIT 1
+    ) l ON true
+    LEFT JOIN LATERAL (
+        SELECT max(view) AS max_view
+        FROM snapshot s
+        WHERE s.aid = t.aid
+    ) m ON true
+    WHERE v.aid = t.aid
+      AND t.latest_date >= :date
+      AND (t.latest_date = :date OR EXISTS (SELECT 1 FROM snapshot s WHERE s.aid = t.aid AND s.date = :date))
+""")
+
+async def update_video_aggregates(session: AsyncSession, current_date: date):
+    """
+    用当天的 Snapshot 更新 video 上的最新数据（latest_*）和最高播放（max_view）。
+
+    当天是某个视频最新的一天时增量更新：latest_* 取当天，max_view 取较大值。
+    重新导入已有的日期或补导更早的日期时，数据可能变小、也可能整行被删掉，
+    这些视频（latest_date 不早于当天）直接从 snapshot 重算，max_view 不会只增不减。
+    """
+    current_date = as_date(current_date)
+
+    # 先重算，增量更新之后 latest_date 就都是当天了
+    await session.execute(RECOMPUTE_VIDEO_AGGREGATES, {'date': current_date})
+
+    stmt = (
+        update(Video)
+        .where(
+            Video.aid == Snapshot.aid,
+            Snapshot.date == current_date,
+            or_(Video.latest_date.is_(None), Video.latest_date < current_date)
+        )
+        .values(
+            latest_date=Snapshot.date,
+            latest_view=Snapshot.view,
+            latest_favorite=Snapshot.favorite,
+            latest_coin=Snapshot.coin,
+            latest_like=Snapshot.like,
+            # greatest 会忽略 NULL
+            max_view=func.greatest(Video.max_view, Snapshot.view)
+        )
+    )
+    await session.execute(stmt)
+    await session.commit()
+    # 排名响应里嵌套了视频的最新数据
+    ranking_cache.clear()
+
+
+REBUILD_VIDEO_AGGREGATES = text("""
+    UPDATE video v
+    SET latest_date = l.date,
+        latest_view = l.view,
+        latest_favorite = l.favorite,
+        latest_coin = l.coin,
+        latest_like = l."like",
+        max_view = m.max_view
+    FROM (
+        SELECT DISTINCT ON (aid) aid, date, view, favorite, coin, "like"
+        FROM snapshot
+        ORDER BY aid, date DESC
+    ) l
+    JOIN (
+        SELECT aid, max(view) AS max_view
+        FROM snapshot
+        GROUP BY aid
+    ) m USING (aid)
+    WHERE v.aid = l.aid
+""")
+
+async def rebuild_video_aggregates(session: AsyncSession):
+    """
+    从整个 snapshot 表重算 video 上的 latest_* 和 max_view。
+    第一次加上这些字段、或者手动改过 snapshot 之后执行。
+    """
+    started = time.perf_counter()
+    result = await session.execute(REBUILD_VIDEO_AGGREGATES)
+    await session.commit()
+    ranking_cache.clear()
+    elapsed = time.perf_counter() - started
+    print(f"重算 video 汇总字段：{result.rowcount} 个视频，用时 {elapsed:.2f} 秒")
+    return {
+        'videos': result.rowcount,
+        'seconds': round(elapsed, 3),
+    }
+
+
 async def update_video_streaks(session: AsyncSession, current_date: date):
     """
     更新 Video.streak 字段
+
+    是否毕业直接看 video.max_view（需要先执行 update_video_aggregates）。
+    其余视频只看当天和之前最近一次的 Snapshot（走 (aid, date) 主键索引），
+    算出新的 streak 之后用一条 UPDATE 写回，不再扫描全部历史。
     """
+    current_date = as_date(current_date)
 
     # -----------------------------
     # 0. 所有已毕业视频置0
     # -----------------------------
-    graduated = exists().where(
-        and_(
-            Snapshot.bvid == Video.bvid,
-            Snapshot.view >= MIN_TOTAL_VIEW
-        )
-    )
-    
-    stmt = (
+    await session.execute(
         update(Video)
-        .where(graduated)
-        .values(streak=0)
+        .where(
+            Video.max_view >= MIN_TOTAL_VIEW,
+            Video.streak.is_distinct_from(0)
         )
-    
-    await session.execute(stmt)
-    
-    
+        .values(streak=0)
+    )
+
     # -----------------------------
-    # 1. 获取所有需要更新streak的视频
+    # 1. 未毕业的视频计算新的 streak
     # -----------------------------
-    stmt = (
-        select(Video)
+    v = aliased(Video)
+    today = aliased(Snapshot)
+
+    # 当天之前最近一次 Snapshot
+    prev = (
+        select(Snapshot.view, Snapshot.date)
         .where(
-            ~graduated,
-            Video.streak_date < current_date
+            Snapshot.aid == v.aid,
+            Snapshot.date < current_date
         )
+        .order_by(Snapshot.date.desc())
+        .limit(1)
+        .lateral('prev')
+    )
+
+    new_streak = case(
+        # 当天无 Snapshot
+        (today.aid.is_(None), v.streak + 1),
+        # 没有上次Snapshot，说明新曲，不给streak
+        (prev.c.date.is_(None), 0),
+        # 涨速 >= 100
+        (today.view - prev.c.view >= BASE_THRESHOLD * (current_date - prev.c.date), 0),
+        else_=v.streak + 1
+    )
+
+    cand = (
+        select(
+            v.aid,
+            new_streak.label('streak')
+        )
+        .select_from(v)
+        .outerjoin(today, and_(today.aid == v.aid, today.date == current_date))
+        .outerjoin(prev, true())
+        .where(
+            or_(v.max_view.is_(None), v.max_view < MIN_TOTAL_VIEW),
+            v.streak_date < current_date
+        )
+    ).subquery('cand')
+
+    stmt = (
+        update(Video)
+        .where(Video.aid == cand.c.aid)
+        .values(streak=cand.c.streak, streak_date=current_date)
+    )
+    await session.execute(stmt)
+    await session.commit()
+    ranking_cache.clear()
+
+
+# 三个数组按位置对应，一条语句写回所有变化的视频
+UPDATE_STREAKS = text("""
+    UPDATE video
+    SET streak = v.streak, streak_date = v.streak_date
+    FROM unnest(
+        CAST(:aids AS bigint[]),
+        CAST(:streaks AS smallint[]),
+        CAST(:streak_dates AS date[])
+    ) AS v(aid, streak, streak_date)
+    WHERE video.aid = v.aid
+""")
+
+async def read_snapshot_views(session: AsyncSession, start: date, end: date) -> pd.DataFrame:
+    """
+    读取一段日期内的 (aid, day, view)，day 是相对 start 的天数。
+    行数很多，直接用 COPY 导出成 CSV 再交给 pandas 解析，比逐行构造 Row 快得多。
+    """
+    driver_conn = await get_driver_connection(session)
+    chunks: list[bytes] = []
+
+    async def collect(data: bytes):
+        chunks.append(bytes(data))
+
+    await driver_conn.copy_from_query(
+        'SELECT aid, date - $1 AS day, view FROM snapshot WHERE date BETWEEN $1 AND $2',
+        start, end,
+        output=collect,
+        format='csv',
+        header=True
     )
+    # view 按浮点读，空值直接是 NaN
+    return pd.read_csv(io.BytesIO(b''.join(chunks)), dtype={'aid': 'int64', 'day': 'int64', 'view': 'float64'})
 
-    videos = (await session.execute(stmt)).scalars().all()
-    if not videos:
-        return
+async def backfill_video_streaks(session: AsyncSession, start: date, end: date):
+    """
+    一次性重算一段日期内的 Video.streak。
+
+    结果和按日期顺序逐日导入、逐日计算 streak 相同（毕业只看当天及以前的 Snapshot），但历史只读一遍：
+    先取每个视频在 start 之前最近一次的 Snapshot 作为初始状态，
+    再按月用 COPY 读取区间内的 Snapshot（长表，不展开成 视频×日期 的矩阵），
+    逐日对所有视频做向量化计算，最后只把有变化的视频一次写回。
+    """
+    started = time.perf_counter()
 
     # -----------------------------
-    # 2. 获取所有 video 最新 Snapshot
+    # 1. 视频的当前状态
     # -----------------------------
+    videos = pd.DataFrame(
+        (await session.execute(select(Video.aid, Video.streak, Video.streak_date))).all(),
+        columns=['aid', 'streak', 'streak_date']
+    )
+    if videos.empty:
+        return {'videos': 0, 'days': 0, 'updated': 0, 'seconds': 0}
+    index = pd.Index(videos['aid'])
+    n = len(videos)
 
-    latest_snaps = (
-        await session.execute(
-            select(Snapshot)
-            .where(Snapshot.date == current_date)
-        )
-    ).scalars().all()
-
-    latest_map = {s.bvid: s for s in latest_snaps}
+    # streak 为 NULL 时用 NaN，和 SQL 里 NULL + 1 仍为 NULL 一致
+    streak = videos['streak'].to_numpy(dtype='float64', na_value=np.nan)
+    # streak_date 用序数表示，NULL 用一个很大的数，这样 streak_date < 当天 永远不成立
+    never = np.iinfo(np.int64).max
+    streak_date = np.array(
+        [never if pd.isna(d) else d.toordinal() for d in videos['streak_date']],
+        dtype='int64'
+    )
+    orig_streak, orig_streak_date = streak.copy(), streak_date.copy()
 
     # -----------------------------
-    # 3. 获取各视频之前的 Snapshot（用于计算日涨）
+    # 2. start 之前最近一次 Snapshot
     # -----------------------------
-    all_prev = (
-        select(
-            Snapshot.bvid,
-            Snapshot.view,
-            Snapshot.date,
-            func.row_number().over(
-                partition_by=Snapshot.bvid,
-                order_by=Snapshot.date.desc()
-            ).label('rn')
+    prev = (
+        select(Snapshot.view, Snapshot.date)
+        .where(
+            Snapshot.aid == Video.aid,
+            Snapshot.date < start
         )
-        .where(Snapshot.date < current_date)
-    ).subquery()
-    
-    prev_rows = (await session.execute(
-        select(all_prev).where(all_prev.c.rn == 1)
+        .order_by(Snapshot.date.desc())
+        .limit(1)
+        .lateral('prev')
+    )
+    rows = (await session.execute(
+        select(Video.aid, prev.c.view, prev.c.date).join(prev, true())
     )).all()
-            
-    prev_map = {s.bvid: s for s in prev_rows}
+
+    last_view = np.full(n, np.nan)
+    last_date = np.zeros(n, dtype='int64')
+    if rows:
+        idx = index.get_indexer([r.aid for r in rows])
+        last_view[idx] = [r.view for r in rows]
+        last_date[idx] = [r.date.toordinal() for r in rows]
 
     # -----------------------------
-    # 4. 遍历每个视频，执行 streak 更新逻辑
+    # 3. 按月读取区间内的 Snapshot，逐日计算
     # -----------------------------
-    for video in videos:
-        bvid = video.bvid
-        streak = video.streak
-        latest = latest_map.get(bvid)
-        prev = prev_map.get(bvid)
-
-        # ==============================================================
-        # A. 当天有 Snapshot
-        # ==============================================================
-        if latest:
-            if not prev:
-                # 没有上次Snapshot，说明新曲，不给streak
-                streak = 0
-            else:
-                daily_increase = (latest.view - prev.view) / ((latest.date - prev.date).days or 1)
-                if daily_increase >= BASE_THRESHOLD:  # 涨速 >= 100
-                    streak = 0
-                else:
-                    streak += 1
-
-        # ==============================================================
-        # B. 当天无 Snapshot
-        # ==============================================================        
-        else:
-            streak += 1
-
-        # 保存
-        video.streak = streak
-        video.streak_date = current_date
+    chunk_start = start
+    while chunk_start <= end:
+        # 和 snapshot 的月分区对齐，每次只读一个分区
+        chunk_end = min(next_month(chunk_start) - timedelta(days=1), end)
+        snaps = await read_snapshot_views(session, chunk_start, chunk_end)
+        snap_idx = index.get_indexer(snaps['aid'])
+        snap_day = snaps['day'].to_numpy(dtype='int64') + chunk_start.toordinal()
+        snap_view = snaps['view'].to_numpy()
+        # 没有对应视频的 Snapshot 不参与计算；按日期排好序，后面每天用二分取出当天的部分
+        known = np.flatnonzero(snap_idx >= 0)
+        order = known[np.argsort(snap_day[known], kind='stable')]
+        snap_idx, snap_day, snap_view = snap_idx[order], snap_day[order], snap_view[order]
+
+        for day in range(chunk_start.toordinal(), chunk_end.toordinal() + 1):
+            lo, hi = np.searchsorted(snap_day, [day, day + 1])
+            today_idx = snap_idx[lo:hi]
+            today_view = np.full(n, np.nan)
+            today_view[today_idx] = snap_view[lo:hi]
+            has_today = np.zeros(n, dtype=bool)
+            has_today[today_idx] = True
+
+            with np.errstate(invalid='ignore'):
+                graduated = (today_view >= MIN_TOTAL_VIEW) | (last_view >= MIN_TOTAL_VIEW)
+                fast = (today_view - last_view) >= BASE_THRESHOLD * (day - last_date)
+            pending = ~graduated & (streak_date < day)
+
+            reset = has_today & (np.isnan(last_view) | fast)
+            streak[graduated] = 0
+            streak[pending] = np.where(reset[pending], 0, streak[pending] + 1)
+            streak_date[pending] = day
 
+            last_view[today_idx] = today_view[today_idx]
+            last_date[today_idx] = day
+
+        chunk_start = chunk_end + timedelta(days=1)
+
+    # -----------------------------
+    # 4. 只写回有变化的视频
+    # -----------------------------
+    changed = np.flatnonzero(
+        ((streak != orig_streak) & ~(np.isnan(streak) & np.isnan(orig_streak)))
+        | (streak_date != orig_streak_date)
+    )
+    aids = videos['aid'].to_numpy()[changed].tolist()
+    streaks = [None if np.isnan(x) else int(x) for x in streak[changed]]
+    streak_dates = [None if x == never else date.fromordinal(int(x)) for x in streak_date[changed]]
+    if aids:
+        await session.execute(UPDATE_STREAKS, {'aids': aids, 'streaks': streaks, 'streak_dates': streak_dates})
     await session.commit()
+    ranking_cache.clear()
+
+    elapsed = time.perf_counter() - started
+    days = (end - start).days + 1
+    print(f"streak 回填 {start} ~ {end}，{n} 个视频，{days} 天，更新 {len(aids)} 个，用时 {elapsed:.2f} 秒")
+    return {
+        'videos': n,
+        'days': days,
+        'updated': len(aids),
+        'seconds': round(elapsed, 3),
+    }
+
+
+# =================  排名的上一期和分期排名  ====================
+
+def ranking_last_stmt(*where):
+    """
+    把 last_id 设为同一首歌在同一榜单上一期的排名（有多行时取排名最高的）
+    """
+    prev = aliased(Ranking)
+    prev_id = (
+        select(prev.id)
+        .where(
+            prev.song_id == Ranking.song_id,
+            prev.board == Ranking.board,
+            prev.part == Ranking.part,
+            prev.issue == Ranking.issue - 1
+        )
+        .order_by(prev.rank, prev.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        update(Ranking)
+        .where(*where, Ranking.last_id.is_distinct_from(prev_id))
+        .values(last_id=prev_id)
+    )
+
 
+def ranking_seperates_stmt(board: str, part: str, issue: int):
+    """
+    计算周刊、月刊某一期每首歌在所包含的各期日刊、周刊中的排名
+    """
+    sub = aliased(Ranking)
+    start, end = get_seperate_start_end_issues(board, issue)
+    ranks = (
+        select(func.array_agg(aggregate_order_by(sub.rank, sub.issue)))
+        .where(
+            sub.song_id == Ranking.song_id,
+            sub.board == SEPERATE_BOARDS[board],
+            sub.part == part,
+            sub.issue.between(start, end)
+        )
+        .scalar_subquery()
+    )
+    # 一期都没有上榜时是 [null]，和原来 LEFT JOIN 之后 array_agg 的结果一致
+    ranks = func.coalesce(ranks, cast(array([null()]), ARRAY(Integer)))
+    return (
+        update(Ranking)
+        .where(
+            Ranking.board == board,
+            Ranking.part == part,
+            Ranking.issue == issue,
+            Ranking.seperates.is_distinct_from(ranks)
+        )
+        .values(seperates=ranks)
+    )
+
+
+async def update_ranking_links(session: AsyncSession, board: str, part: str, issue: int):
+    """
+    导入某一期排名之后、提交之前调用，更新依赖这一期的预计算字段：
+    这一期和下一期的 last_id、这一期自己的 seperates、以及包含这一期的上一级榜单的 seperates。
+    重新导入时行会被删除重建，下一期的 last_id 和上一级榜单的 seperates 也因此需要刷新。
+    最后重新计算这些期的 ranking_display。
+    """
+    await session.execute(ranking_last_stmt(
+        Ranking.board == board,
+        Ranking.part == part,
+        Ranking.issue.in_([issue, issue + 1])
+    ))
+    issues = [(board, issue), (board, issue + 1)]
+    if board in SEPERATE_BOARDS:
+        await session.execute(ranking_seperates_stmt(board, part, issue))
+    for parent, child in SEPERATE_BOARDS.items():
+        if child == board:
+            for parent_issue in get_seperate_parent_issues(board, issue):
+                await session.execute(ranking_seperates_stmt(parent, part, parent_issue))
+                issues.append((parent, parent_issue))
+
+    for display_board, display_issue in issues:
+        await refresh_ranking_display_issue(session, display_board, part, display_issue)
+
+
+async def rebuild_ranking_links(session: AsyncSession):
+    """
+    重算所有排名的 last_id 和 seperates。第一次加上这些字段之后执行，平时导入时会增量维护。
+    """
+    started = time.perf_counter()
+    result = await session.execute(ranking_last_stmt())
+    last_updated = result.rowcount
+
+    issues = (await session.execute(
+        select(Ranking.board, Ranking.part, Ranking.issue)
+        .where(Ranking.board.in_(list(SEPERATE_BOARDS)))
+        .distinct()
+    )).all()
+    seperates_updated = 0
+    for board, part, issue in issues:
+        result = await session.execute(ranking_seperates_stmt(board, part, issue))
+        seperates_updated += result.rowcount
+    display_updated = await refresh_ranking_display(session)
+    await session.commit()
+    ranking_cache.clear()
 
+    elapsed = time.perf_counter() - started
+    print(f"重算排名的上一期和分期排名：last_id {last_updated} 行，seperates {len(issues)} 期 {seperates_updated} 行，ranking_display {display_updated} 行，用时 {elapsed:.2f} 秒")
+    return {
+        'last': last_updated,
+        'seperate_issues': len(issues),
+        'seperates': seperates_updated,
+        'display': display_updated,
+        'seconds': round(elapsed, 3),
+    }
@@ -1,9 +1,11 @@
-from sqlalchemy import Column, ForeignKey, String, Date, SmallInteger, Integer, Text, Table, MetaData, PrimaryKeyConstraint, Index, Boolean
-from sqlalchemy.dialects.postgresql import TIMESTAMP
-from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase, selectinload 
+from sqlalchemy import Column, ForeignKey, String, Date, SmallInteger, Integer, BigInteger, Text, Table, MetaData, PrimaryKeyConstraint, Index, Boolean
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.postgresql import TIMESTAMP, ARRAY
+from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase, selectinload, reconstructor
+from abv_py import av2bv
 from datetime import datetime
 from datetime import date as datetype
-from typing import List
+from typing import List, Literal
 
 metadata = MetaData(schema="public")
 class Base(DeclarativeBase):
@@ -31,6 +33,50 @@ song_vocalist = Table(
 )
 
 
+# ===============  字段类型  ================
+
+# 榜单和分区只有几种取值，数据库里存 smallint 编号，代码里仍然用字符串
+BOARD_CODES = {
+    'vocaloid-daily': 1,
+    'vocaloid-weekly': 2,
+    'vocaloid-monthly': 3,
+}
+PART_CODES = {
+    'main': 1,
+    'new': 2,
+}
+
+# 接口参数的类型，取值不在上面的映射里时 FastAPI 直接返回 422
+BoardName = Literal[tuple(BOARD_CODES)]
+PartName = Literal[tuple(PART_CODES)]
+
+class CodeEnum(TypeDecorator):
+    """
+    按给定的映射把字符串存成 smallint 编号，读取时再转换回字符串
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, codes: dict[str, int]):
+        super().__init__()
+        # 会作为语句缓存的键，要能哈希
+        self.codes = tuple(codes.items())
+        self._to_code = dict(codes)
+        self._to_name = {code: name for name, code in codes.items()}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value not in self._to_code:
+            raise ValueError(f'无效的取值：{value}')
+        return self._to_code[value]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._to_name[value]
+
+
 # ===============  对象表  ================
 
 
@@ -114,10 +160,12 @@ class Video(Base):
     """
     __tablename__ = "video"
     bvid: Mapped[str] = mapped_column(String(12), primary_key=True, autoincrement=False)
+    # snapshot 和 ranking 用 aid 关联视频，bvid 只用来显示
+    aid: Mapped[int] = mapped_column(BigInteger, unique=True)
     title: Mapped[str] = mapped_column(Text)
     pubdate: Mapped[datetime] = mapped_column(TIMESTAMP)
-    uploader_id: Mapped[int] = mapped_column(Integer, ForeignKey('uploader.id'), nullable=True)
-    song_id: Mapped[int] = mapped_column(Integer, ForeignKey('song.id'), nullable=False)
+    uploader_id: Mapped[int] = mapped_column(Integer, ForeignKey('uploader.id'), nullable=True, index=True)
+    song_id: Mapped[int] = mapped_column(Integer, ForeignKey('song.id'), nullable=False, index=True)
     copyright: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     thumbnail: Mapped[str] = mapped_column(Text, nullable=True)
     duration: Mapped[int] = mapped_column(Integer, nullable=True)
@@ -126,18 +174,26 @@ class Video(Base):
 
     uploader: Mapped["Uploader"] = relationship("Uploader",  back_populates="videos")
     song: Mapped["Song"] = relationship("Song", back_populates="videos")
-    snapshots: Mapped[List["Snapshot"]] = relationship("Snapshot", primaryjoin="Video.bvid == foreign(Snapshot.bvid)", back_populates="video")
-    rankings: Mapped[List["Ranking"]] = relationship("Ranking",  primaryjoin="Ranking.bvid == foreign(Video.bvid)",  back_populates="video")
+    snapshots: Mapped[List["Snapshot"]] = relationship("Snapshot", primaryjoin="Video.aid == foreign(Snapshot.aid)", back_populates="video")
+    rankings: Mapped[List["Ranking"]] = relationship("Ranking",  primaryjoin="Ranking.aid == foreign(Video.aid)",  back_populates="video")
 
     streak: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     streak_date: Mapped[datetype] = mapped_column(Date, nullable=True)
 
+    # 由导入数据时维护，见 app/crud/update.py
+    latest_date: Mapped[datetype] = mapped_column(Date, nullable=True, index=True)
+    latest_view: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    latest_favorite: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    latest_coin: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    latest_like: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    max_view: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+
 class Snapshot(Base):
     """
     数据记录
     """
     __tablename__ = 'snapshot'
-    bvid: Mapped[str] = mapped_column(String, autoincrement=False)
+    aid: Mapped[int] = mapped_column(BigInteger, autoincrement=False)
     date: Mapped[datetype] = mapped_column(Date)
 
     view: Mapped[int] = mapped_column(Integer)
@@ -145,10 +201,17 @@ class Snapshot(Base):
     coin: Mapped[int] = mapped_column(Integer)
     like: Mapped[int] = mapped_column(Integer)
     
-    video: Mapped["Video"] = relationship("Video", primaryjoin="Video.bvid == foreign(Snapshot.bvid)", back_populates="snapshots")
+    video: Mapped["Video"] = relationship("Video", primaryjoin="Video.aid == foreign(Snapshot.aid)", back_populates="snapshots")
+
+    @reconstructor
+    def init_on_load(self):
+        # 表里只存 aid，bvid 在加载时算出来，接口返回的数据里仍然有 bvid
+        self.bvid = av2bv(self.aid)
     
+    # 按月分区，分区由 app/crud/partition.py 创建
     __table_args__ = (
-        PrimaryKeyConstraint("bvid", 'date'),
+        PrimaryKeyConstraint("aid", 'date'),
+        {'postgresql_partition_by': 'RANGE (date)'},
     )
     
 class Ranking(Base):
@@ -157,12 +220,12 @@ class Ranking(Base):
     """
     __tablename__ = 'ranking'
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    board: Mapped[str] = mapped_column(String(20))
-    part: Mapped[str] = mapped_column(String(20))
-    issue: Mapped[str] = mapped_column(SmallInteger, index=True)
-    rank: Mapped[int] = mapped_column(Integer, index=True)
-    song_id: Mapped[int] = mapped_column(Integer, ForeignKey('song.id'), index=True)
-    bvid: Mapped[str] = mapped_column(String(12), index=True)
+    board: Mapped[str] = mapped_column(CodeEnum(BOARD_CODES))
+    part: Mapped[str] = mapped_column(CodeEnum(PART_CODES))
+    issue: Mapped[str] = mapped_column(SmallInteger)
+    rank: Mapped[int] = mapped_column(Integer)
+    song_id: Mapped[int] = mapped_column(Integer, ForeignKey('song.id'))
+    aid: Mapped[int] = mapped_column(BigInteger, index=True)
     count: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     point: Mapped[int] = mapped_column(Integer)
     view: Mapped[int] = mapped_column(Integer)
@@ -173,15 +236,74 @@ class Ranking(Base):
     favorite_rank: Mapped[int] = mapped_column(Integer)
     coin_rank: Mapped[int] = mapped_column(Integer)
     like_rank: Mapped[int] = mapped_column(Integer)
+    # 以下两项在导入时计算，见 app/crud/update.py 的 update_ranking_links
+    # 同一首歌在上一期的排名。重新导入时上一期的行会被删除重建，所以不加外键，由导入时刷新
+    last_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    # 周刊、月刊：这首歌在这一期包含的每一期日刊、周刊中的排名，按期数排列。只在分期排名时读取
+    seperates: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=True, deferred=True)
 
     song: Mapped["Song"] = relationship("Song", back_populates="rankings")
-    video: Mapped["Video"] = relationship("Video", primaryjoin="Ranking.bvid == foreign(Video.bvid)", back_populates="rankings")
+    video: Mapped["Video"] = relationship("Video", primaryjoin="Ranking.aid == foreign(Video.aid)", back_populates="rankings")
+    last: Mapped["Ranking"] = relationship("Ranking", primaryjoin="foreign(Ranking.last_id) == remote(Ranking.id)")
+
+    @reconstructor
+    def init_on_load(self):
+        self.bvid = av2bv(self.aid)
     
+    # 索引对应 app/crud/select.py 中的查询，改动后用 check_plans.py 检查执行计划
     __table_args__ = (
-        Index('idx_ranking_board_part', 'board', 'part'),
+        # 某一期的排名按 rank 排序，也用于取最新一期和前五名
+        Index('idx_ranking_board_part_issue_rank', 'board', 'part', 'issue', 'rank'),
+        # 上一期排名、分期排名的自连接，以及歌曲的历史排名
+        Index('idx_ranking_song_board_part_issue', 'song_id', 'board', 'part', 'issue'),
     )
     
 
+class RankingDisplay(Base):
+    """
+    排名页面的读模型，由导入和编辑时维护，见 app/crud/display.py。
+    每行对应一条 Ranking（id 相同），歌曲、artist、视频信息和上一期排名都已经展开，
+    一页排名只需要一条查询，不需要 selectinload
+    """
+    __tablename__ = 'ranking_display'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    board: Mapped[str] = mapped_column(CodeEnum(BOARD_CODES))
+    part: Mapped[str] = mapped_column(CodeEnum(PART_CODES))
+    issue: Mapped[int] = mapped_column(SmallInteger)
+    rank: Mapped[int] = mapped_column(Integer)
+    song_id: Mapped[int] = mapped_column(Integer)
+    aid: Mapped[int] = mapped_column(BigInteger)
+    count: Mapped[int] = mapped_column(SmallInteger, nullable=True)
+    point: Mapped[int] = mapped_column(Integer)
+    view: Mapped[int] = mapped_column(Integer)
+    favorite: Mapped[int] = mapped_column(Integer)
+    coin: Mapped[int] = mapped_column(Integer)
+    like: Mapped[int] = mapped_column(Integer)
+    view_rank: Mapped[int] = mapped_column(Integer)
+    favorite_rank: Mapped[int] = mapped_column(Integer)
+    coin_rank: Mapped[int] = mapped_column(Integer)
+    like_rank: Mapped[int] = mapped_column(Integer)
+    last_rank: Mapped[int] = mapped_column(Integer, nullable=True)
+    seperates: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=True)
+
+    name: Mapped[str] = mapped_column(Text)
+    display_name: Mapped[str] = mapped_column(Text, nullable=True)
+    type: Mapped[str] = mapped_column(String(4))
+    vocalists: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=True)
+    producers: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=True)
+    synthesizers: Mapped[list[str]] = mapped_column(ARRAY(Text), nullable=True)
+
+    bvid: Mapped[str] = mapped_column(String(12))
+    title: Mapped[str] = mapped_column(Text, nullable=True)
+    thumbnail: Mapped[str] = mapped_column(Text, nullable=True)
+    pubdate: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=True)
+    uploader: Mapped[str] = mapped_column(Text, nullable=True)
+
+    __table_args__ = (
+        Index('idx_ranking_display_board_part_issue_rank', 'board', 'part', 'issue', 'rank'),
+    )
+
+
 TABLE_MAP = {
     'song': Song,
     'video': Video,
@@ -2,11 +2,14 @@ from fastapi import APIRouter, Body, Depends, HTTPException
 
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import TABLE_MAP, REL_MAP, Video, Song, Video
+from app.models import TABLE_MAP, REL_MAP, Video, Song, Video, Ranking
 from app.session import get_async_session
 from app.crud.edit import check_artist
+from app.crud.display import refresh_ranking_display
 from app.schemas.edit import ConfirmRequest, SongEdit, VideoEdit
 from app.utils.task import task_manager
+from app.utils.cache import import_cache, import_lock
+from app.stores.ranking_cache import ranking_cache
 
 router = APIRouter(prefix='/edit', tags=['edit'])
 
@@ -54,8 +57,12 @@ async def edit_song(
         )
     )
     
-    await session.execute(stmt)
-    await session.commit()
+    async with import_lock:
+        await session.execute(stmt)
+        await refresh_ranking_display(session, Ranking.song_id == song.id)
+        await session.commit()
+        import_cache.rename_song(song.id, song.name)
+    ranking_cache.clear()
 
 @router.post("/video")
 async def edit_video(
@@ -72,4 +79,6 @@ async def edit_video(
     )
     
     await session.execute(stmt)
+    await refresh_ranking_display(session, Ranking.aid.in_(select(Video.aid).where(Video.bvid == video.bvid)))
     await session.commit()
+    ranking_cache.clear()
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Query, Depends
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.session import get_async_session
 from app.crud.search import normal_search
+from app.crud import song_json
 from typing import Literal
 
 router = APIRouter(prefix='/search', tags=['search'])
@@ -15,5 +17,7 @@ async def search(
     page_size: int = Query(20, ge=1),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await normal_search(type, keyword, includeEmpty, page, page_size, session)
+    loader = song_json.song_loader('search') if type == 'song' else 'orm'
+    data = await normal_search(type, keyword, includeEmpty, page, page_size, session, loader)
+    return Response(content=song_json.render(data), media_type="application/json") if loader == 'json' else data
     
@@ -1,80 +1,151 @@
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import Response
+from pydantic import BaseModel
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.session import get_async_session
-from app.crud.select import get_songs_detail, get_artist_songs, get_ranking, get_artist, get_song, get_song_by_achievement, get_video_snapshot_by_date, get_song_ranking, get_latest_ranking, get_ranking_top5, get_song_snapshot, get_video
+from app.models import BoardName, PartName
+from app.crud.select import get_songs_detail, get_artist_songs, get_ranking, get_artist, get_song, get_song_by_achievement, get_video_snapshot_by_date, get_song_ranking, get_latest_ranking, get_ranking_top5, get_song_snapshot, get_video, get_ranking_display
+from app.utils.cursor import CURSOR_DESCRIPTION
+from app.crud import song_json, fast
+from app.stores.ranking_cache import ranking_cache
+from app.schemas.select import (
+    Item, Page, RankingPage, RankingOut, RankingRowOut, SeperateRankingRowOut, RankingDisplayOut, Top5Out, AchievementOut,
+    SongDetailOut, VideoOut, SnapshotOut, ArtistOut, dump_json
+)
 from typing import Literal
 
 router = APIRouter(prefix='/select', tags=['select'])
 
-@router.get("/songs", description='不要一次查太多')
+
+def json_response(model: BaseModel) -> Response:
+    return Response(content=dump_json(model), media_type="application/json")
+
+
+@router.get("/songs", description='不要一次查太多', response_model=Page[SongDetailOut])
 async def songs_detail(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):    
-    return await get_songs_detail(page, page_size, session)
+    loader = song_json.song_loader('songs')
+    data = await get_songs_detail(page, page_size, session, cursor, loader)
+    if loader == 'json':
+        return Response(content=song_json.render(data), media_type="application/json")
+    return json_response(Page[SongDetailOut].model_validate(data, from_attributes=True))
 
-@router.get("/artist_songs")
+@router.get("/artist_songs", response_model=Page[SongDetailOut])
 async def artist_songs(
     artist_type: str = Query(),
     artist_id: int = Query(),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_artist_songs(artist_type, artist_id, page, page_size, session)
+    loader = song_json.song_loader('artist_songs')
+    data = await get_artist_songs(artist_type, artist_id, page, page_size, session, cursor, loader)
+    if loader == 'json':
+        return Response(content=song_json.render(data), media_type="application/json")
+    return json_response(Page[SongDetailOut].model_validate(data, from_attributes=True))
 
-@router.get("/ranking")
+@router.get("/ranking", response_model=RankingPage[RankingRowOut] | RankingPage[SeperateRankingRowOut])
 async def ranking(
-    board: str = Query("vocaloid-daily"),
-    part: str = Query("main"),
+    board: BoardName = Query("vocaloid-daily"),
+    part: PartName = Query("main"),
     issue: int | None = Query(default=None, ge=1),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
     order_type: Literal['score','view','favorite','coin','like'] = Query(default='score'),
     seperate: bool = Query(False),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_ranking(board, part, issue, page, page_size, order_type, seperate, session)
+    """
+    一页排名，每行嵌套完整的歌曲、artist、视频、UP主和上一期排名对象。
+    排名页面只需要名称等展示字段时改用 /ranking/display：一条查询读出整页，不需要装载嵌套对象。
+    两者的响应结构不同，这个接口保持原样，前端迁移后再考虑下线
+    """
+    # 导入后的排名不会再变，直接返回缓存的响应，重新导入这一期时失效
+    key = (board, part, issue, order_type, seperate, page, page_size, cursor)
+    body = ranking_cache.get(key)
+    if body is None:
+        generation = ranking_cache.generation
+        if fast.enabled('ranking'):
+            body, song_ids = await fast.get_ranking(board, part, issue, page, page_size, order_type, seperate, session, cursor)
+            ranking_cache.store(key, body, song_ids, generation)
+        else:
+            data = await get_ranking(board, part, issue, page, page_size, order_type, seperate, session, cursor)
+            row = SeperateRankingRowOut if seperate else RankingRowOut
+            body = ranking_cache.set(key, RankingPage[row].model_validate(data, from_attributes=True), generation)
+    return Response(content=body, media_type="application/json")
     
-@router.get('/ranking/top5')
+@router.get('/ranking/display', response_model=RankingPage[RankingDisplayOut])
+async def ranking_display(
+    board: BoardName = Query("vocaloid-daily"),
+    part: PartName = Query("main"),
+    issue: int | None = Query(default=None, ge=1),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1),
+    order_type: Literal['score','view','favorite','coin','like'] = Query(default='score'),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    和 /ranking 相同的一页排名，但每行是展开后的平铺字段（歌曲名、artist 名称列表、UP主、上一期排名、分期排名等），
+    由 ranking_display 表一条查询得到。
+    和 /ranking 的区别：artist 和UP主只有名称，上一期排名只有 last_rank，视频只有 bvid、标题、封面和发布时间
+    """
+    data = await get_ranking_display(board, part, issue, page, page_size, order_type, session, cursor)
+    return json_response(RankingPage[RankingDisplayOut].model_validate(data))
+
+@router.get('/ranking/top5', response_model=Page[Top5Out])
 async def ranking_top5(
-    board: str = Query("vocaloid-daily"),
-    part: str = Query("main"),
+    board: BoardName = Query("vocaloid-daily"),
+    part: PartName = Query("main"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_ranking_top5(board, part, page, page_size, session)
+    data = await get_ranking_top5(board, part, page, page_size, session)
+    return json_response(Page[Top5Out].model_validate(data, from_attributes=True))
     
     
 @router.get('/latest_ranking')
 async def latest_ranking(
-    board: str = Query("vocaloid-daily"),
+    board: BoardName = Query("vocaloid-daily"),
     session: AsyncSession = Depends(get_async_session)
 ):
     return await get_latest_ranking(board, session)
     
-@router.get("/song")
+@router.get("/song", response_model=Item[SongDetailOut])
 async def song(
     id: int = Query(),
     session: AsyncSession = Depends(get_async_session)
 ):    
-    return await get_song(id, session)
+    if fast.enabled('song'):
+        return Response(content=await fast.get_song(id, session), media_type="application/json")
+    loader = song_json.song_loader('song')
+    data = await get_song(id, session, loader)
+    if loader == 'json':
+        return Response(content=song_json.render(data), media_type="application/json")
+    return json_response(Item[SongDetailOut].model_validate(data, from_attributes=True))
 
-@router.get("/song/ranking")
+@router.get("/song/ranking", response_model=Page[RankingOut])
 async def song_ranking(
     id: int = Query(),
-    board: str = Query("vocaloid-daily"),
+    board: BoardName = Query("vocaloid-daily"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_song_ranking(id, board, page, page_size, session)
+    data = await get_song_ranking(id, board, page, page_size, session, cursor)
+    return json_response(Page[RankingOut].model_validate(data, from_attributes=True))
 
-@router.get("/song/by_achievement")
+@router.get("/song/by_achievement", response_model=Page[AchievementOut])
 async def song_by_achievement(
     item: Literal['view', 'favorite', 'coin', 'like'] = Query(...),
     level: int = Query(1, ge=1, le=4),
@@ -82,49 +153,65 @@ async def song_by_achievement(
     page_size: int = Query(20, ge=1),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_song_by_achievement(item, level, page, page_size, session)
+    data = await get_song_by_achievement(item, level, page, page_size, session)
+    return json_response(Page[AchievementOut].model_validate(data, from_attributes=True))
 
-@router.get("/song/by_artist")
+@router.get("/song/by_artist", response_model=Page[SongDetailOut])
 async def song_by_artist(
     type: Literal['vocalist', 'producer', 'synthesizer', 'uploader'] = Query(...),
     id: int = Query(),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_artist_songs(type, id, page, page_size, session)
+    loader = song_json.song_loader('song_by_artist')
+    data = await get_artist_songs(type, id, page, page_size, session, cursor, loader)
+    if loader == 'json':
+        return Response(content=song_json.render(data), media_type="application/json")
+    return json_response(Page[SongDetailOut].model_validate(data, from_attributes=True))
 
-@router.get("/artist")
+@router.get("/artist", response_model=Item[ArtistOut])
 async def artist(
     type: Literal['vocalist', 'producer', 'synthesizer', 'uploader'] = Query(...),
     id: int = Query(),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_artist(type, id, session)
+    data = await get_artist(type, id, session)
+    return json_response(Item[ArtistOut].model_validate(data, from_attributes=True))
     
-@router.get("/video")
+@router.get("/video", response_model=Item[VideoOut])
 async def video(
     bvid: str = Query(),
     session: AsyncSession = Depends(get_async_session)
 ):    
-    return await get_video(bvid, session)
+    if fast.enabled('video'):
+        return Response(content=await fast.get_video(bvid, session), media_type="application/json")
+    data = await get_video(bvid, session)
+    return json_response(Item[VideoOut].model_validate(data, from_attributes=True))
 
 
-@router.get("/video/snapshot")
+@router.get("/video/snapshot", response_model=Page[SnapshotOut])
 async def song_snapshot(
     bvid: str = Query(),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1),
+    cursor: str | None = Query(None, description=CURSOR_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_song_snapshot(bvid, page, page_size, session)
+    if fast.enabled('snapshot'):
+        body = await fast.get_song_snapshot(bvid, page, page_size, session, cursor)
+        return Response(content=body, media_type="application/json")
+    data = await get_song_snapshot(bvid, page, page_size, session, cursor)
+    return json_response(Page[SnapshotOut].model_validate(data, from_attributes=True))
 
 
-@router.get("/video/snapshot/by_date")
+@router.get("/video/snapshot/by_date", response_model=Item[list[SnapshotOut]])
 async def video_snapshot_by_date(
     bvid: str = Query(),
     start_date: str = Query("2025-10-20"),
     end_date: str = Query("2025-10-24"),
     session: AsyncSession = Depends(get_async_session)
 ):
-    return await get_video_snapshot_by_date(bvid, start_date, end_date, session)
\ No newline at end of file
+    data = await get_video_snapshot_by_date(bvid, start_date, end_date, session)
+    return json_response(Item[list[SnapshotOut]].model_validate(data, from_attributes=True))
\ No newline at end of file
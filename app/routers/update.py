@@ -4,23 +4,51 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.session import get_async_session
-from app.models import Song, Producer
+from app.models import Song, Producer, BoardName, PartName
 
-from ..utils import validate_excel, read_excel
+from ..utils import validate_excel, validate_excel_file, read_excel
 from ..utils.filename import generate_board_file_path
-from ..utils.cache import Cache
+from ..utils.cache import Cache, import_cache, import_lock
 from ..crud.insert import execute_import_rankings, execute_import_snapshots
+from ..crud.update import backfill_video_streaks, rebuild_video_aggregates, rebuild_ranking_links
+from ..crud.partition import ensure_snapshot_partitions
+from ..crud.display import rebuild_ranking_display
+from ..crud.bulk import execute_bulk_import_snapshots, execute_staged_import_rankings, execute_delta_import_rankings
 
 import pandas as pd
 from datetime import datetime, timedelta
+from typing import Literal
 
 
 router = APIRouter(prefix='/update', tags=['update'])
 
+CACHE_MODE_DESCRIPTION = "full: 使用进程级缓存（整表加载）；lazy: 只查询本次文件中出现的键"
+
+ENGINE_DESCRIPTION = "batch: 逐批导入；staged: 整个文件 COPY 到暂存表后用集合式 SQL 一次合并；delta: 同 staged，但只写入有变化的行"
+
+def get_import_cache(cache_mode: Literal['full', 'lazy']) -> Cache:
+    return import_cache if cache_mode == 'full' else Cache('lazy')
+
+async def locked_events(events):
+    """
+    持有导入锁把 SSE 事件流转发出去，客户端断开时生成器关闭，锁随之释放
+    """
+    async with import_lock:
+        async for event in events:
+            yield event
+
+RANKING_IMPORTERS = {
+    'batch': execute_import_rankings,
+    'staged': execute_staged_import_rankings,
+    'delta': execute_delta_import_rankings,
+}
+
 @router.get('/snapshots')
 async def import_snapshots(
     date: str = Query(description="格式类似'2025-10-28'"),
     old: bool = Query(False),
+    bulk: bool = Query(False, description="使用 COPY 批量导入"),
+    cache_mode: Literal['full', 'lazy'] = Query('full', description=CACHE_MODE_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -28,48 +56,117 @@ async def import_snapshots(
     规定，在插入排名记录之后执行。
     除了更新数据记录之外，最多只会插入新视频。
     """
-    await execute_import_snapshots(session, date, not old)
+    async with import_lock:
+        if bulk:
+            return await execute_bulk_import_snapshots(session, date, not old)
+        return await execute_import_snapshots(session, date, not old, get_import_cache(cache_mode))
         
 
 @router.get('/batch_snapshots')
 async def batch_import_snapshots(
     start_date: str = Query(),
     end_date: str = Query(),
+    bulk: bool = Query(False, description="使用 COPY 批量导入"),
+    cache_mode: Literal['full', 'lazy'] = Query('full', description=CACHE_MODE_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    cache = Cache()
-    
+    cache = get_import_cache(cache_mode)
     start_date_ = datetime.strptime(start_date, "%Y-%m-%d")
     end_date_ = datetime.strptime(end_date, "%Y-%m-%d")
     date = start_date_
-    while date <= end_date_:
-        print(f'正在处理：{date.strftime("%Y-%m-%d")}')
-        await execute_import_snapshots(session, date.strftime("%Y-%m-%d"), False, cache)
+    async with import_lock:
+        while date <= end_date_:
+            print(f'正在处理：{date.strftime("%Y-%m-%d")}')
+            if bulk:
+                await execute_bulk_import_snapshots(session, date.strftime("%Y-%m-%d"), False)
+            else:
+                await execute_import_snapshots(session, date.strftime("%Y-%m-%d"), False, cache)
+            date += timedelta(days=1)
+
+
+@router.get('/backfill_streaks')
+async def backfill_streaks(
+    start_date: str = Query(description="格式类似'2025-10-28'"),
+    end_date: str = Query(),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    重算一段日期内的 streak，结果等同于按日期顺序逐日导入时的计算。
+    用于补导历史数据之后。
+    """
+    return await backfill_video_streaks(
+        session,
+        datetime.strptime(start_date, "%Y-%m-%d").date(),
+        datetime.strptime(end_date, "%Y-%m-%d").date()
+    )
+
+
+@router.get('/rebuild_video_aggregates')
+async def rebuild_aggregates(
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    从 snapshot 表重算 video 的最新数据和最高播放。平时导入数据时会增量维护，不需要执行。
+    """
+    return await rebuild_video_aggregates(session)
+
+
+@router.get('/rebuild_ranking_links')
+async def rebuild_links(
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    重算所有排名的上一期（last_id）和分期排名（seperates）。平时导入排名时会增量维护，不需要执行。
+    """
+    return await rebuild_ranking_links(session)
+
+
+@router.get('/rebuild_ranking_display')
+async def rebuild_display(
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    重算整个 ranking_display。平时导入排名和编辑时会增量维护，不需要执行。
+    """
+    return await rebuild_ranking_display(session)
+
+
+@router.get('/snapshot_partitions')
+async def create_snapshot_partitions(
+    start_date: str = Query(description="格式类似'2025-10-28'"),
+    end_date: str = Query(),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    提前创建 snapshot 的月分区。导入数据时会自动创建当月分区，一般不需要手动执行。
+    """
+    created = await ensure_snapshot_partitions(
+        session,
+        datetime.strptime(start_date, "%Y-%m-%d").date(),
+        datetime.strptime(end_date, "%Y-%m-%d").date()
+    )
+    await session.commit()
+    return {'created': created}
 
 
 @router.get('/ranking')
 async def import_rankings(
-    board: str = Query(),
-    part: str = Query('main'),
+    board: BoardName = Query(),
+    part: PartName = Query('main'),
     issue: int = Query(),
     old: bool = Query(False),
+    cache_mode: Literal['full', 'lazy'] = Query('full', description=CACHE_MODE_DESCRIPTION),
+    engine: Literal['batch', 'staged', 'delta'] = Query('batch', description=ENGINE_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session),
 ):
     """
     插入排名记录。会同时更新曲目。
+    严格模式的验证在导入函数中进行。
     """
     strict = not old
-    df: pd.DataFrame = read_excel(
-        generate_board_file_path(board, part, issue),
-    ).assign( board = board, part = part, issue = issue)
-
-    if strict:
-        validate_excel(df)
-    
-    cache = Cache()
     
     return StreamingResponse(
-        execute_import_rankings(session, board, part, issue, strict, cache),
+        locked_events(RANKING_IMPORTERS[engine](session, board, part, issue, strict, get_import_cache(cache_mode))),
         media_type='text/event-stream'
     )
     
@@ -78,15 +175,11 @@ async def import_rankings(
 
 @router.get('/check_ranking')
 async def check_ranking(
-    board: str = Query(),
-    part: str = Query('main'),
+    board: BoardName = Query(),
+    part: PartName = Query('main'),
     issue: int = Query()
 ):
-    df: pd.DataFrame = read_excel(
-        generate_board_file_path(board, part, issue),
-    ).assign( board = board, part = part, issue = issue)
-    
-    errors = validate_excel(df)
+    errors = validate_excel_file(generate_board_file_path(board, part, issue))
     return {
         'detail': '\n'.join(errors)
     }
@@ -95,14 +188,18 @@ async def check_ranking(
 
 @router.get('/batch_ranking')
 async def batch_import_ranking(
-    board: str = Query(),
-    part: str = Query('main'),
+    board: BoardName = Query(),
+    part: PartName = Query('main'),
     start_issue: int = Query(),
     end_issue: int = Query(),
+    cache_mode: Literal['full', 'lazy'] = Query('full', description=CACHE_MODE_DESCRIPTION),
+    engine: Literal['batch', 'staged', 'delta'] = Query('batch', description=ENGINE_DESCRIPTION),
     session: AsyncSession = Depends(get_async_session)
 ):
-    cache = Cache()
-    for issue in range(start_issue, end_issue+1):
-        print(f'正在处理：{issue}期')
-        async for s in execute_import_rankings(session, board, part, issue, False, cache):
-            print(s)
+    cache = get_import_cache(cache_mode)
+    importer = RANKING_IMPORTERS[engine]
+    async with import_lock:
+        for issue in range(start_issue, end_issue+1):
+            print(f'正在处理：{issue}期')
+            async for s in importer(session, board, part, issue, False, cache):
+                print(s)
@@ -2,7 +2,9 @@ from fastapi import FastAPI, UploadFile, File, Form, HTTPException, APIRouter
 from fastapi.responses import JSONResponse
 import shutil
 import os
+import asyncio
 from datetime import datetime
+from app.utils import read_excel
 from app.utils.filename import extract_file_name, generate_board_file_path, generate_data_file_path, BoardIdentity, DataIdentity
 
 UPLOAD_DIR = "/var/www/Vocabili-database/data"
@@ -30,6 +32,12 @@ async def upload_file(file: UploadFile = File(...)):
         with open(save_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
+        # 预先生成 Parquet 旁路缓存，之后的验证和导入不用再解析 xlsx
+        try:
+            await asyncio.to_thread(read_excel, save_path)
+        except Exception as e:
+            print("生成旁路缓存出错:", e)
+
         return JSONResponse({
             "url": save_path,
             "name": filename,
@@ -0,0 +1,187 @@
+"""
+/select 接口的响应结构。
+
+字段和原来直接返回 ORM 对象时相同，但只读取这里列出的属性，不会触发延迟加载；
+序列化用 dump_json，不再经过 jsonable_encoder。
+"""
+
+from datetime import datetime, date
+from typing import Generic, TypeVar
+
+import orjson
+from pydantic import BaseModel, ConfigDict
+
+from app.schemas.artist import BasicArtistOut
+
+T = TypeVar('T')
+
+
+class ORMOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ArtistOut(BasicArtistOut, ORMOut):
+    vocadb_id: int | None
+
+
+class VideoOut(ORMOut):
+    bvid: str
+    aid: int
+    title: str | None
+    pubdate: datetime | None
+    uploader_id: int | None
+    song_id: int
+    copyright: int | None
+    thumbnail: str | None
+    duration: int | None
+    page: int | None
+    disabled: bool | None
+    streak: int | None
+    streak_date: date | None
+    latest_date: date | None
+    latest_view: int | None
+    latest_favorite: int | None
+    latest_coin: int | None
+    latest_like: int | None
+    max_view: int | None
+
+
+class VideoWithUploaderOut(VideoOut):
+    uploader: ArtistOut | None
+
+
+class SongOut(ORMOut):
+    id: int
+    name: str
+    display_name: str | None
+    vocadb_id: int | None
+    type: str
+
+
+class SongWithArtistsOut(SongOut):
+    producers: list[ArtistOut]
+    synthesizers: list[ArtistOut]
+    vocalists: list[ArtistOut]
+
+
+class SongDetailOut(SongWithArtistsOut):
+    """
+    song_load_full 加载的歌曲
+    """
+    videos: list[VideoWithUploaderOut]
+
+
+class SnapshotOut(ORMOut):
+    aid: int
+    bvid: str
+    date: date
+    view: int
+    favorite: int
+    coin: int
+    like: int
+
+
+class RankingOut(ORMOut):
+    id: int
+    board: str
+    part: str
+    issue: int
+    rank: int
+    song_id: int
+    aid: int
+    bvid: str
+    count: int | None
+    point: int
+    view: int
+    favorite: int
+    coin: int
+    like: int
+    view_rank: int
+    favorite_rank: int
+    coin_rank: int
+    like_rank: int
+    last_id: int | None
+
+
+class RankingWithSongOut(RankingOut):
+    song: SongWithArtistsOut
+    video: VideoWithUploaderOut | None
+
+
+class RankingRowOut(RankingWithSongOut):
+    last: RankingOut | None
+
+
+class SeperateRankingRowOut(RankingRowOut):
+    """
+    seperates 是延迟加载的列，只有分期排名时才读取
+    """
+    seperates: list[int] | None
+
+
+class RankingDisplayOut(BaseModel):
+    """
+    ranking_display 的一行：歌曲、artist、视频信息展开成平铺字段，artist 和UP主只有名称
+    """
+    id: int
+    board: str
+    part: str
+    issue: int
+    rank: int
+    song_id: int
+    aid: int
+    count: int | None
+    point: int
+    view: int
+    favorite: int
+    coin: int
+    like: int
+    view_rank: int
+    favorite_rank: int
+    coin_rank: int
+    like_rank: int
+    last_rank: int | None
+    seperates: list[int] | None
+    name: str
+    display_name: str | None
+    type: str
+    vocalists: list[str] | None
+    producers: list[str] | None
+    synthesizers: list[str] | None
+    bvid: str
+    title: str | None
+    thumbnail: str | None
+    pubdate: datetime | None
+    uploader: str | None
+
+
+class Top5Out(BaseModel):
+    issue: int
+    rankings: list[RankingWithSongOut]
+
+
+class AchievementOut(BaseModel):
+    song: SongWithArtistsOut
+    video: VideoWithUploaderOut
+    snapshot: SnapshotOut
+
+
+class Item(BaseModel, Generic[T]):
+    data: T
+
+
+class Page(BaseModel, Generic[T]):
+    data: list[T]
+    total: int
+    next_cursor: str | None = None
+
+
+class RankingPage(Page[T], Generic[T]):
+    status: str
+
+
+def dump_json(model: BaseModel) -> bytes:
+    """
+    响应结构转成字典后交给 orjson 编码，日期时间等的格式和 app/crud/fast.py 的快速路径相同
+    """
+    return orjson.dumps(model.model_dump())
@@ -1,5 +1,6 @@
 from collections.abc import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncConnection
+from sqlalchemy.engine import Result
 from sqlalchemy import event
 from app.config import settings
 import asyncio
@@ -12,15 +13,71 @@ DATABASE_URL = f"postgresql+asyncpg://{dbuser}:{dbpassword}@{dbhost}:5432/vocabi
 
 # 数据库引擎
 
-engine = create_async_engine( DATABASE_URL)
+engine = create_async_engine(DATABASE_URL, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW)
 
 # 会话工厂
 
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+# execute_concurrently 专用的小连接池，和请求用的连接池分开。
+# 请求持有自己的连接再去取并发查询的连接，两边不会互相占满而卡住；连接数按名额预留，不会在这里排队
+concurrent_engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=max(settings.CONCURRENT_QUERY_CONNECTIONS, 1),
+    max_overflow=0
+)
+concurrent_session_maker = async_sessionmaker(concurrent_engine, expire_on_commit=False)
+
+# 正在被并发查询占用的 concurrent_engine 连接数
+concurrent_connections_in_use = 0
+
 # 数据库会话。
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
+
+async def get_driver_connection(session: AsyncSession):
+    """
+    取得 session 当前连接底层的 asyncpg 连接，和 session 处在同一个事务中。
+    """
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    return raw.driver_connection
+
+
+async def execute_concurrently(session: AsyncSession, *stmts) -> list[Result]:
+    """
+    并发执行互不依赖的只读语句，按顺序返回各自的结果（已经缓冲，可以直接读取）。
+    第一条在 session 上执行，其余的各自从 concurrent_engine 另取一个连接，耗时取决于最慢的一条而不是总和。
+
+    整个进程同时最多额外占用 CONCURRENT_QUERY_CONNECTIONS 个连接，名额不够时不排队，直接按顺序执行。
+    session 绑定在某个连接上时（比如 check_plans.py 在一个事务里写入了测试数据），其他连接看不到这些数据，也按顺序执行。
+    """
+    global concurrent_connections_in_use
+    extra = len(stmts) - 1
+    if (
+        isinstance(session.bind, AsyncConnection)
+        or concurrent_connections_in_use + extra > settings.CONCURRENT_QUERY_CONNECTIONS
+    ):
+        return [await session.execute(stmt) for stmt in stmts]
+
+    async def execute_separately(stmt):
+        async with concurrent_session_maker() as other:
+            return await other.execute(stmt)
+
+    # 检查和占用名额之间没有 await，不会被其他请求插进来
+    concurrent_connections_in_use += extra
+    try:
+        # 等所有语句结束再归还名额，出错时也一样
+        results = await asyncio.gather(
+            session.execute(stmts[0]), *map(execute_separately, stmts[1:]),
+            return_exceptions=True
+        )
+    finally:
+        concurrent_connections_in_use -= extra
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
@@ -0,0 +1,108 @@
+"""
+/select/ranking 的响应缓存。
+
+一期排名导入之后，除非重新导入，页面内容不会再变，所以把整个响应序列化成字节缓存起来，
+命中时直接返回，不再执行自连接、分期排名、selectinload 和 count。
+
+失效规则：
+- 导入某一期排名：这一期、下一期（last 字段引用这一期）、不指定期数的请求（可能就是这一期）、
+  上一级榜单的分期排名（seperates 字段引用这一期），以及包含本次导入涉及的歌曲的页面
+- 导入数据记录、编辑歌曲/视频/artist：响应里嵌套了视频的最新数据和歌曲信息，全部清空
+"""
+
+from collections import OrderedDict
+from collections.abc import Iterable
+import json
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from ..utils.date import SEPERATE_BOARDS
+from ..schemas.select import dump_json
+
+# (board, part, issue, order_type, seperate, page, page_size, cursor)
+type RankingKey = tuple[str, str, int | None, str, bool, int, int, str | None]
+
+# 分期排名引用的下级榜单 -> 上级榜单
+SEPERATE_PARENT = {child: parent for parent, child in SEPERATE_BOARDS.items()}
+
+
+class RankingCache:
+    """
+    按最近使用淘汰的响应缓存。每一项记录序列化后的响应和其中出现的歌曲。
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self._entries: OrderedDict[RankingKey, tuple[bytes, frozenset[int]]] = OrderedDict()
+        self._max_entries = max_entries
+        # 每次失效加一。查询开始后发生过失效，查询结果就不能再写入缓存
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: RankingKey) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: RankingKey, page: BaseModel, generation: int) -> bytes:
+        """
+        序列化响应（app/schemas/select.py 的 RankingPage）并写入缓存，返回序列化后的字节。
+        generation 是开始查询时的 self.generation。
+        """
+        body = dump_json(page)
+        self.store(key, body, (r.song_id for r in page.data), generation)
+        return body
+
+    def store(self, key: RankingKey, body: bytes, song_ids: Iterable[int], generation: int):
+        """
+        写入已经序列化好的响应，song_ids 是其中出现的歌曲
+        """
+        if generation == self.generation:
+            self._entries[key] = (body, frozenset(song_ids))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_issue(self, board: str, part: str, issue: int, song_ids: Iterable[int] | None = None):
+        """
+        某一期排名导入后调用。song_ids 是导入时可能修改过的歌曲，包含它们的页面也一起失效。
+        """
+        self.generation += 1
+        parent = SEPERATE_PARENT.get(board)
+        song_ids = frozenset(song_ids or ())
+        for key in list(self._entries):
+            k_board, k_part, k_issue, _, k_seperate = key[:5]
+            if (
+                (k_board == board and k_part == part and k_issue in (None, issue, issue + 1))
+                or (k_seperate and k_board == parent and k_part == part)
+                or not self._entries[key][1].isdisjoint(song_ids)
+            ):
+                del self._entries[key]
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def render(content) -> bytes:
+    """
+    和 FastAPI 默认的 JSONResponse 输出相同的字节，benchmark.py 用它作为对照
+    """
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+ranking_cache = RankingCache()
@@ -1,5 +1,11 @@
 import pandas  as pd
+import openpyxl
+import pyarrow.parquet as pq
+import os
 from fastapi import HTTPException
+from typing import Iterator
+
+from .sidecar import sidecar_path, load_sidecar, iter_sidecar, save_sidecar, SidecarWriter
 
 def validate_excel(df: pd.DataFrame):
     df['__row__'] = df.index + 2
@@ -16,19 +22,12 @@ def validate_excel(df: pd.DataFrame):
     
     return errors
         
-def read_excel(filepath: str) -> pd.DataFrame:
+EXCEL_STR_COLUMNS = ['title', 'name', 'type', 'author', 'synthesizer', 'vocal', 'uploader']
+
+def normalize_excel(df: pd.DataFrame) -> pd.DataFrame:
     """
-    读取是标准的数据文件或排名文件。对常用字段进行预处理。
+    对数据文件或排名文件的常用字段进行预处理。
     """
-    df = pd.read_excel(filepath, dtype={
-        'title': str,
-        'name': str, 
-        'type':str, 
-        'author':str, 
-        'synthesizer': str,
-        'vocal': str,
-        'uploader': str
-    })
     df['pubdate'] = pd.to_datetime(
         df['pubdate'],
         format='%Y-%m-%d %H:%M:%S',   # 如果格式固定，指定 format 会更快
@@ -38,6 +37,105 @@ def read_excel(filepath: str) -> pd.DataFrame:
     
     return df
 
+def read_excel(filepath: str) -> pd.DataFrame:
+    """
+    读取是标准的数据文件或排名文件。对常用字段进行预处理。
+    
+    优先读取 Parquet 旁路缓存，没有的话解析 xlsx 并写入缓存。
+    """
+    df = load_sidecar(filepath)
+    if df is not None:
+        return df
+    
+    df = normalize_excel(pd.read_excel(filepath, dtype={col: str for col in EXCEL_STR_COLUMNS}))
+    save_sidecar(filepath, df)
+    
+    return df
+
+def iter_excel(filepath: str, batch_size: int) -> Iterator[pd.DataFrame]:
+    """
+    逐批读取数据文件或排名文件，每批的预处理和 read_excel 相同。
+    
+    使用 openpyxl 的只读模式逐行解析，内存占用只和 batch_size 有关。
+    每批 DataFrame 的 index 是行在文件中的序号（表头之后从 0 开始），validate_excel 报告的行号不受分批影响。
+    全空的行会被跳过。
+    
+    有 Parquet 旁路缓存时直接逐批读缓存；没有的话边解析边写入缓存，完整读完才会生效。
+    """
+    batches = iter_sidecar(filepath, batch_size)
+    if batches is not None:
+        yield from batches
+        return
+    
+    writer = SidecarWriter(filepath)
+    completed = False
+    try:
+        for df in _iter_workbook(filepath, batch_size):
+            writer.write(df)
+            yield df
+        completed = True
+    finally:
+        if completed:
+            writer.close()
+        else:
+            writer.abort()
+
+def _iter_workbook(filepath: str, batch_size: int) -> Iterator[pd.DataFrame]:
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) for col in header]
+        width = len(columns)
+        
+        batch: list[tuple] = []
+        index: list[int] = []
+        for i, row in enumerate(rows):
+            if all(value is None for value in row):
+                continue
+            batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            index.append(i)
+            if len(batch) >= batch_size:
+                yield _make_excel_batch(batch, columns, index)
+                batch, index = [], []
+        if batch:
+            yield _make_excel_batch(batch, columns, index)
+    finally:
+        workbook.close()
+
+def _make_excel_batch(rows: list[tuple], columns: list[str], index: list[int]) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=columns, index=index)
+    for col in EXCEL_STR_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(lambda x: x if x is None else str(x))
+    return normalize_excel(df)
+
+def count_excel_rows(filepath: str) -> int | None:
+    """
+    估计数据行数，不解析内容。有旁路缓存时读缓存的元数据，否则根据工作表记录的范围估计，范围缺失时返回 None。
+    """
+    path = sidecar_path(filepath)
+    if os.path.exists(path):
+        return pq.ParquetFile(path).metadata.num_rows
+    
+    workbook = openpyxl.load_workbook(filepath, read_only=True)
+    try:
+        max_row = workbook.worksheets[0].max_row
+        return max_row - 1 if max_row else None
+    finally:
+        workbook.close()
+
+def validate_excel_file(filepath: str, batch_size: int = 1000) -> list[str]:
+    """
+    逐批验证整个文件，返回所有错误信息。
+    """
+    errors: list[str] = []
+    for df in iter_excel(filepath, batch_size):
+        errors.extend(validate_excel(df))
+    return errors
+
     
 def modify_text(name: str):
     """
@@ -103,3 +201,22 @@ def normalize_nullable_str_columns(df: pd.DataFrame, columns: list):
 
     return df
 
+
+def dataframe_to_records(df: pd.DataFrame, columns: list) -> list[tuple]:
+    """
+    把 DataFrame 转换为 COPY 使用的元组列表。
+    空值统一变成 None，numpy 标量和 Timestamp 转换为 Python 原生类型。
+    
+    Args:
+        df: DataFrame
+        columns: 要输出的列名列表，顺序即元组顺序
+    """
+    series = []
+    for col in columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            values = [None if pd.isna(v) else v.to_pydatetime() for v in s]
+        else:
+            values = s.astype(object).where(s.notna(), None).tolist()
+        series.append(values)
+    return list(zip(*series))
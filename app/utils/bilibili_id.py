@@ -1,3 +1,7 @@
+import pandas as pd
+import abv_py
+from fastapi import HTTPException
+
 table = 'fZodR9XQDSUm21yCkr6zBqiveYah8bt4xsWpHnJE7jL5VG3guMTKNPAwcF'
 tr = {}
 for i in range(58):
@@ -26,4 +30,21 @@ def av2bv(x: int) -> str:
 	r = list('BV1  4 1 7  ')
 	for i in range(6):
 		r[s[i]] = table[x // 58 ** i % 58]
-	return ''.join(r)
\ No newline at end of file
+	return ''.join(r)
+
+def bvid_series_to_aid(bvids: pd.Series) -> pd.Series:
+    """
+    整列 bv 号转成 av 号，空值保持为空。
+    用 abv_py 的算法，新的长 av 号也能正确转换。
+    """
+    return bvids.map(lambda x: None if pd.isna(x) else abv_py.bv2av(x)).astype('Int64')
+
+def bvid_to_aid(bvid: str) -> int:
+    """
+    接口参数里的 bv 号转成 av 号。
+    格式不对的 bv 号不会对应任何视频，直接返回 404，不让 abv_py 的异常变成 500。
+    """
+    try:
+        return abv_py.bv2av(bvid)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=404, detail="视频不存在")
@@ -1,19 +1,61 @@
-from typing import Dict, Set, Tuple
+from typing import Dict, Set, Tuple, Iterable, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, Table
+from sqlalchemy import select, func, any_, bindparam, Table, Text, String, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from ..models import Producer, Synthesizer, Vocalist, Uploader, Song, Video, song_producer, song_synthesizer, song_vocalist
 from typing import Any
+import pandas as pd
+import asyncio
 
 type ORMTable = Producer | Synthesizer | Vocalist | Uploader
 
+ARTIST_TABLES = [Producer, Synthesizer, Vocalist, Uploader]
+REL_TABLES = {
+    Producer: song_producer,
+    Synthesizer: song_synthesizer,
+    Vocalist: song_vocalist
+}
+REL_CLASSES = {table: cls for cls, table in REL_TABLES.items()}
+
+ARTIST_COLUMNS = (
+    (Producer, 'author', True),
+    (Synthesizer, 'synthesizer', True),
+    (Vocalist, 'vocal', True),
+    (Uploader, 'uploader', False),    # 上传者只有一个，不拆分
+)
+
+def extract_artist_names(df: pd.DataFrame) -> dict[type, set[str]]:
+    """
+    按列取出一批数据里出现的全部 artist 名字，已去重。
+    数据文件只有 uploader 列，缺少的列对应的表不出现在结果里。
+    """
+    artist_names = {}
+    for table, col, split in ARTIST_COLUMNS:
+        if col not in df.columns:
+            continue
+        names = df[col].dropna().astype(str)
+        if split:
+            names = names.str.split('、').explode()
+        artist_names[table] = set(names.unique())
+    return artist_names
+
+
 class Cache:
 
     """
-    请求级缓存，用于函数间传递和更新。
-    每次请求创建一个实例，不共享全局数据。
+    导入用的缓存，用于函数间传递和更新。
+    
+    可以每次请求创建一个实例，也可以使用进程级的 `import_cache`。
+    后者由导入和编辑操作增量维护，每次导入开始前用 `sync` 做一次低成本的一致性检查；
+    使用它的导入和编辑都要持有 `import_lock`。
+    
+    mode:
+        'full': 第一次使用时整表加载。
+        'lazy': 只查询当前批次里出现的键，查过的键（包括不存在的）记下来不再重复查询。
     """
 
-    def __init__(self):
+    def __init__(self, mode: Literal['full', 'lazy'] = 'full'):
+        self.mode = mode
 
         # 歌曲映射: name -> id
         self.song_map: Dict[str, int] = {}
@@ -23,6 +65,12 @@ class Cache:
         self.artist_maps: Dict[type, Dict[str, int]] = {}
         # 歌曲-艺术家关系映射: 类 -> set[(song_id, artist_id)]
         self.song_artist_maps: Dict[type, Set[Tuple[int, int]]] = {}
+        
+        # lazy 模式下已经查询过的键
+        self._looked_up_songs: Set[str] = set()
+        self._looked_up_videos: Set[str] = set()
+        self._looked_up_artists: Dict[type, Set[str]] = {table: set() for table in ARTIST_TABLES}
+        self._looked_up_relations: Dict[type, Set[int]] = {cls: set() for cls in REL_TABLES}
 
     # ---------- 异步加载方法 ----------
     async def load_artists(self, session: AsyncSession, artist_tables: list[Any]):
@@ -47,6 +95,60 @@ class Cache:
             result = await session.execute(select(table.c.song_id, table.c.artist_id))
             self.song_artist_maps[cls] = set(result.tuples().all()) 
 
+    # ---------- lazy 模式的按键查询 ----------
+    async def lookup_songs(self, session: AsyncSession, names: Iterable[str]):
+        """只查询给定名字的歌曲"""
+        names = set(names) - self._looked_up_songs
+        if not names:
+            return
+        result = await session.execute(
+            select(Song.id, Song.name)
+            .where(Song.name == any_(bindparam('names', list(names), type_=ARRAY(Text))))
+        )
+        self.song_map.update({r[1]: r[0] for r in result.all()})
+        self._looked_up_songs |= names
+
+    async def lookup_videos(self, session: AsyncSession, bvids: Iterable[str]):
+        """只查询给定 bvid 的视频"""
+        bvids = set(bvids) - self._looked_up_videos
+        if not bvids:
+            return
+        result = await session.execute(
+            select(Video.bvid, Video.song_id)
+            .where(Video.bvid == any_(bindparam('bvids', list(bvids), type_=ARRAY(String))))
+        )
+        self.video_map.update({r[0]: r[1] for r in result.all()})
+        self._looked_up_videos |= bvids
+
+    async def lookup_artists(self, session: AsyncSession, artist_names: Dict[type, set[str]]):
+        """只查询给定名字的艺术家"""
+        for table, names in artist_names.items():
+            artist_map = self.artist_maps.setdefault(table, {})
+            names = names - self._looked_up_artists[table]
+            if not names:
+                continue
+            result = await session.execute(
+                select(table.id, table.name)
+                .where(table.name == any_(bindparam('names', list(names), type_=ARRAY(Text))))
+            )
+            artist_map.update({r[1]: r[0] for r in result.all()})
+            self._looked_up_artists[table] |= names
+
+    async def lookup_song_artist_relations(self, session: AsyncSession, song_ids: Iterable[int]):
+        """只查询给定歌曲的艺术家关系"""
+        song_ids = set(song_ids)
+        for cls, table in REL_TABLES.items():
+            relations = self.song_artist_maps.setdefault(cls, set())
+            ids = song_ids - self._looked_up_relations[cls]
+            if not ids:
+                continue
+            result = await session.execute(
+                select(table.c.song_id, table.c.artist_id)
+                .where(table.c.song_id == any_(bindparam('song_ids', list(ids), type_=ARRAY(Integer))))
+            )
+            relations.update(result.tuples().all())
+            self._looked_up_relations[cls] |= ids
+
             
     def has_videos(self) -> bool:
         return bool(self.video_map)
@@ -63,28 +165,165 @@ class Cache:
         return any(bool(s) for s in self.song_artist_maps.values())
     
     # ---------- 统一懒加载方法 ----------
-    async def ensure_loaded(self, session, cache_keys: list[str]):
+    async def ensure_loaded(self, session, cache_keys: list[str], df: pd.DataFrame | None = None):
         """
         确保所需缓存已经加载，没有则从数据库载入。
 
         session: SQLAlchemy AsyncSession
         cache_keys: 需要保证加载的缓存列表，可选值：
             'video_map', 'song_map', 'artist_maps', 'song_artist_maps'
+        df: 当前批次的数据。lazy 模式下只加载其中出现的键，不提供时按 full 模式处理。
         """
+        if self.mode == 'lazy' and df is not None:
+            await self.ensure_batch_loaded(session, cache_keys, df)
+            return
+
         if 'video_map' in cache_keys and not self.has_videos():
             await self.load_videos(session)
 
         if 'song_map' in cache_keys and not self.has_songs():
             await self.load_songs(session)
 
-        if 'artist_maps' in cache_keys and not self.has_artists():
-            tables = [Producer, Synthesizer, Vocalist, Uploader]
-            await self.load_artists(session, tables)
+        # artist 和关系按表加载，单独作废过的表（见 mark_changed）也会补上
+        if 'artist_maps' in cache_keys:
+            missing = [table for table in ARTIST_TABLES if table not in self.artist_maps]
+            if missing:
+                await self.load_artists(session, missing)
+
+        if 'song_artist_maps' in cache_keys:
+            missing = {cls: table for cls, table in REL_TABLES.items() if cls not in self.song_artist_maps}
+            if missing:
+                await self.load_song_artist_relations(session, missing)
+
+    async def ensure_batch_loaded(self, session, cache_keys: list[str], df: pd.DataFrame):
+        """
+        lazy 模式：只加载当前批次用到的键。
+        """
+        if 'video_map' in cache_keys:
+            await self.lookup_videos(session, df['bvid'].dropna())
+
+        if 'song_map' in cache_keys or 'song_artist_maps' in cache_keys:
+            await self.lookup_songs(session, df['name'].dropna())
+
+        if 'artist_maps' in cache_keys:
+            await self.lookup_artists(session, extract_artist_names(df))
 
-        if 'song_artist_maps' in cache_keys and not self.has_song_artist_relations():
-            rel_tables = {
-                Producer: song_producer,
-                Synthesizer: song_synthesizer,
-                Vocalist: song_vocalist
+        if 'song_artist_maps' in cache_keys:
+            song_ids = df['name'].map(self.song_map).dropna().astype(int)
+            await self.lookup_song_artist_relations(session, song_ids)
+
+    # ---------- 一致性检查 ----------
+    async def sync(self, session: AsyncSession):
+        """
+        用行数和最大 id 检查已加载的部分是否和数据库一致，不一致的部分重新加载。
+        这些都能从索引得到，不需要扫描整表。
+        
+        只能发现增删造成的不一致；改名、改关联之类的修改要靠编辑操作调用下面的维护方法，
+        或者用 mark_changed 让对应的部分作废。
+        lazy 模式下记住的键只在一次请求内有效，直接清空。
+        """
+        if self.mode == 'lazy':
+            self.invalidate()
+            return
+
+        if self.has_songs():
+            count, max_id = (await session.execute(select(func.count(), func.max(Song.id)))).one()
+            if count != len(self.song_map) or max_id != max(self.song_map.values()):
+                await self.load_songs(session)
+
+        if self.has_videos():
+            count = (await session.execute(select(func.count()).select_from(Video))).scalar_one()
+            if count != len(self.video_map):
+                await self.load_videos(session)
+
+        stale_artists = []
+        for table, artist_map in self.artist_maps.items():
+            count, max_id = (await session.execute(select(func.count(), func.max(table.id)))).one()
+            if count != len(artist_map) or max_id != max(artist_map.values(), default=None):
+                stale_artists.append(table)
+        if stale_artists:
+            await self.load_artists(session, stale_artists)
+
+        stale_relations = {}
+        for cls, relations in self.song_artist_maps.items():
+            table = REL_TABLES[cls]
+            count = (await session.execute(select(func.count()).select_from(table))).scalar_one()
+            if count != len(relations):
+                stale_relations[cls] = table
+        if stale_relations:
+            await self.load_song_artist_relations(session, stale_relations)
+
+    def invalidate(self):
+        """
+        清空全部缓存，下次使用时重新加载。用于事务回滚之后。
+        """
+        self.song_map = {}
+        self.video_map = {}
+        self.artist_maps = {}
+        self.song_artist_maps = {}
+        self._looked_up_songs = set()
+        self._looked_up_videos = set()
+        self._looked_up_artists = {table: set() for table in ARTIST_TABLES}
+        self._looked_up_relations = {cls: set() for cls in REL_TABLES}
+
+    def drop_song_artist_relations(self, cls: type):
+        """
+        某类关系被整体重写之后调用，已加载的部分作废。
+        """
+        self.song_artist_maps.pop(cls, None)
+        self._looked_up_relations[cls] = set()
+
+    def mark_changed(self, *tables: Any):
+        """
+        绕过下面的维护方法整体改写了这些表之后调用（比如批量导入直接合并视频和关系），
+        已加载的对应部分作废，下次使用时重新加载。
+        tables: Song、Video、artist 类或关系表（song_producer 等）
+        """
+        for table in tables:
+            if table is Song:
+                self.song_map = {}
+                self._looked_up_songs = set()
+            elif table is Video:
+                self.video_map = {}
+                self._looked_up_videos = set()
+            elif table in REL_CLASSES:
+                self.drop_song_artist_relations(REL_CLASSES[table])
+            else:
+                self.artist_maps.pop(table, None)
+                self._looked_up_artists[table] = set()
+
+    # ---------- 编辑操作的增量维护 ----------
+    def rename_song(self, song_id: int, name: str):
+        if not self.has_songs():
+            return
+        for old_name in [k for k, v in self.song_map.items() if v == song_id]:
+            del self.song_map[old_name]
+        self.song_map[name] = song_id
+
+    def rename_artist(self, table: Any, old_name: str, name: str):
+        artist_map = self.artist_maps.get(table)
+        if artist_map is None:
+            return
+        artist_id = artist_map.pop(old_name, None)
+        if artist_id is not None:
+            artist_map[name] = artist_id
+
+    def merge_artist(self, table: Any, old_id: int, new_id: int):
+        artist_map = self.artist_maps.get(table)
+        if artist_map is not None:
+            for name in [k for k, v in artist_map.items() if v == old_id]:
+                del artist_map[name]
+        relations = self.song_artist_maps.get(table)
+        if relations is not None:
+            self.song_artist_maps[table] = {
+                (song_id, new_id if artist_id == old_id else artist_id)
+                for song_id, artist_id in relations
             }
-            await self.load_song_artist_relations(session, rel_tables)
+
+
+# 进程级的导入缓存
+import_cache = Cache()
+
+# 所有导入操作串行执行：共享的 import_cache 不会被两个导入交替读写，
+# 导入过程中数据库也不会被另一个导入改动。编辑操作维护 import_cache 时也要持有
+import_lock = asyncio.Lock()
@@ -0,0 +1,83 @@
+"""
+键集分页（keyset pagination）用的游标。
+
+游标里记录上一页最后一行的排序键，下一页直接用 WHERE (键) > (上一页最后的键) 定位，
+不再需要 OFFSET 跳过前面的所有行，翻到多深都一样快。
+游标对前端来说是不透明的字符串，原样传回即可。
+"""
+
+import base64
+import json
+from datetime import date
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import ColumnElement, and_, or_, tuple_
+
+# 排序键都是 integer 列，超出范围的值传给数据库会报错
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+CURSOR_DESCRIPTION = "上一页返回的 next_cursor。提供时忽略 page，直接从游标之后继续"
+
+
+def encode_cursor(kind: str, *values: Any) -> str:
+    """
+    把排序键编码成游标。kind 标明游标属于哪种列表，防止把别的列表的游标传进来。
+    """
+    payload = json.dumps([kind, *values], default=_encode_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(kind: str, cursor: str, *types: type) -> list:
+    """
+    解析游标，按 types 检查并转换每个排序键，返回排序键。游标无效或者不属于这种列表时返回 400。
+    types 的每一项是 int、date 或 int | None（可以为空的排序列）；日期按字符串保存，这里转换成 date。
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的游标")
+    if not isinstance(payload, list) or len(payload) != len(types) + 1 or payload[0] != kind:
+        raise HTTPException(status_code=400, detail="游标和当前列表不匹配")
+    return [_decode_value(value, type_) for value, type_ in zip(payload[1:], types)]
+
+
+def keyset_after(order_col: ColumnElement, id_col: ColumnElement, last_value: int | None, last_id: int) -> ColumnElement:
+    """
+    按 (order_col, id_col) 升序排列时，排在 (last_value, last_id) 之后的行。
+    升序时 NULL 排在最后，行比较遇到 NULL 结果为空，所以排序列为空的行要单独处理。
+    """
+    if last_value is None:
+        return and_(order_col.is_(None), id_col > last_id)
+    return or_(tuple_(order_col, id_col) > tuple_(last_value, last_id), order_col.is_(None))
+
+
+def next_cursor(kind: str, rows: list, page_size: int, key) -> str | None:
+    """
+    根据这一页的结果生成下一页的游标。这一页不满说明已经到底，返回 None。
+    key 从最后一行取出排序键（元组）。
+    """
+    if len(rows) < page_size:
+        return None
+    return encode_cursor(kind, *key(rows[-1]))
+
+
+def _decode_value(value, type_):
+    if value is None and isinstance(None, type_):
+        return None
+    if type_ is date:
+        if isinstance(value, str):
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                pass
+    elif isinstance(value, int) and not isinstance(value, bool) and INT_MIN <= value <= INT_MAX:
+        return value
+    raise HTTPException(status_code=400, detail="无效的游标")
+
+
+def _encode_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'无法编码到游标：{value!r}')
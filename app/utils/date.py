@@ -6,12 +6,32 @@ def get_last_census_date(today: date = date.today()) -> date:
     last_monthly_census_date = today.replace(day=1)
     return max(last_weekly_census_date, last_monthly_census_date)
 
+# 分期排名：周刊、月刊的每一期包含哪个榜单的哪几期
+SEPERATE_BOARDS = {
+    'vocaloid-weekly': 'vocaloid-daily',
+    'vocaloid-monthly': 'vocaloid-weekly',
+}
+
 def get_seperate_start_end_issues(board: str, issue: int) -> tuple[int, int]:
     if board == 'vocaloid-weekly':
         return issue*7+53, issue*7+59
     else:
         issue_date = date(2024, 7, 1) + relativedelta(months=issue)
-        print(issue_date)
         end = (issue_date - date(2024, 8, 31)).days // 7
-        print(end)
-        return end-4, end
\ No newline at end of file
+        return end-4, end
+
+def get_seperate_parent_issues(board: str, issue: int) -> list[int]:
+    """
+    get_seperate_start_end_issues 的反查：board 的第 issue 期属于上一级榜单的哪几期。
+    月刊的范围按周划分，前后两期可能共用一期周刊，所以返回列表
+    """
+    if board == 'vocaloid-daily':
+        return [(issue - 53) // 7]
+    issue_date = date(2024, 8, 31) + timedelta(weeks=issue)
+    month = (issue_date.year - 2024) * 12 + issue_date.month - 7
+    parents = []
+    for parent in range(month - 1, month + 3):
+        start, end = get_seperate_start_end_issues('vocaloid-monthly', parent)
+        if start <= issue <= end:
+            parents.append(parent)
+    return parents
\ No newline at end of file
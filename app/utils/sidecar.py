@@ -0,0 +1,151 @@
+"""
+xlsx 文件的 Parquet 旁路缓存。
+
+每个 xlsx 第一次被解析后，预处理过的结果会写到同目录 `.sidecar/` 下，文件名带有内容哈希。
+之后再读同一个文件时直接读 Parquet，文件内容变了哈希就对不上，自然会重新解析。
+"""
+
+import os
+import glob
+import hashlib
+from typing import Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SIDECAR_DIR = '.sidecar'
+
+# 文件路径 -> (mtime, size, 哈希)，mtime 和大小没变就不用重新计算哈希
+_digest_cache: dict[str, tuple[float, int, str]] = {}
+
+
+def file_digest(filepath: str) -> str:
+    """
+    计算文件内容的哈希。
+    """
+    stat = os.stat(filepath)
+    cached = _digest_cache.get(filepath)
+    if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        return cached[2]
+
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()[:16]
+    _digest_cache[filepath] = (stat.st_mtime, stat.st_size, digest)
+    return digest
+
+
+def sidecar_path(filepath: str) -> str:
+    """
+    输入 xlsx 文件路径，返回对应的 Parquet 文件路径
+    """
+    directory, filename = os.path.split(filepath)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, SIDECAR_DIR, f'{stem}.{file_digest(filepath)}.parquet')
+
+
+def load_sidecar(filepath: str) -> pd.DataFrame | None:
+    """
+    读取整个旁路缓存，不存在时返回 None。
+    """
+    path = sidecar_path(filepath)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def iter_sidecar(filepath: str, batch_size: int) -> Iterator[pd.DataFrame] | None:
+    """
+    逐批读取旁路缓存，不存在时返回 None。
+    """
+    path = sidecar_path(filepath)
+    if not os.path.exists(path):
+        return None
+
+    def batches():
+        parquet_file = pq.ParquetFile(path)
+        schema = parquet_file.schema_arrow
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield pa.Table.from_batches([batch], schema=schema).to_pandas()
+
+    return batches()
+
+
+def _remove_stale(filepath: str, keep: str):
+    directory, filename = os.path.split(filepath)
+    stem = os.path.splitext(filename)[0]
+    for path in glob.glob(os.path.join(directory, SIDECAR_DIR, f'{glob.escape(stem)}.*.parquet')):
+        if path != keep:
+            os.remove(path)
+
+
+def save_sidecar(filepath: str, df: pd.DataFrame):
+    """
+    把预处理过的 DataFrame 写成旁路缓存。写入失败只打印错误，不影响调用方。
+    """
+    path = sidecar_path(filepath)
+    tmp_path = f'{path}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(tmp_path, index=True)
+        os.replace(tmp_path, path)
+        _remove_stale(filepath, path)
+    except Exception as e:
+        print("写入旁路缓存出错:", filepath, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class SidecarWriter:
+    """
+    边解析边写旁路缓存，用于逐批读取 xlsx 的场景。
+
+    以第一批的字段类型为准，后面的批次转换不过去（比如整列类型变了）就放弃这次写入。
+    """
+
+    def __init__(self, filepath: str):
+        self._filepath = filepath
+        self._path = sidecar_path(filepath)
+        self._tmp_path = f'{self._path}.tmp'
+        self._writer: pq.ParquetWriter | None = None
+        self._schema: pa.Schema | None = None
+        self._failed = False
+
+    def write(self, df: pd.DataFrame):
+        if self._failed:
+            return
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            if self._writer is None:
+                # 第一批里整列为空的字段先按字符串处理，后面的批次才能转换过来
+                self._schema = pa.schema(
+                    [field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in table.schema],
+                    metadata=table.schema.metadata
+                )
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        except Exception as e:
+            print("写入旁路缓存出错:", self._filepath, e)
+            self.abort()
+
+    def close(self):
+        """
+        全部批次写完后调用，把临时文件换成正式的旁路缓存。
+        """
+        if self._failed or self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._tmp_path, self._path)
+        _remove_stale(self._filepath, self._path)
+
+    def abort(self):
+        self._failed = True
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
@@ -0,0 +1,366 @@
+"""
+性能对比脚本，结果直接打印。
+
+用法：
+    python benchmark.py artists [排名文件路径] [--rows 10000]
+    python benchmark.py cache 排名文件路径          （需要数据库）
+    python benchmark.py songs [--page-sizes 20 100 500]  （需要数据库）
+    python benchmark.py fast [--page-size 20]             （需要数据库）
+    python benchmark.py serialize [--page-sizes 20 100 500]  （需要数据库）
+    python benchmark.py concurrent [--page-size 20]       （需要数据库）
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+import pandas as pd
+
+
+def timeit(func, repeat: int = 5) -> float:
+    """
+    重复执行，返回最快一次的耗时（秒）
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, baseline: float, optimized: float):
+    print(f"{name}: 原实现 {baseline * 1000:.1f} ms，新实现 {optimized * 1000:.1f} ms，加速 {baseline / optimized:.1f}x")
+
+
+def make_ranking_df(rows: int) -> pd.DataFrame:
+    """
+    生成和排名文件结构相同的随机数据
+    """
+    rng = random.Random(0)
+    producers = [f'P主{i}' for i in range(rows // 4)]
+    vocalists = [f'歌手{i}' for i in range(200)]
+    synthesizers = [f'引擎{i}' for i in range(30)]
+    return pd.DataFrame({
+        'bvid': [f'BV{i:010d}' for i in range(rows)],
+        'name': [f'歌曲{i}' for i in range(rows)],
+        'author': ['、'.join(rng.sample(producers, rng.randint(1, 3))) for _ in range(rows)],
+        'synthesizer': ['、'.join(rng.sample(synthesizers, rng.randint(1, 2))) for _ in range(rows)],
+        'vocal': ['、'.join(rng.sample(vocalists, rng.randint(1, 3))) if rng.random() > 0.02 else None for _ in range(rows)],
+        'uploader': [f'UP{rng.randint(0, rows // 2)}' for _ in range(rows)],
+    })
+
+
+# ==================  artists  ==================
+
+def legacy_extract_artist_names(df: pd.DataFrame):
+    """
+    insert_artists 原来的逐行实现
+    """
+    from app.models import Producer, Synthesizer, Vocalist, Uploader
+
+    artist_map = {
+        Producer: set(),
+        Synthesizer: set(),
+        Vocalist: set(),
+        Uploader: set(),
+    }
+    for _, row in df.iterrows():
+        for table, col in (
+            (Producer, 'author'),
+            (Synthesizer, 'synthesizer'),
+            (Vocalist, 'vocal'),
+        ):
+            if not pd.isna(row[col]):
+                for name in row[col].split('、'):
+                    artist_map[table].add(name)
+        if not pd.isna(row['uploader']):
+            artist_map[Uploader].add(row['uploader'])
+    return artist_map
+
+
+def bench_artists(args):
+    from app.crud.insert import extract_artist_names
+    from app.utils import read_excel
+
+    df = read_excel(args.path) if args.path else make_ranking_df(args.rows)
+    assert legacy_extract_artist_names(df) == extract_artist_names(df)
+    print(f"{len(df)} 行")
+    report(
+        "artist 提取",
+        timeit(lambda: legacy_extract_artist_names(df), 1),
+        timeit(lambda: extract_artist_names(df)),
+    )
+
+
+# ==================  cache  ==================
+
+CACHE_KEYS = ['video_map', 'song_map', 'artist_maps', 'song_artist_maps']
+
+def cache_size(cache) -> int:
+    return (
+        len(cache.song_map) + len(cache.video_map)
+        + sum(map(len, cache.artist_maps.values()))
+        + sum(map(len, cache.song_artist_maps.values()))
+    )
+
+
+async def bench_cache(args):
+    from app.session import async_session_maker
+    from app.utils import iter_excel
+    from app.utils.cache import Cache
+    from app.crud.insert import BATCH_SIZE
+
+    batches = list(iter_excel(args.path, BATCH_SIZE))
+    print(f"{sum(map(len, batches))} 行，{len(batches)} 批")
+
+    async with async_session_maker() as session:
+        start = time.perf_counter()
+        cache = Cache('full')
+        for df in batches:
+            await cache.ensure_loaded(session, CACHE_KEYS, df)
+        full = time.perf_counter() - start
+        print(f"full：加载 {cache_size(cache)} 条")
+
+        start = time.perf_counter()
+        cache = Cache('lazy')
+        for df in batches:
+            await cache.ensure_loaded(session, CACHE_KEYS, df)
+        lazy = time.perf_counter() - start
+        print(f"lazy：加载 {cache_size(cache)} 条")
+
+    report("缓存加载", full, lazy)
+
+
+# ==================  songs  ==================
+
+def normalize_song(song: dict) -> dict:
+    """
+    selectinload 加载的列表没有固定顺序，比较前排好序
+    """
+    song = dict(song)
+    song['videos'] = sorted(song['videos'], key=lambda v: v['bvid'])
+    for key in ('producers', 'synthesizers', 'vocalists'):
+        song[key] = sorted(song[key], key=lambda a: a['id'])
+    return song
+
+
+async def bench_songs(args):
+    import json
+    from app.session import async_session_maker
+    from app.crud.select import get_songs_detail
+    from app.crud import song_json
+    from app.stores.ranking_cache import render
+
+    async def orm_page(page_size: int) -> bytes:
+        async with async_session_maker() as session:
+            return render(await get_songs_detail(1, page_size, session, loader='orm'))
+
+    async def json_page(page_size: int) -> bytes:
+        async with async_session_maker() as session:
+            return song_json.render(await get_songs_detail(1, page_size, session, loader='json'))
+
+    async def best(func, page_size: int) -> float:
+        result = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            await func(page_size)
+            result = min(result, time.perf_counter() - start)
+        return result
+
+    for page_size in args.page_sizes:
+        orm_body = json.loads(await orm_page(page_size))
+        json_body = json.loads(await json_page(page_size))
+        assert [normalize_song(s) for s in orm_body['data']] == [normalize_song(s) for s in json_body['data']]
+        assert {**orm_body, 'data': None} == {**json_body, 'data': None}
+        report(f"歌曲详情 page_size={page_size}（查询+序列化）", await best(orm_page, page_size), await best(json_page, page_size))
+
+
+# ==================  fast  ==================
+
+def normalize_ranking_page(body: dict) -> dict:
+    for ranking in body['data']:
+        song = ranking['song']
+        for key in ('producers', 'synthesizers', 'vocalists'):
+            song[key] = sorted(song[key], key=lambda a: a['id'])
+    return body
+
+
+async def bench_fast(args):
+    import json
+    from sqlalchemy import select, func
+    from app.session import async_session_maker
+    from app.models import Ranking, Video
+    from app.crud import select as crud, fast
+    from app.stores.ranking_cache import render
+
+    async with async_session_maker() as session:
+        video = (await session.execute(
+            select(Video).order_by(Video.latest_view.desc().nulls_last()).limit(1)
+        )).scalar_one()
+        bvid, song_id = video.bvid, video.song_id
+        issue = (await session.execute(
+            select(func.max(Ranking.issue)).where(Ranking.board == 'vocaloid-daily', Ranking.part == 'main')
+        )).scalar_one()
+
+    page_size = args.page_size
+    endpoints = [
+        (
+            f'/select/ranking page_size={page_size}',
+            lambda s: crud.get_ranking('vocaloid-daily', 'main', issue, 1, page_size, 'score', False, s),
+            lambda s: fast.get_ranking('vocaloid-daily', 'main', issue, 1, page_size, 'score', False, s),
+            normalize_ranking_page,
+        ),
+        (
+            '/select/song',
+            lambda s: crud.get_song(song_id, s),
+            lambda s: fast.get_song(song_id, s),
+            lambda body: {'data': normalize_song(body['data'])},
+        ),
+        (
+            '/select/video',
+            lambda s: crud.get_video(bvid, s),
+            lambda s: fast.get_video(bvid, s),
+            lambda body: body,
+        ),
+        (
+            f'/select/video/snapshot page_size={page_size}',
+            lambda s: crud.get_song_snapshot(bvid, 1, page_size, s),
+            lambda s: fast.get_song_snapshot(bvid, 1, page_size, s),
+            lambda body: body,
+        ),
+    ]
+
+    async def orm_body(query) -> bytes:
+        async with async_session_maker() as session:
+            return render(await query(session))
+
+    async def fast_body(query) -> bytes:
+        async with async_session_maker() as session:
+            result = await query(session)
+            # 排名返回 (字节, 歌曲)
+            return result[0] if isinstance(result, tuple) else result
+
+    async def best(func, query) -> float:
+        result = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            await func(query)
+            result = min(result, time.perf_counter() - start)
+        return result
+
+    for name, orm_query, fast_query, normalize in endpoints:
+        assert normalize(json.loads(await orm_body(orm_query))) == normalize(json.loads(await fast_body(fast_query))), name
+        report(name, await best(orm_body, orm_query), await best(fast_body, fast_query))
+
+
+# ==================  serialize  ==================
+
+async def bench_serialize(args):
+    import json
+    from app.session import async_session_maker
+    from app.crud.select import get_ranking, get_songs_detail
+    from app.schemas.select import Page, RankingPage, RankingRowOut, SongDetailOut, dump_json
+    from app.stores.ranking_cache import render
+
+    for page_size in args.page_sizes:
+        async with async_session_maker() as session:
+            pages = [
+                ('排名', await get_ranking('vocaloid-daily', 'main', None, 1, page_size, 'score', False, session), RankingPage[RankingRowOut]),
+                ('歌曲详情', await get_songs_detail(1, page_size, session), Page[SongDetailOut]),
+            ]
+            for name, content, schema in pages:
+                schema_body = lambda: dump_json(schema.model_validate(content, from_attributes=True))
+                assert json.loads(render(content))['data'] == json.loads(schema_body())['data']
+                report(
+                    f"{name}序列化 page_size={page_size}（jsonable_encoder → 响应结构）",
+                    timeit(lambda: render(content), args.repeat),
+                    timeit(schema_body, args.repeat),
+                )
+
+
+# ==================  concurrent  ==================
+
+async def bench_concurrent(args):
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.session import engine, async_session_maker
+    from app.models import Video
+    from app.crud import select as crud
+
+    async with async_session_maker() as session:
+        bvid, song_id = (await session.execute(
+            select(Video.bvid, Video.song_id).order_by(Video.latest_view.desc().nulls_last()).limit(1)
+        )).one()
+
+    page_size = args.page_size
+    queries = [
+        ('get_ranking', lambda s: crud.get_ranking('vocaloid-daily', 'main', None, 1, page_size, 'score', False, s)),
+        ('get_songs_detail', lambda s: crud.get_songs_detail(1, page_size, s)),
+        ('get_song_ranking', lambda s: crud.get_song_ranking(song_id, 'vocaloid-daily', 1, page_size, s)),
+        ('get_song_snapshot', lambda s: crud.get_song_snapshot(bvid, 1, page_size, s)),
+    ]
+
+    async def sequential(query):
+        # session 绑定在一个连接上时 execute_concurrently 按顺序执行
+        async with engine.connect() as conn:
+            await query(AsyncSession(bind=conn))
+
+    async def concurrent(query):
+        async with async_session_maker() as session:
+            await query(session)
+
+    async def best(func, query) -> float:
+        result = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            await func(query)
+            result = min(result, time.perf_counter() - start)
+        return result
+
+    for name, query in queries:
+        report(f"{name} page_size={page_size}（顺序 → 并发）", await best(sequential, query), await best(concurrent, query))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='name', required=True)
+
+    p = subparsers.add_parser('artists', help='insert_artists 的 artist 提取')
+    p.add_argument('path', nargs='?', help='排名文件，不提供则随机生成')
+    p.add_argument('--rows', type=int, default=10000)
+    p.set_defaults(func=bench_artists)
+
+    p = subparsers.add_parser('cache', help='Cache 的 full 与 lazy 模式')
+    p.add_argument('path', help='排名文件')
+    p.set_defaults(func=bench_cache)
+
+    p = subparsers.add_parser('songs', help='歌曲详情的 ORM 加载与数据库拼 JSON')
+    p.add_argument('--page-sizes', type=int, nargs='+', default=[20, 100, 500])
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_songs)
+
+    p = subparsers.add_parser('fast', help='热点查询接口的 ORM 路径与 asyncpg 快速路径')
+    p.add_argument('--page-size', type=int, default=20)
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_fast)
+
+    p = subparsers.add_parser('serialize', help='ORM 对象用 jsonable_encoder 与响应结构序列化')
+    p.add_argument('--page-sizes', type=int, nargs='+', default=[20, 100, 500])
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_serialize)
+
+    p = subparsers.add_parser('concurrent', help='数据和总数顺序执行与并发执行')
+    p.add_argument('--page-size', type=int, default=20)
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_concurrent)
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
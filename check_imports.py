@@ -0,0 +1,117 @@
+"""
+用一个临时生成的数据文件跑一遍导入，检查能否正常完成，失败时返回非零退出码。
+
+用法：
+    python check_imports.py
+
+导入函数按相对路径 ./data/数据/ 读取文件，所以在临时目录里生成文件并切换过去。
+所有写入都在一个事务里（导入过程中的 commit 只是释放保存点），最后整个事务回滚，不会在数据库里留下任何东西。
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import traceback
+from datetime import date, datetime
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+import pandas as pd
+from abv_py import av2bv
+from sqlalchemy import insert, select, func
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+
+from app.session import engine
+from app.models import Song, Video, Snapshot, Uploader
+from app.crud.insert import execute_import_snapshots
+from app.utils.cache import Cache
+
+VIDEOS = 20
+# 用很远的日期和接近上限的 aid，避免和已有的数据冲突
+IMPORT_DATE = date(2099, 1, 1)
+BASE_AID = 2 ** 51 - 1 - VIDEOS
+
+
+async def seed(conn: AsyncConnection) -> list[str]:
+    """
+    写入歌曲和视频，返回 bvid 列表
+    """
+    song_ids = (await conn.execute(
+        insert(Song).returning(Song.id),
+        [{'name': f'__check_imports_{i}', 'type': '原创'} for i in range(VIDEOS)]
+    )).scalars().all()
+    uploader_id = (await conn.execute(
+        insert(Uploader).values(name='__check_imports').returning(Uploader.id)
+    )).scalar_one()
+    bvids = [av2bv(BASE_AID + i) for i in range(VIDEOS)]
+    await conn.execute(insert(Video), [
+        {'bvid': bvid, 'aid': BASE_AID + i, 'title': '', 'pubdate': datetime(2098, 1, 1), 'song_id': sid, 'uploader_id': uploader_id}
+        for i, (bvid, sid) in enumerate(zip(bvids, song_ids))
+    ])
+    return bvids
+
+
+def write_snapshot_file(directory: str, bvids: list[str]):
+    """
+    生成和数据文件结构相同的 xlsx：没有 author、synthesizer、vocal 列
+    """
+    os.makedirs(os.path.join(directory, 'data', '数据'))
+    pd.DataFrame({
+        'bvid': bvids,
+        'title': [f'标题{i}' for i in range(len(bvids))],
+        'pubdate': ['2098-01-01 00:00:00'] * len(bvids),
+        'name': [f'__check_imports_{i}' for i in range(len(bvids))],
+        'uploader': ['__check_imports'] * len(bvids),
+        'duration': ['3分30秒'] * len(bvids),
+        'page': [1] * len(bvids),
+        'copyright': [1] * len(bvids),
+        'view': list(range(len(bvids))),
+        'favorite': [0] * len(bvids),
+        'coin': [0] * len(bvids),
+        'like': [0] * len(bvids),
+    }).to_excel(os.path.join(directory, 'data', '数据', f'{IMPORT_DATE:%Y%m%d}.xlsx'), index=False)
+
+
+async def check_snapshots(conn: AsyncConnection, cache_mode: str) -> int:
+    session = AsyncSession(bind=conn, join_transaction_mode='create_savepoint')
+    await execute_import_snapshots(session, IMPORT_DATE.isoformat(), True, Cache(cache_mode))
+    return (await conn.execute(
+        select(func.count()).select_from(Snapshot).where(Snapshot.date == IMPORT_DATE, Snapshot.aid >= BASE_AID)
+    )).scalar_one()
+
+
+async def main() -> int:
+    cwd = os.getcwd()
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        async with engine.connect() as conn:
+            await conn.begin()
+            try:
+                bvids = await seed(conn)
+                write_snapshot_file(directory, bvids)
+                os.chdir(directory)
+                for cache_mode in ('full', 'lazy'):
+                    name = f'execute_import_snapshots cache_mode={cache_mode}'
+                    try:
+                        count = await check_snapshots(conn, cache_mode)
+                    except Exception:
+                        failures += 1
+                        print(f"[失败] {name}")
+                        traceback.print_exc()
+                        continue
+                    if count == VIDEOS:
+                        print(f"[通过] {name}")
+                    else:
+                        failures += 1
+                        print(f"[失败] {name}：写入 {count} 条，应为 {VIDEOS} 条")
+            finally:
+                os.chdir(cwd)
+                await conn.rollback()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,193 @@
+"""
+检查 app/crud/select.py 中常用查询的执行计划，出现顺序扫描就返回非零退出码。
+
+用法：
+    python check_plans.py
+
+在一个事务里写入一批测试数据，执行各个查询并记录实际发出的每条 SQL（包括 selectinload 发出的），
+再逐条 EXPLAIN，最后整个事务回滚，不会在数据库里留下任何东西。
+测试数据很少，规划器本来就倾向于顺序扫描，所以 EXPLAIN 前会关闭 enable_seqscan，
+这时计划里还有 Seq Scan，就说明这条查询没有可用的索引。
+"""
+
+import asyncio
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+from abv_py import av2bv
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+
+from app.session import engine
+from app.models import Song, Video, Snapshot, Ranking, Producer, Uploader, song_producer
+from app.crud.partition import ensure_snapshot_partitions
+from app.crud.update import update_ranking_links
+from app.crud import select as crud
+from app.utils.cursor import encode_cursor
+
+SONGS = 300
+DAILY_ISSUES = range(58, 67)
+WEEKLY_ISSUES = range(1, 3)
+SNAPSHOT_DATES = [date(2025, 1, 1) + timedelta(days=i) for i in range(5)]
+# 用接近上限的 aid，避免和已有的视频冲突
+BASE_AID = 2 ** 51 - 1 - SONGS
+
+
+async def seed(conn: AsyncConnection) -> dict:
+    """
+    写入测试数据，返回查询时要用的参数
+    """
+    song_ids = (await conn.execute(
+        insert(Song).returning(Song.id),
+        [{'name': f'__check_plans_{i}', 'type': '原创'} for i in range(SONGS)]
+    )).scalars().all()
+    producer_id = (await conn.execute(
+        insert(Producer).values(name='__check_plans').returning(Producer.id)
+    )).scalar_one()
+    await conn.execute(insert(song_producer), [{'song_id': sid, 'artist_id': producer_id} for sid in song_ids])
+
+    uploader_id = (await conn.execute(
+        insert(Uploader).values(name='__check_plans').returning(Uploader.id)
+    )).scalar_one()
+
+    aids = [BASE_AID + i for i in range(SONGS)]
+    last = SNAPSHOT_DATES[-1]
+    await conn.execute(insert(Video), [
+        {
+            'bvid': av2bv(aid), 'aid': aid, 'title': '', 'pubdate': datetime(2024, 1, 1), 'song_id': sid, 'uploader_id': uploader_id,
+            'latest_date': last, 'latest_view': 10000 + i, 'latest_favorite': i, 'latest_coin': i, 'latest_like': i,
+            'max_view': 10000 + i,
+        }
+        for i, (aid, sid) in enumerate(zip(aids, song_ids))
+    ])
+
+    await ensure_snapshot_partitions(conn, SNAPSHOT_DATES[0], last)
+    await conn.execute(insert(Snapshot), [
+        {'aid': aid, 'date': d, 'view': 10000 + i, 'favorite': i, 'coin': i, 'like': i}
+        for d in SNAPSHOT_DATES
+        for i, aid in enumerate(aids)
+    ])
+
+    def rankings(board: str, issue: int):
+        return [
+            {
+                'board': board, 'part': 'main', 'issue': issue, 'rank': rank, 'song_id': sid, 'aid': aid,
+                'point': 0, 'view': 0, 'favorite': 0, 'coin': 0, 'like': 0,
+                'view_rank': rank, 'favorite_rank': rank, 'coin_rank': rank, 'like_rank': rank,
+            }
+            for rank, (aid, sid) in enumerate(zip(aids, song_ids), start=1)
+        ]
+    for board, issues in (('vocaloid-daily', DAILY_ISSUES), ('vocaloid-weekly', WEEKLY_ISSUES)):
+        for issue in issues:
+            await conn.execute(insert(Ranking), rankings(board, issue))
+            await update_ranking_links(conn, board, 'main', issue)
+
+    return {'song_id': song_ids[0], 'producer_id': producer_id, 'uploader_id': uploader_id, 'bvid': av2bv(aids[0])}
+
+
+def hot_queries(params: dict):
+    """
+    (名称, 查询) 列表，查询是接收 session 的协程函数
+    """
+    bvid, song_id, uploader_id = params['bvid'], params['song_id'], params['uploader_id']
+    start, end = SNAPSHOT_DATES[0].isoformat(), SNAPSHOT_DATES[-1].isoformat()
+    issue = DAILY_ISSUES[-1]
+    return [
+        ('get_ranking', lambda s: crud.get_ranking('vocaloid-daily', 'main', None, 1, 20, 'score', False, s)),
+        ('get_ranking order by view', lambda s: crud.get_ranking('vocaloid-daily', 'main', DAILY_ISSUES[-1], 2, 20, 'view', False, s)),
+        ('get_ranking cursor', lambda s: crud.get_ranking(
+            'vocaloid-daily', 'main', issue, 1, 20, 'view', False, s,
+            encode_cursor(f'ranking:vocaloid-daily:main:{issue}:view', 100, 0)
+        )),
+        ('get_ranking seperate', lambda s: crud.get_ranking('vocaloid-weekly', 'main', WEEKLY_ISSUES[0], 1, 20, 'score', True, s)),
+        ('get_ranking_display', lambda s: crud.get_ranking_display('vocaloid-daily', 'main', None, 1, 20, 'score', s)),
+        ('get_ranking_display cursor', lambda s: crud.get_ranking_display(
+            'vocaloid-daily', 'main', issue, 1, 20, 'score', s,
+            encode_cursor(f'ranking_display:vocaloid-daily:main:{issue}:score', 100, 0)
+        )),
+        ('get_latest_ranking', lambda s: crud.get_latest_ranking('vocaloid-daily', s)),
+        ('get_ranking_top5', lambda s: crud.get_ranking_top5('vocaloid-daily', 'main', 1, 2, s)),
+        ('get_song', lambda s: crud.get_song(song_id, s)),
+        ('get_song json', lambda s: crud.get_song(song_id, s, 'json')),
+        ('get_song_ranking', lambda s: crud.get_song_ranking(song_id, 'vocaloid-daily', 1, 20, s)),
+        ('get_artist_songs cursor', lambda s: crud.get_artist_songs(
+            'producer', params['producer_id'], 1, 20, s, encode_cursor('artist_songs', song_id)
+        )),
+        ('get_artist_songs json', lambda s: crud.get_artist_songs('producer', params['producer_id'], 1, 20, s, loader='json')),
+        ('get_song_by_artist uploader', lambda s: crud.get_song_by_artist('uploader', uploader_id, 1, 20, s)),
+        ('get_song_by_achievement', lambda s: crud.get_song_by_achievement('view', 1, 1, 20, s)),
+        ('get_video', lambda s: crud.get_video(bvid, s)),
+        ('get_song_snapshot', lambda s: crud.get_song_snapshot(bvid, 1, 20, s)),
+        ('get_song_snapshot cursor', lambda s: crud.get_song_snapshot(
+            bvid, 1, 2, s, encode_cursor('snapshot', SNAPSHOT_DATES[-2])
+        )),
+        ('get_video_snapshot_by_date', lambda s: crud.get_video_snapshot_by_date(bvid, start, end, s)),
+    ]
+
+
+def seq_scans(plan: dict) -> list[str]:
+    """
+    执行计划中所有顺序扫描的表
+    """
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def main() -> int:
+    captured: list[tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    failures = 0
+    async with engine.connect() as conn:
+        await conn.begin()
+        try:
+            params = await seed(conn)
+            driver_conn = (await conn.get_raw_connection()).driver_connection
+            await driver_conn.execute('SET LOCAL enable_seqscan = off')
+
+            session = AsyncSession(bind=conn)
+            for name, query in hot_queries(params):
+                captured.clear()
+                event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+                try:
+                    await query(session)
+                finally:
+                    event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+                problems = []
+                for statement, parameters in captured:
+                    explain = await driver_conn.fetchval(f'EXPLAIN (FORMAT JSON) {statement}', *(parameters or ()))
+                    # SQLAlchemy 给 asyncpg 注册了 json 的解码，结果可能已经是列表
+                    if isinstance(explain, str):
+                        explain = json.loads(explain)
+                    tables = seq_scans(explain[0]['Plan'])
+                    if tables:
+                        problems.append((statement, tables))
+
+                if problems:
+                    failures += 1
+                    print(f"[失败] {name}")
+                    for statement, tables in problems:
+                        print(f"    顺序扫描 {', '.join(tables)}：")
+                        print('        ' + ' '.join(statement.split()))
+                else:
+                    print(f"[通过] {name}（{len(captured)} 条 SQL）")
+        finally:
+            await conn.rollback()
+
+    print(f"共 {len(hot_queries(params))} 个查询，{failures} 个出现顺序扫描")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
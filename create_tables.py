@@ -1,6 +1,8 @@
 import asyncio
 from app.session import engine
 from app.models import Base
+from app.crud.partition import ensure_snapshot_partitions, next_month
+from datetime import date
 import asyncio
 import sys
 
@@ -10,6 +12,9 @@ if sys.platform == "win32":
 async def init_models():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # snapshot 是分区表，先建好当月和下个月的分区，更早的分区导入时会自动创建
+        today = date.today()
+        await ensure_snapshot_partitions(conn, today, next_month(today))
 
 if __name__ == "__main__":
     asyncio.run(init_models())
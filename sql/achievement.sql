@@ -1,9 +1,9 @@
 select
 	v.title, song.name, s.item
 from video v
-join (select bvid, max(view) as item
+join (select aid, max(view) as item
 	from snapshot
-	group by bvid) as s using (bvid)
+	group by aid) as s using (aid)
 join song on song.id = v.song_id
 order by item desc
 offset 20
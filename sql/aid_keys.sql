@@ -0,0 +1,35 @@
+-- snapshot 和 ranking 改用整数 aid 关联视频，bvid 只留在 video 上用来显示
+-- aid 由 bvid 算出，和 abv_py.bv2av 一致
+
+begin;
+
+create function pg_temp.bv2av(bvid text) returns bigint as $$
+	-- bvid 第 4 位起的 9 个字符按 58 进制读取，读取前要交换 (4, 10) 和 (5, 8) 两对位置
+	select (sum(
+		(strpos('FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf', substr(bvid, p, 1)) - 1)
+		* 58::numeric ^ (9 - i)
+	)::bigint & 2251799813685247) # 23442827791579
+	from unnest(array[10, 8, 6, 7, 5, 9, 4, 11, 12]) with ordinality as t(p, i)
+$$ language sql immutable strict;
+
+-- video 保留 bvid 主键，增加 aid
+alter table video add column aid bigint;
+update video set aid = pg_temp.bv2av(bvid);
+alter table video alter column aid set not null;
+alter table video add constraint video_aid_key unique (aid);
+
+-- snapshot 直接把 bvid 列换成 aid，整表只重写一次，主键随之重建为 (aid, date)
+alter table snapshot alter column bvid type bigint using pg_temp.bv2av(bvid);
+alter table snapshot rename column bvid to aid;
+
+-- ranking 同理，以前用 sql/create_ranking.sql 建的表上可能还有指向 video 的外键
+alter table ranking drop constraint if exists ranking_bvid_fkey;
+alter table ranking alter column bvid type bigint using pg_temp.bv2av(bvid);
+alter table ranking rename column bvid to aid;
+alter index if exists ix_public_ranking_bvid rename to ix_public_ranking_aid;
+
+commit;
+
+analyze video;
+analyze snapshot;
+analyze ranking;
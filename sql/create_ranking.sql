@@ -1,12 +1,12 @@
 drop table ranking;
 create table ranking (
 	id serial primary key,
-	board varchar(20),
-	part varchar(20),
+	board smallint,
+	part smallint,
 	issue smallint,
 	rank int,
 	song_id int references song,
-	bvid varchar(12) references video,
+	aid bigint references video(aid),
 	count smallint,
 	point int,
 	view int,
@@ -16,10 +16,10 @@ create table ranking (
 	view_rank int,
 	favorite_rank int,
 	coin_rank int,
-	like_rank int
+	like_rank int,
+	last_id int,
+	seperates int[]
 );
-create index idx_ranking_board_part on ranking(board, part);
-create index idx_ranking_issue on ranking(issue);
-create index idx_ranking_rank on ranking(rank);
-create index idx_ranking_song_id on ranking(song_id);
-
+create index idx_ranking_board_part_issue_rank on ranking(board, part, issue, rank);
+create index idx_ranking_song_board_part_issue on ranking(song_id, board, part, issue);
+create index idx_ranking_aid on ranking(aid);
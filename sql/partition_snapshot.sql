@@ -0,0 +1,41 @@
+-- 把已有的 snapshot 表改成按月分区的表
+-- 旧表先改名保留，数据按月复制进新的分区表，确认无误后再删掉旧表
+
+begin;
+
+alter table snapshot rename to snapshot_old;
+alter index snapshot_pkey rename to snapshot_old_pkey;
+
+create table snapshot (
+	bvid varchar not null,
+	date date not null,
+	view int not null,
+	favorite int not null,
+	coin int not null,
+	"like" int not null,
+	primary key (bvid, date)
+) partition by range (date);
+
+-- 覆盖已有数据的每个月建一个分区，命名和 app/crud/partition.py 一致
+do $$
+declare
+	m date;
+begin
+	for m in
+		select generate_series(date_trunc('month', min(date)), date_trunc('month', max(date)), interval '1 month')::date
+		from snapshot_old
+	loop
+		execute format(
+			'create table if not exists %I partition of snapshot for values from (%L) to (%L)',
+			'snapshot_' || to_char(m, 'YYYYMM'), m, (m + interval '1 month')::date
+		);
+	end loop;
+end $$;
+
+insert into snapshot select bvid, date, view, favorite, coin, "like" from snapshot_old;
+
+commit;
+
+analyze snapshot;
+
+-- drop table snapshot_old;
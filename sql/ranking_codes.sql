@@ -0,0 +1,19 @@
+-- ranking.board 和 ranking.part 改存 smallint 编号，编号和 app/models.py 中的 BOARD_CODES、PART_CODES 一致
+-- 遇到不认识的取值会变成 null，not null 约束会让整个迁移失败，不会悄悄丢数据
+
+begin;
+
+alter table ranking alter column board type smallint using case board
+	when 'vocaloid-daily' then 1
+	when 'vocaloid-weekly' then 2
+	when 'vocaloid-monthly' then 3
+end;
+
+alter table ranking alter column part type smallint using case part
+	when 'main' then 1
+	when 'new' then 2
+end;
+
+commit;
+
+analyze ranking;
@@ -0,0 +1,37 @@
+-- 排名页面的读模型，由导入和编辑时维护（app/crud/display.py）
+
+create table if not exists ranking_display (
+	id int primary key,
+	board smallint,
+	part smallint,
+	issue smallint,
+	rank int,
+	song_id int,
+	aid bigint,
+	count smallint,
+	point int,
+	view int,
+	favorite int,
+	coin int,
+	"like" int,
+	view_rank int,
+	favorite_rank int,
+	coin_rank int,
+	like_rank int,
+	last_rank int,
+	seperates int[],
+	name text,
+	display_name text,
+	type varchar(4),
+	vocalists text[],
+	producers text[],
+	synthesizers text[],
+	bvid varchar(12),
+	title text,
+	thumbnail text,
+	pubdate timestamp,
+	uploader text
+);
+create index if not exists idx_ranking_display_board_part_issue_rank on ranking_display(board, part, issue, rank);
+
+-- 需要先执行 ranking_links.sql 并填充 last_id、seperates，再调用 /update/rebuild_ranking_display 填充
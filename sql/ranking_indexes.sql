@@ -0,0 +1,21 @@
+-- ranking 的复合索引，和 app/models.py 中 Ranking 的 __table_args__ 一致，另外补上 video 外键列的索引
+-- concurrently 不能放在事务里，逐条执行；建好新索引之后再删掉被覆盖的旧索引
+
+create index concurrently if not exists idx_ranking_board_part_issue_rank on ranking(board, part, issue, rank);
+create index concurrently if not exists idx_ranking_song_board_part_issue on ranking(song_id, board, part, issue);
+-- 歌曲加载视频、按 UP主查歌曲
+create index concurrently if not exists ix_public_video_song_id on video(song_id);
+create index concurrently if not exists ix_public_video_uploader_id on video(uploader_id);
+
+-- (board, part) 是新索引的前缀；issue、rank、song_id 单独的索引不再被查询用到，只会拖慢导入
+drop index concurrently if exists idx_ranking_board_part;
+drop index concurrently if exists ix_public_ranking_issue;
+drop index concurrently if exists ix_public_ranking_rank;
+drop index concurrently if exists ix_public_ranking_song_id;
+-- 以前用 sql/create_ranking.sql 建的表上的同名索引
+drop index concurrently if exists idx_ranking_issue;
+drop index concurrently if exists idx_ranking_rank;
+drop index concurrently if exists idx_ranking_song_id;
+
+analyze ranking;
+analyze video;
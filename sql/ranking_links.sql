@@ -0,0 +1,6 @@
+-- ranking 上导入时计算的上一期排名和分期排名
+
+alter table ranking add column if not exists last_id int;
+alter table ranking add column if not exists seperates int[];
+
+-- 加上字段之后调用 /update/rebuild_ranking_links 填充
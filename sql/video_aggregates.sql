@@ -0,0 +1,34 @@
+-- video 上由导入维护的最新数据和最高播放
+
+alter table video add column if not exists latest_date date;
+alter table video add column if not exists latest_view int;
+alter table video add column if not exists latest_favorite int;
+alter table video add column if not exists latest_coin int;
+alter table video add column if not exists latest_like int;
+alter table video add column if not exists max_view int;
+
+update video v
+set latest_date = l.date,
+	latest_view = l.view,
+	latest_favorite = l.favorite,
+	latest_coin = l.coin,
+	latest_like = l."like",
+	max_view = m.max_view
+from (
+	select distinct on (bvid) bvid, date, view, favorite, coin, "like"
+	from snapshot
+	order by bvid, date desc
+) l
+join (
+	select bvid, max(view) as max_view
+	from snapshot
+	group by bvid
+) m using (bvid)
+where v.bvid = l.bvid;
+
+create index if not exists ix_public_video_latest_date on video(latest_date);
+create index if not exists ix_public_video_latest_view on video(latest_view);
+create index if not exists ix_public_video_latest_favorite on video(latest_favorite);
+create index if not exists ix_public_video_latest_coin on video(latest_coin);
+create index if not exists ix_public_video_latest_like on video(latest_like);
+create index if not exists ix_public_video_max_view on video(max_view);